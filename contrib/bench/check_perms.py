@@ -0,0 +1,105 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Licorn® benchmark - :func:`~licorn.foundations.fsapi.check_perms` throughput
+on a group shared directory.
+
+Generates a synthetic share of ``count`` files (default: 200k, spread over
+directories of 1000 entries) in a temporary directory, then runs the content
+check of a typical group ACL rule twice: a first pass which applies the ACLs,
+and a second one on the (now conforming) tree, which is what most checks
+really are. Both passes are timed with the compiled ACL cache enabled and
+disabled (:data:`~licorn.foundations.fsapi.compiled_acls_max` = 0).
+
+The temporary directory must be on a file-system mounted with ACL support.
+
+Usage: python contrib/bench/check_perms.py [count]
+
+:copyright: 2012 Olivier Cortès <olive@licorn.org>
+:license: GNU GPL version 2
+"""
+
+import sys, os, grp, time, shutil, tempfile
+
+from stat import S_IFREG, S_IFDIR
+
+from licorn.foundations import fsapi
+
+def generate(directory, count, per_dir=1000):
+	""" Create the share contents, one file out of ten being executable. """
+
+	for index in xrange(count):
+		if index % per_dir == 0:
+			subdir = os.path.join(directory, 'dir%06d' % (index / per_dir))
+			os.mkdir(subdir)
+
+		filename = os.path.join(subdir, 'file%06d' % index)
+		open(filename, 'w').close()
+
+		if index % 10 == 0:
+			os.chmod(filename, 0755)
+def share_rule(directory):
+	""" A rule similar to the group shared dirs one, for the current user and
+		its primary group (no need to be root for the benchmark). """
+
+	group = grp.getgrgid(os.getgid()).gr_name
+
+	perm = 'u::rw@UX,g::rw@GX,g:%s:rw@GX,o:---,m:rw@GX' % group
+
+	dir_info = fsapi.FsapiObject(name='bench', path=directory,
+						uid=os.getuid(), gid=os.getgid(),
+						root_dir_perm='u::rwx,g::rwx,g:%s:rwx,o:---,m:rwx' % group,
+						dirs_perm='u::rwx,g::rwx,g:%s:rwx,o:---,m:rwx' % group,
+						files_perm=perm, root_dir_acl=True, content_acl=True)
+
+	return dir_info
+def check(directory, dir_info):
+	""" Check the share contents like `check_full()` does, return the number
+		of entries checked. """
+
+	checked = 0
+
+	for entry, etype in fsapi.minifind(directory, itype=(S_IFREG, S_IFDIR),
+											mindepth=1, yield_type=True):
+		dir_info.path = entry
+
+		for event in fsapi.check_perms(file_type=etype, dir_info=dir_info,
+										batch=True, full_display=False):
+			pass
+
+		checked += 1
+
+	return checked
+def main(args):
+
+	count     = int(args[0]) if args else 200000
+	directory = tempfile.mkdtemp(prefix='licorn-bench-')
+	cache_max = fsapi.compiled_acls_max
+
+	print '%-10s %-12s %10s %12s' % ('cache', 'pass', 'time (s)', 'entries/s')
+
+	try:
+		generate(directory, count)
+		dir_info = share_rule(directory)
+
+		for label, limit in (('disabled', 0), ('enabled', cache_max)):
+			fsapi.compiled_acls_max = limit
+			fsapi.flush_compiled_acls()
+
+			# Reset the contents to posix perms, to get a real "apply" pass.
+			os.system('setfacl -R -b %s' % directory)
+
+			for phase in ('apply', 'conforming'):
+				start    = time.time()
+				checked  = check(directory, dir_info)
+				duration = time.time() - start
+
+				print '%-10s %-12s %10.3f %12.0f' % (label, phase, duration,
+													checked / duration)
+
+	finally:
+		fsapi.compiled_acls_max = cache_max
+		shutil.rmtree(directory)
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Licorn® benchmark - identification latency of local CLI connections.
+
+Compares the two ways `licornd` identifies a local client when it accepts
+a connection:
+
+* TCP: accept on a loopback port, then find the client UID and PID with
+  :func:`~licorn.foundations.process.find_network_client_infos` (reads
+  :file:`/proc/net/tcp`, then walks every :file:`/proc/*/fd`).
+* unix socket: accept on an ``AF_UNIX`` socket, then ask the kernel with
+  :func:`~licorn.foundations.network.peer_credentials`.
+
+To look like a busy server, ``idle`` (default: 200) idle TCP connections are
+kept open during the run (they fill :file:`/proc/net/tcp` and
+:file:`/proc/self/fd`). Times are per accepted connection, from
+``connect()`` to a known peer UID.
+
+Run it as root to give the TCP path the same view of :file:`/proc` the
+daemon has.
+
+Usage: python contrib/bench/local_accept.py [count] [idle]
+
+:copyright: 2012 Olivier Cortès <olive@licorn.org>
+:license: GNU GPL version 2
+"""
+
+import sys, os, time, socket, tempfile, shutil
+
+from licorn.foundations import process, network
+
+def percentile(values, percent):
+	return sorted(values)[min(len(values) - 1, int(len(values) * percent / 100))]
+def bench_tcp(count):
+	server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+	server.bind(('127.0.0.1', 0))
+	server.listen(16)
+
+	port  = server.getsockname()[1]
+	times = []
+
+	for i in xrange(count):
+		start  = time.time()
+		client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		client.connect(('127.0.0.1', port))
+
+		conn, (addr, client_port) = server.accept()
+
+		uid, pid = process.find_network_client_infos(port, client_port,
+														local=True, pid=True)
+		times.append(time.time() - start)
+
+		assert uid == os.getuid()
+		conn.close()
+		client.close()
+
+	server.close()
+	return times
+def bench_unix(count, directory):
+	path   = os.path.join(directory, 'bench.sock')
+	server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	server.bind(path)
+	server.listen(16)
+
+	times = []
+
+	for i in xrange(count):
+		start  = time.time()
+		client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		client.connect(path)
+
+		conn, dummy = server.accept()
+
+		pid, uid, gid = network.peer_credentials(conn)
+		times.append(time.time() - start)
+
+		assert uid == os.getuid()
+		conn.close()
+		client.close()
+
+	server.close()
+	return times
+def main(args):
+
+	count     = int(args[0]) if args else 500
+	idle      = int(args[1]) if len(args) > 1 else 200
+	directory = tempfile.mkdtemp(prefix='licorn-bench-')
+
+	# idle connections, to fill /proc/net/tcp and our fd table.
+	listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	listener.bind(('127.0.0.1', 0))
+	listener.listen(idle + 1)
+	sockets = []
+
+	for i in xrange(idle):
+		client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		client.connect(listener.getsockname())
+		sockets.extend((client, listener.accept()[0]))
+
+	print '%d connections, %d idle TCP connections.' % (count, idle)
+	print '%-12s %10s %10s %10s %10s' % ('transport', 'mean (ms)',
+											'p50 (ms)', 'p99 (ms)', 'max (ms)')
+
+	try:
+		for label, bench in (('TCP', lambda: bench_tcp(count)),
+							('unix', lambda: bench_unix(count, directory))):
+			times = bench()
+
+			print '%-12s %10.3f %10.3f %10.3f %10.3f' % (label,
+					1000.0 * sum(times) / len(times),
+					1000.0 * percentile(times, 50),
+					1000.0 * percentile(times, 99),
+					1000.0 * max(times))
+
+	finally:
+		for sock in sockets:
+			sock.close()
+
+		listener.close()
+		shutil.rmtree(directory)
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
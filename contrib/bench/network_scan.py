@@ -0,0 +1,150 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Licorn® benchmark - LAN discovery with :class:`~licorn.foundations.network.BulkPinger`
+versus one :class:`~licorn.foundations.network.Pinger` per host.
+
+Creates a network namespace connected to the host by a veth pair, gives the
+namespace side ``count`` addresses (default: 500) of a /22, then scans the
+whole /22 (1022 addresses) both ways: the historical one (one Pinger per
+address, run by a pool of ``threads`` threads, like the network workers do)
+and the bulk one (one raw socket, rate-limited). Wall-clock time, number of
+hosts found and open file descriptors are reported.
+
+Must be run as root (raw sockets, namespaces). Everything is cleaned up at
+the end.
+
+Usage: python contrib/bench/network_scan.py [count] [threads] [rate]
+
+:copyright: 2012 Olivier Cortès <olive@licorn.org>
+:license: GNU GPL version 2
+"""
+
+import sys, os, time, subprocess, ipcalc, Queue
+
+from threading import Thread
+
+from licorn.foundations import network, exceptions
+
+NETNS   = 'licorn-bench'
+NETWORK = '10.231.0.0/22'
+HOST_IP = '10.231.3.254'
+
+def run(command):
+	subprocess.check_call(command.split())
+def setup(count):
+	""" Create the namespace, the veth pair and the `count` addresses. """
+
+	run('ip netns add %s' % NETNS)
+	run('ip link add lbench0 type veth peer name lbench1')
+	run('ip link set lbench1 netns %s' % NETNS)
+	run('ip addr add %s/22 dev lbench0' % HOST_IP)
+	run('ip link set lbench0 up')
+	run('ip netns exec %s ip link set lo up' % NETNS)
+	run('ip netns exec %s ip link set lbench1 up' % NETNS)
+
+	addresses = [ str(a) for a in ipcalc.Network(NETWORK) ][1:count + 1]
+
+	for address in addresses:
+		run('ip netns exec %s ip addr add %s/22 dev lbench1' % (NETNS, address))
+
+	return addresses
+def teardown():
+	subprocess.call('ip link del lbench0'.split())
+	subprocess.call(('ip netns del %s' % NETNS).split())
+def flush_arp():
+	subprocess.call('ip neigh flush dev lbench0'.split())
+def all_addresses():
+	return [ str(a) for a in ipcalc.Network(NETWORK)
+					if str(a) != HOST_IP ][1:-1]
+def open_fds():
+	return len(os.listdir('/proc/self/fd'))
+def scan_pingers(addresses, threads):
+	""" One Pinger per address, from a pool of threads. """
+
+	queue = Queue.Queue()
+	found = []
+	fds   = [ 0 ]
+
+	for address in addresses:
+		queue.put(address)
+
+	def worker():
+		while True:
+			try:
+				address = queue.get_nowait()
+
+			except Queue.Empty:
+				return
+
+			try:
+				pinger = network.Pinger(address)
+				pinger.ping()
+
+			except (exceptions.DoesntExistException,
+					exceptions.TimeoutExceededException):
+				pass
+
+			else:
+				found.append(address)
+
+			fds[0] = max(fds[0], open_fds())
+			pinger.reset(1)
+
+	pool = [ Thread(target=worker) for i in range(threads) ]
+
+	for thread in pool:
+		thread.start()
+
+	for thread in pool:
+		thread.join()
+
+	return len(found), fds[0]
+def scan_bulk(addresses, rate):
+	""" One BulkPinger for all addresses, completed by the ARP entries
+		which appeared during the sweep. """
+
+	stale   = network.arp_table()
+	results = network.BulkPinger(addresses, rate=rate).run()
+	fds     = open_fds()
+	arp     = network.arp_table()
+
+	return len([ a for a in addresses
+					if results[a] is not None
+						or (a in arp and stale.get(a) != arp[a]) ]), fds
+def main(args):
+
+	count   = int(args[0]) if args else 500
+	threads = int(args[1]) if len(args) > 1 else 10
+	rate    = int(args[2]) if len(args) > 2 else network.BulkPinger.rate
+
+	if os.getuid() != 0:
+		print 'This benchmark must be run as root.'
+		return 1
+
+	try:
+		setup(count)
+		addresses = all_addresses()
+
+		print 'scanning %d addresses, %d hosts up.' % (len(addresses), count)
+		print '%-26s %10s %8s %10s' % ('method', 'time (s)', 'found', 'max fds')
+
+		for label, scan in (
+				('Pinger x %d threads' % threads,
+					lambda: scan_pingers(addresses, threads)),
+				('BulkPinger @ %d pkt/s' % rate,
+					lambda: scan_bulk(addresses, rate))):
+
+			flush_arp()
+
+			start      = time.time()
+			found, fds = scan()
+			duration   = time.time() - start
+
+			print '%-26s %10.3f %8d %10d' % (label, duration, found, fds)
+
+	finally:
+		teardown()
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
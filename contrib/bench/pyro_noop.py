@@ -0,0 +1,71 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Licorn® benchmark - CommandListener idle CPU and request round-trip.
+
+Measures, on the running local daemon:
+
+* the CPU time (user + system) it consumes while idle, over ``idle``
+  seconds (default: 30), read from :file:`/proc/<pid>/stat`;
+* the round-trip latency of ``count`` (default: 2000) no-op Pyro calls
+  (``LMC.system.noop()``), reported as p50 / p99 / max.
+
+Run it once on a daemon with the polling listener and once with the
+event-driven one to compare them.
+
+Usage: sudo python contrib/bench/pyro_noop.py [count] [idle] [pid_file]
+
+:copyright: 2012 Olivier Cortès <olive@licorn.org>
+:license: GNU GPL version 2
+"""
+
+import sys, os, time
+
+from licorn.core import LMC
+
+def cpu_time(pid):
+	""" user + system CPU time of a process, in seconds. """
+
+	fields = open('/proc/%d/stat' % pid).read().rsplit(')', 1)[1].split()
+
+	# utime and stime are the 14th and 15th fields, counting the pid and
+	# the command name we just cut.
+	return (int(fields[11]) + int(fields[12])) / float(os.sysconf('SC_CLK_TCK'))
+def percentile(values, percent):
+	return values[min(len(values) - 1, int(len(values) * percent / 100))]
+def main(args):
+
+	count    = int(args[0]) if args else 2000
+	idle     = float(args[1]) if len(args) > 1 else 30.0
+	pid_file = args[2] if len(args) > 2 else '/var/run/licornd.pid'
+
+	pid = int(open(pid_file).read().strip())
+
+	LMC.connect()
+
+	# be sure the connection is established before measuring anything.
+	LMC.system.noop()
+
+	print 'measuring idle CPU of licornd (pid %d) for %.0fs…' % (pid, idle)
+
+	start = cpu_time(pid)
+	time.sleep(idle)
+	used  = cpu_time(pid) - start
+
+	print 'idle CPU: %.3fs in %.0fs (%.2f%%)' % (used, idle, 100.0 * used / idle)
+
+	times = []
+
+	for i in xrange(count):
+		start = time.time()
+		LMC.system.noop()
+		times.append(time.time() - start)
+
+	times.sort()
+
+	print 'noop() round-trip over %d calls: p50 %.3fms, p99 %.3fms, max %.3fms' % (
+				count, 1000.0 * percentile(times, 50),
+				1000.0 * percentile(times, 99), 1000.0 * times[-1])
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -0,0 +1,134 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Licorn® benchmark - shadow backend loading.
+
+Generates synthetic passwd / shadow / group / gshadow / extended group files
+of 1k, 10k and 100k entries in a temporary directory, and times the join
+phase of :meth:`~licorn.core.backends.shadow.ShadowBackend.load_Users` and
+:meth:`~licorn.core.backends.shadow.ShadowBackend.load_Groups`, comparing the
+legacy per-entry list scan with the one-pass indexes built by
+:func:`~licorn.foundations.readers.ug_conf_load_dict`.
+
+The legacy scan is quadratic; it is skipped above 10k entries unless
+``--legacy-all`` is given (100k takes tens of minutes).
+
+Usage: python contrib/bench/shadow_load.py [--legacy-all] [size …]
+
+:copyright: 2012 Olivier Cortès <olive@licorn.org>
+:license: GNU GPL version 2
+"""
+
+import sys, os, time, shutil, tempfile
+
+from licorn.foundations import readers
+
+def generate(directory, count):
+	""" Write the synthetic files, return their paths. """
+
+	paths = dict((name, os.path.join(directory, name))
+					for name in ('passwd', 'shadow', 'group',
+									'gshadow', 'group.licorn'))
+
+	with open(paths['passwd'], 'w') as passwd, \
+			open(paths['shadow'], 'w') as shadow:
+		for index in xrange(count):
+			login = 'user%06d' % index
+			uid   = 10000 + index
+			passwd.write('%s:x:%d:%d:User %d,,,:/home/users/%s:/bin/bash\n' % (
+						login, uid, uid, index, login))
+			shadow.write('%s:$6$salt$hash:15400:0:99999:7:::\n' % login)
+
+	with open(paths['group'], 'w') as group, \
+			open(paths['gshadow'], 'w') as gshadow, \
+			open(paths['group.licorn'], 'w') as extended:
+		for index in xrange(count):
+			name = 'group%06d' % index
+			gid  = 10000 + index
+			group.write('%s:x:%d:user%06d\n' % (name, gid, index))
+			gshadow.write('%s:!::user%06d\n' % (name, index))
+			extended.write('%s:Group %d:/etc/skel\n' % (name, index))
+
+	return paths
+def legacy_join(paths):
+	""" The pre-1.6 lookup: scan the secondary lists for each entry. """
+
+	shadow  = readers.ug_conf_load_list(paths['shadow'])
+	extras  = readers.ug_conf_load_list(paths['group.licorn'])
+	gshadow = readers.ug_conf_load_list(paths['gshadow'])
+
+	found = 0
+
+	for entry in readers.ug_conf_load_list(paths['passwd']):
+		for sentry in shadow:
+			if sentry[0] == entry[0]:
+				found += 1
+				break
+
+	for entry in readers.ug_conf_load_list(paths['group']):
+		for extra_entry in extras:
+			if extra_entry[0] == entry[0]:
+				break
+
+		for gshadow_entry in gshadow:
+			if gshadow_entry[0] == entry[0]:
+				found += 1
+				break
+
+	return found
+def indexed_join(paths):
+	""" The current lookup: one pass per file to build the indexes. """
+
+	shadow  = readers.ug_conf_load_dict(paths['shadow'])
+	extras  = readers.ug_conf_load_dict(paths['group.licorn'])
+	gshadow = readers.ug_conf_load_dict(paths['gshadow'])
+
+	found = 0
+
+	for entry in readers.ug_conf_load_list(paths['passwd']):
+		if entry[0] in shadow:
+			found += 1
+
+	for entry in readers.ug_conf_load_list(paths['group']):
+		extras.get(entry[0])
+
+		if entry[0] in gshadow:
+			found += 1
+
+	return found
+def timed(func, *args):
+	start  = time.time()
+	result = func(*args)
+	return time.time() - start, result
+def main(args):
+
+	legacy_all = '--legacy-all' in args
+	sizes      = [ int(a) for a in args if a.isdigit() ] or [ 1000, 10000, 100000 ]
+	directory  = tempfile.mkdtemp(prefix='licorn-bench-')
+
+	print '%8s %12s %12s %14s' % ('entries', 'indexed (s)', 'legacy (s)',
+									'indexed µs/ent')
+
+	try:
+		for count in sizes:
+			paths = generate(directory, count)
+
+			duration, found = timed(indexed_join, paths)
+			assert found == 2 * count
+
+			if count <= 10000 or legacy_all:
+				legacy, found = timed(legacy_join, paths)
+				assert found == 2 * count
+				legacy = '%12.3f' % legacy
+
+			else:
+				legacy = '%12s' % 'skipped'
+
+			print '%8d %12.3f %s %14.2f' % (count, duration, legacy,
+											duration * 1000000.0 / count)
+
+	finally:
+		shutil.rmtree(directory)
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
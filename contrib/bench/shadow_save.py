@@ -0,0 +1,57 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Licorn® benchmark - mass `add user` throughput in the shadow backend.
+
+Connects to the running local daemon, creates ``count`` system users (no
+home, no skel, to measure the backend and not the file-system), then deletes
+them, and prints the throughput of both phases.
+
+To compare the write-coalescing save path with the legacy one, run it once
+with the default configuration, then once with::
+
+	backends.shadow.save_delay = 0
+
+in :file:`/etc/licorn/licorn.conf` (and a daemon restart).
+
+Usage: sudo python contrib/bench/shadow_save.py [count]
+
+:copyright: 2012 Olivier Cortès <olive@licorn.org>
+:license: GNU GPL version 2
+"""
+
+import sys, time
+
+from licorn.core import LMC
+
+def users(method_name, *args, **kwargs):
+	return LMC.rwi.generic_controller_method_call('users',
+											method_name, *args, **kwargs)
+def main(args):
+
+	count = int(args[0]) if args else 1000
+
+	LMC.connect()
+
+	logins = [ 'bench%06d' % index for index in xrange(count) ]
+
+	start = time.time()
+
+	for login in logins:
+		users('add_User', login=login, system=True,
+								disabled_password=True, batch=True)
+
+	added = time.time() - start
+	uids  = [ users('login_to_uid', login) for login in logins ]
+	start = time.time()
+
+	for uid in uids:
+		users('del_User', uid, no_archive=True, batch=True)
+
+	deleted = time.time() - start
+
+	print '%d users added in %.2fs (%.1f/s), deleted in %.2fs (%.1f/s).' % (
+				count, added, count / added, deleted, count / deleted)
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
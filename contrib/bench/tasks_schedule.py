@@ -0,0 +1,123 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Licorn® benchmark - tasks next occurrences computation and lookup.
+
+Creates ``count`` synthetic tasks (default: 10k) with recurrences similar to
+extinction and backup tasks (fixed hours and minutes, on some week days),
+then measures:
+
+* the first scheduling of all tasks (what a daemon start or a
+  :meth:`~licorn.core.tasks.TasksController.reload` does);
+* ``runs`` successive reschedulings of each task (what happens after each
+  run), by rebuilding the ``rrule`` every time like before, and with the
+  :class:`~licorn.core.tasks.Occurrences` cache;
+* the “what runs in the next hour” query, by looking at every task, and
+  with the :class:`~licorn.core.tasks.ScheduleIndex`.
+
+Usage: python contrib/bench/tasks_schedule.py [count [runs]]
+
+:copyright: 2012 Olivier Cortès <olive@licorn.org>
+:license: GNU GPL version 2
+"""
+
+import sys, time
+
+from datetime import datetime, timedelta
+
+from licorn.core.tasks import Task, Occurrences, ScheduleIndex
+
+class SyntheticTask(object):
+	""" Only what :meth:`Task.get_running_dates` needs. """
+
+	get_running_dates = Task.__dict__['get_running_dates']
+
+	def __init__(self, index):
+		self.id     = index
+		self.year   = '*'
+		self.month  = '*'
+		self.day    = '*'
+		self.hour   = str(index % 24)
+		self.minute = str(index * 7 % 60)
+		self.second = '0'
+
+		# extinction tasks on working days, backups every day.
+		self.week_day = '0,1,2,3,4' if index % 2 else None
+
+		self.delay_until_year   = None
+		self.delay_until_month  = None
+		self.delay_until_day    = None
+		self.delay_until_hour   = None
+		self.delay_until_minute = None
+		self.delay_until_second = None
+
+		self.neg_to_exclude = []
+
+		self.occurrences = Occurrences(self.get_running_dates)
+def from_scratch(task, now):
+	""" What :meth:`Task.get_next_running_date` did before the cache. """
+	for date in task.get_running_dates(now=now):
+		if date > now:
+			return date
+def timed(label, count, func):
+	start    = time.time()
+	result   = func()
+	duration = time.time() - start
+
+	print '%-36s %10.3f %12.0f' % (label, duration, count / duration)
+
+	return result
+def main(args):
+
+	count = int(args[0]) if len(args) > 0 else 10000
+	runs  = int(args[1]) if len(args) > 1 else 10
+	now   = datetime.now()
+	tasks = [ SyntheticTask(index) for index in xrange(count) ]
+
+	print '%-36s %10s %12s' % ('operation', 'time (s)', 'ops/s')
+
+	def reschedule(next_date):
+		for task in tasks:
+			date = next_date(task, now)
+
+			for run in xrange(runs):
+				date = next_date(task, date)
+
+	timed('first schedule, rrule rebuilt', count,
+		lambda: [ from_scratch(task, now) for task in tasks ])
+
+	timed('first schedule, compiled', count,
+		lambda: [ task.occurrences.next(now) for task in tasks ])
+
+	timed('%d reschedules, rrule rebuilt' % runs, count * runs,
+		lambda: reschedule(from_scratch))
+
+	timed('%d reschedules, compiled' % runs, count * runs,
+		lambda: reschedule(lambda task, date: task.occurrences.next(date)))
+
+	# the index is filled like the controller does, after each schedule.
+	index = ScheduleIndex()
+	dates = {}
+
+	for task in tasks:
+		task.occurrences = Occurrences(task.get_running_dates)
+		dates[task.id] = task.occurrences.next(now)
+		index.update(task.id, dates[task.id])
+
+	hour    = now + timedelta(hours=1)
+	queries = 1000
+
+	scanned = timed('next hour, scanning all tasks', queries,
+		lambda: [ sorted(task.id for task in tasks
+							if now <= dates[task.id] <= hour)
+				for query in xrange(queries) ])
+
+	indexed = timed('next hour, indexed', queries,
+		lambda: [ index.between(now, hour) for query in xrange(queries) ])
+
+	assert sorted(indexed[0]) == scanned[0]
+
+	print '%d tasks run in the next hour.' % len(indexed[0])
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -13,7 +13,8 @@ The Core API of a Licorn system.
 # We need version here, to be able to do `from licorn.core import LMC, version`
 from licorn.version import version
 
-import os, sys, time, signal, Pyro.core, Pyro.configuration
+import os, sys, time, signal, socket, Pyro.core, Pyro.configuration
+import Pyro.protocol, Pyro.constants, Pyro.errors
 from threading import Timer
 
 from licorn.foundations.threads   import RLock
@@ -40,6 +41,71 @@ def connect_error(dummy1, dummy2):
 		u'probably a problem with it. Please check the log for errors or '
 		u'contact your system administrator if it is not you. Else you '
 		u'already know you are in trouble ;-)').format(timeout), 911)
+class UnixPYROAdapter(Pyro.protocol.PYROAdapter):
+	""" A Pyro protocol adapter which connects to the local daemon via its
+		unix socket (see :ref:`pyro.socket <settings.pyro.socket.en>`)
+		instead of the TCP port of the URI. The rest of the protocol is
+		unchanged. The daemon identifies us through the socket, which is a
+		lot faster than finding our TCP connection in :file:`/proc`.
+	"""
+	def __init__(self, socket_path):
+		Pyro.protocol.PYROAdapter.__init__(self)
+		self.socket_path = socket_path
+	def bindToURI(self, URI):
+		""" Same as :meth:`PYROAdapter.bindToURI`, on an ``AF_UNIX`` socket. """
+
+		with self.lock:
+			self.URI = URI.clone()
+
+			try:
+				sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+				sock.connect(self.socket_path)
+
+				conn = Pyro.protocol.TCPConnection(sock, ('unix', os.getpid()))
+
+				try:
+					challenge = self.recvAuthChallenge(conn)
+
+				except Pyro.errors.ProtocolError, e:
+					if hasattr(e, 'partialMsg') \
+						and e.partialMsg[:len(self.denyMSG)] == self.denyMSG:
+						raise Pyro.errors.ConnectionDeniedError(
+							Pyro.constants.deniedReasons[int(e.partialMsg[-1])])
+					raise
+
+				msg = self._sendConnect(sock,
+						self.newConnValidator.createAuthToken(self.ident,
+									challenge, conn.addr, self.URI, None))
+
+				if msg == self.acceptMSG:
+					self.conn           = conn
+					self.conn.connected = 1
+
+					if URI.protocol == 'PYROLOC':
+						self.resolvePYROLOC_URI('PYRO')
+
+				elif msg[:len(self.denyMSG)] == self.denyMSG:
+					try:
+						raise Pyro.errors.ConnectionDeniedError(
+									Pyro.constants.deniedReasons[int(msg[-1])])
+
+					except (KeyError, ValueError):
+						raise Pyro.errors.ConnectionDeniedError(
+														'invalid response')
+
+			except socket.error:
+				raise Pyro.errors.ProtocolError('connection failed')
+def local_proxy(pyroloc):
+	""" Return an attribute proxy for a `PYROLOC` URI of the local daemon,
+		which connects through the unix socket if the daemon has one. """
+
+	proxy = Pyro.core.getAttrProxyForURI(pyroloc)
+
+	if settings.pyro.socket and os.path.exists(settings.pyro.socket):
+		# don't go through the proxy's __setattr__(), it's remote.
+		proxy.__dict__['adapter'] = UnixPYROAdapter(settings.pyro.socket)
+
+	return proxy
 def start_message_thread():
 	global msgth
 
@@ -449,7 +515,11 @@ class LicornMasterController(MixedDictObject):
 			start_message_thread()
 
 			#print '>> SYSTEM', sys_pyroloc, 'LMC', self.name, self._master
-			self.system = Pyro.core.getAttrProxyForURI(sys_pyroloc + '/system')
+			if sys_pyroloc.startswith('PYROLOC://127.0.0.1:'):
+				self.system = local_proxy(sys_pyroloc + '/system')
+
+			else:
+				self.system = Pyro.core.getAttrProxyForURI(sys_pyroloc + '/system')
 
 			# Set a timeout for establishing the connection.
 			# On a loaded daemon which is in the process of
@@ -549,7 +619,11 @@ class LicornMasterController(MixedDictObject):
 				rwi_pyroloc = 'PYROLOC://{0}:{1}'.format(host, port)
 
 			#print '>>    RWI', rwi_pyroloc, 'LMC', self.name, self._master
-			self.rwi = Pyro.core.getAttrProxyForURI(rwi_pyroloc + '/rwi')
+			if rwi_pyroloc.startswith('PYROLOC://127.0.0.1:'):
+				self.rwi = local_proxy(rwi_pyroloc + '/rwi')
+
+			else:
+				self.rwi = Pyro.core.getAttrProxyForURI(rwi_pyroloc + '/rwi')
 
 			if settings.role != roles.CLIENT:
 				self.rwi._setTimeout(timeout)
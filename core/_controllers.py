@@ -16,7 +16,7 @@ from threading import current_thread
 
 
 from licorn.foundations           import settings, exceptions, logging
-from licorn.foundations           import fsapi, events
+from licorn.foundations           import fsapi, events, pyutils
 from licorn.foundations.threads   import RLock
 from licorn.foundations.styles    import *
 from licorn.foundations.ltrace    import *
@@ -391,6 +391,10 @@ class CoreFSController(CoreController):
 														self._rules_base_conf)
 
 		CoreController.reload(self)
+
+		# ACLs compiled from the previous rules (or users and groups
+		# names) may resolve differently now.
+		fsapi.flush_compiled_acls()
 	def load_system_rules(self, vars_to_replace):
 		""" load system rules """
 		# if system rules have already been loaded, do not reload them.
@@ -723,4 +727,69 @@ class CoreFSController(CoreController):
 
 		#assert ltrace_locks(self.lock)
 
-__all__ = ('SelectableController', 'LockedController', 'CoreController', 'CoreFSController')
+class IdAllocatingController(object):
+	""" Mixin for the controllers which index their objects on identifiers
+		taken from ranges (UIDs and GIDs). It keeps one
+		:class:`~licorn.foundations.pyutils.IdAllocator` per range, created
+		on first use and then kept up-to-date when objects are stored or
+		deleted, so that finding a free identifier doesn't need to sort and
+		scan all keys at every addition (see :func:`~licorn.foundations.pyutils.next_free`).
+
+		Deleting an object, or storing one under an identifier which
+		belonged to another, also forgets the ACLs compiled by
+		:func:`~licorn.foundations.fsapi.compiled_acl`: they hold the
+		identifiers the names resolved to, which may have changed (deleted
+		or re-created user or group, reused GID…). Storing a new object
+		under a free identifier doesn't, its name couldn't resolve before:
+		mass imports keep the cache.
+
+		It must come before the :class:`LockedController` in the bases of
+		the controller class.
+
+		.. versionadded:: 1.6.1
+	"""
+
+	#: (start, end) -> IdAllocator; created by _free_id().
+	_id_allocators = None
+
+	def _free_id(self, start, end):
+		""" Return the smallest unused identifier in [`start`, `end`]. """
+
+		with self.lock:
+			if self._id_allocators is None:
+				self._id_allocators = {}
+
+			try:
+				allocator = self._id_allocators[(start, end)]
+
+			except KeyError:
+				# the range changed in the configuration, or this is the
+				# first addition in it since the daemon started.
+				allocator = pyutils.IdAllocator(start, end, self.keys())
+				self._id_allocators[(start, end)] = allocator
+
+			return allocator.first_free()
+	def __setitem__(self, key, value):
+		with self.lock:
+			previous = dict.get(self, key)
+
+			super(IdAllocatingController, self).__setitem__(key, value)
+
+			if self._id_allocators:
+				for allocator in self._id_allocators.itervalues():
+					allocator.use(key)
+
+			if previous is not None and previous is not value:
+				fsapi.flush_compiled_acls()
+	def __delitem__(self, key):
+		with self.lock:
+			super(IdAllocatingController, self).__delitem__(key)
+
+			if self._id_allocators:
+				for allocator in self._id_allocators.itervalues():
+					allocator.release(key)
+
+			fsapi.flush_compiled_acls()
+
+__all__ = ('SelectableController', 'LockedController', 'CoreController',
+			'CoreFSController', 'IdAllocatingController')
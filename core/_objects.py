@@ -14,6 +14,8 @@ Basic objects used in all core controllers.
 
 import os, weakref, time, pyinotify, errno
 
+from collections import OrderedDict
+
 from licorn.foundations.threads import RLock, Event
 
 from licorn.foundations           import settings, exceptions, logging
@@ -27,6 +29,7 @@ from licorn.foundations.classes   import PicklableObject
 from licorn.foundations.constants import priorities
 
 from licorn.core                  import LMC
+from licorn.daemon.threads        import timer_service
 
 def exclude_filter_func(path):
 	""" Return True if a path is within one that is excluded system-wide.
@@ -169,6 +172,8 @@ class CoreFSUnitObject(object):
 	_lpickle_ = {
 		'to_drop': [
 				'_CoreFSUnitObject__expiry_lock',
+				'_CoreFSUnitObject__pending_lock',
+				'_CoreFSUnitObject__pending_timer',
 			]
 		}
 
@@ -186,11 +191,20 @@ class CoreFSUnitObject(object):
 		self.__last_msg_time = time.time()
 
 		# expiry system for internal fast checks, to avoid doing them over and
-		# over, when massive changes occur in the shared dirs.
-		self.__last_fast_check = {}
+		# over, when massive changes occur in the shared dirs. Paths are
+		# kept in check time order, the oldest first.
+		self.__last_fast_check = OrderedDict()
 		self.__expire_time     = 10.0
 		self.__expiry_lock     = RLock()
 
+		# fast checks wanted by inotifier events and re-walks, coalesced
+		# during `licornd.inotifier.coalesce_delay` before beiing run.
+		# `path: (expiry_check, subtree)`, in arrival order.
+		self.__pending_checks  = OrderedDict()
+		self.__pending_dirs    = {}
+		self.__pending_timer   = None
+		self.__pending_lock    = RLock()
+
 		# __load_rules() parameters.
 		self.__check_file      = kwargs.pop('check_file')
 		self.__object_info     = kwargs.pop('object_info')
@@ -214,6 +228,19 @@ class CoreFSUnitObject(object):
 		except AttributeError:
 			return self.__load_check_rules()
 	@property
+	def check_state(self):
+		""" The :class:`~licorn.foundations.fsapi.CheckState` of the last
+			batch check of our home directory contents. """
+		try:
+			return self.__check_state
+
+		except AttributeError:
+			self.__check_state = fsapi.CheckState(os.path.join(
+									settings.core.checks.state_dir,
+									'%s.%s' % (self.controller.name,
+												self.name)))
+			return self.__check_state
+	@property
 	def watches(self):
 		return self.__watches
 
@@ -339,11 +366,16 @@ class CoreFSUnitObject(object):
 
 		mask = event.mask
 
+		# nobody wants any inotifier message if not at the lowest level:
+		# don't build their arguments for each event.
+		traced = logging.monitoring(TRACE_INOTIFIER)
+
 		if mask & pyinotify.IN_IGNORED:
 			# don't display this one, it floods the output too much and breaks
 			# the network connection.
-			logging.monitor(TRACE_INOTIFIER, TRACELEVEL_4,
-				'{0}: ignored {1}', (ST_NAME, self.name), event)
+			if traced:
+				logging.monitor(TRACE_INOTIFIER, TRACELEVEL_4,
+					'{0}: ignored {1}', (ST_NAME, self.name), event)
 			return
 
 		# treat deletes and outboud moves first.
@@ -352,10 +384,11 @@ class CoreFSUnitObject(object):
 			# if it is a DELETE_SELF, only the dir watch will be removed;
 			# if it is a MOVED, all sub-watches must be removed.
 
-			logging.monitor(TRACE_INOTIFIER, TRACELEVEL_2,
-							'{0}: unwatch deleted/moved directory {1}',
-								(ST_NAME, self.name),
-								(ST_PATH, event.pathname))
+			if traced:
+				logging.monitor(TRACE_INOTIFIER, TRACELEVEL_2,
+								'{0}: unwatch deleted/moved directory {1}',
+									(ST_NAME, self.name),
+									(ST_PATH, event.pathname))
 			self.__unwatch_directory(event.pathname,
 							deleted=(mask & pyinotify.IN_DELETE_SELF))
 			return
@@ -367,9 +400,10 @@ class CoreFSUnitObject(object):
 			with self.lock:
 				try:
 					self.__check_expected.remove(event.pathname)
-					logging.monitor(TRACE_INOTIFIER, TRACELEVEL_3,
-						'{0}: skipped expected event {1}',
-							(ST_NAME, self.name), event)
+					if traced:
+						logging.monitor(TRACE_INOTIFIER, TRACELEVEL_3,
+							'{0}: skipped expected event {1}',
+								(ST_NAME, self.name), event)
 
 				except KeyError:
 					pass
@@ -407,54 +441,62 @@ class CoreFSUnitObject(object):
 				# perfectly sequential.
 
 				if event.pathname not in self.__watches:
-					logging.monitor(TRACE_INOTIFIER, TRACELEVEL_2,
-									'{0}: watch new dir {1}',
-										(ST_NAME, self.name),
-										(ST_PATH, event.pathname))
+					if traced:
+						logging.monitor(TRACE_INOTIFIER, TRACELEVEL_2,
+										'{0}: watch new dir {1}',
+											(ST_NAME, self.name),
+											(ST_PATH, event.pathname))
 					self.__watch_directory(event.pathname)
 
-				logging.monitor(TRACE_INOTIFIER, TRACELEVEL_1,
-								'{0}: rewalk dir {1}',
-									(ST_NAME, self.name),
-									(ST_PATH, event.pathname))
+				if traced:
+					logging.monitor(TRACE_INOTIFIER, TRACELEVEL_1,
+									'{0}: rewalk dir {1}',
+										(ST_NAME, self.name),
+										(ST_PATH, event.pathname))
 				self.__rewalk_directory(event.pathname)
 
 			elif mask & pyinotify.IN_ATTRIB:
-				logging.monitor(TRACE_INOTIFIER, TRACELEVEL_1,
-								'{0}: fast-chk dir {1} (expiry={2})',
-									(ST_NAME, self.name),
-									(ST_PATH, event.pathname),
-									(ST_VALUE, expiry_check))
+				if traced:
+					logging.monitor(TRACE_INOTIFIER, TRACELEVEL_1,
+									'{0}: fast-chk dir {1}',
+										(ST_NAME, self.name),
+										(ST_PATH, event.pathname))
 
-				self._fast_aclcheck(event.pathname)
+				self.__coalesce_check(event.pathname)
 
 			else:
-				logging.monitor(TRACE_INOTIFIER, TRACELEVEL_4,
-								'{0}: useless dir event {1}',
-								(ST_NAME, self.name), event)
+				if traced:
+					logging.monitor(TRACE_INOTIFIER, TRACELEVEL_4,
+									'{0}: useless dir event {1}',
+									(ST_NAME, self.name), event)
 
 		else:
 			if mask & pyinotify.IN_ATTRIB \
 					or mask & pyinotify.IN_CREATE \
 					or mask & pyinotify.IN_MOVED_TO:
-				logging.monitor(TRACE_INOTIFIER, TRACELEVEL_1,
-								'{0}: fast-chk file {1}',
-									(ST_NAME, self.name),
-									(ST_PATH, event.pathname))
-				self._fast_aclcheck(event.pathname)
+				if traced:
+					logging.monitor(TRACE_INOTIFIER, TRACELEVEL_1,
+									'{0}: fast-chk file {1}',
+										(ST_NAME, self.name),
+										(ST_PATH, event.pathname))
+				self.__coalesce_check(event.pathname)
 
 			else:
-				logging.monitor(TRACE_INOTIFIER, TRACELEVEL_4,
-								'{0}: useless file event {1}',
-									(ST_NAME, self.name), event)
+				if traced:
+					logging.monitor(TRACE_INOTIFIER, TRACELEVEL_4,
+									'{0}: useless file event {1}',
+										(ST_NAME, self.name), event)
 	def __rewalk_directory(self, directory, walk_delay=None):
-		""" TODO. """
+		""" Watch the sub-directories of `directory` that we missed, and check
+			all of its contents (in one coalesced subtree check), except the
+			paths our own previous checks just changed. """
 
 		if walk_delay:
 			time.sleep(walk_delay)
 
+		traced = logging.monitoring(TRACE_INOTIFIER)
+
 		for path, dirs, files in os.walk(directory):
-			# "path" is used at the end of the loop.
 
 			for adir in dirs[:]:
 				full_path_dir = '%s/%s' % (path, adir)
@@ -469,10 +511,11 @@ class CoreFSUnitObject(object):
 					# little and rewalk the directory manually. This will occur
 					# a small set of supplemental _fast_aclcheck(), but it's
 					# really needed to catch everything.
-					logging.monitor(TRACE_INOTIFIER,  TRACELEVEL_2,
-						'{0}: rewalk deleted {1}',
-							(ST_NAME, self.name),
-							(ST_PATH, full_path_dir))
+					if traced:
+						logging.monitor(TRACE_INOTIFIER,  TRACELEVEL_2,
+							'{0}: rewalk deleted {1}',
+								(ST_NAME, self.name),
+								(ST_PATH, full_path_dir))
 					self.__recently_deleted.discard(full_path_dir)
 
 					# wait a little before rewalking, there is a delay when
@@ -482,54 +525,161 @@ class CoreFSUnitObject(object):
 							full_path_dir, walk_delay=0.1)
 
 				if full_path_dir in self.__watches:
-					logging.monitor(TRACE_INOTIFIER,  TRACELEVEL_2,
-						'{0}: already watched {1}',
-							(ST_NAME, self.name),
-							(ST_PATH, full_path_dir))
+					if traced:
+						logging.monitor(TRACE_INOTIFIER,  TRACELEVEL_2,
+							'{0}: already watched {1}',
+								(ST_NAME, self.name),
+								(ST_PATH, full_path_dir))
 					continue
 
-				logging.monitor(TRACE_INOTIFIER,  TRACELEVEL_1,
-									u'{0}: watch/fast-chk missed '
-									u'directory {1} [from {2}]',
-										(ST_NAME, self.name),
-										(ST_PATH, full_path_dir),
-										(ST_PATH, directory))
+				if traced:
+					logging.monitor(TRACE_INOTIFIER,  TRACELEVEL_1,
+										u'{0}: watch missed '
+										u'directory {1} [from {2}]',
+											(ST_NAME, self.name),
+											(ST_PATH, full_path_dir),
+											(ST_PATH, directory))
 
 				self.__watch_directory(full_path_dir)
 
-				workers.aclcheck_enqueue(priorities.NORMAL,
-						self._fast_aclcheck, full_path_dir, expiry_check=True)
+		# The subtree check happens after the coalescing delay, which gives
+		# the process which created the dir enough time to handle its own
+		# work before we try to set a new ACL on it.
+		if traced:
+			logging.monitor(TRACE_INOTIFIER,  TRACELEVEL_1,
+							'{0}: fast-chk subtree {1}',
+							(ST_NAME, self.name), (ST_PATH, directory))
+
+		self.__coalesce_check(directory, expiry_check=True, subtree=True)
+	def __coalesce_check(self, path, expiry_check=False, subtree=False):
+		""" Record that `path` (and all its contents if `subtree` is ``True``)
+			must be fast-checked. Checks are run in one ACL checker job, after
+			`licornd.inotifier.coalesce_delay` seconds:
+
+			- multiple requests for the same path result in one check,
+			- paths under a pending subtree are not recorded,
+			- when more than `licornd.inotifier.coalesce_burst` paths of the
+			  same directory are pending, they are replaced by one subtree
+			  check of the directory,
+			- when more than `licornd.inotifier.coalesce_max` paths are
+			  pending, they are all replaced by a check of the whole home
+			  directory.
+		"""
+
+		home = self.homeDirectory
+
+		with self.__pending_lock:
+			pending = self.__pending_checks
+
+			# already covered by a pending subtree check?
+			parent = path
+			while len(parent) > len(home):
+				parent = os.path.dirname(parent)
+
+				if pending.get(parent, (None, False))[1]:
+					return
+
+			if path in pending:
+				old_expiry, old_subtree = pending[path]
+
+				if old_subtree or not subtree:
+					pending[path] = (old_expiry and expiry_check, old_subtree)
+					return
+
+			if subtree:
+				prefix = path + os.sep
 
-			for afile in files:
-				full_path_file = '%s/%s' % (path, afile)
+				for covered in [ p for p in pending if p.startswith(prefix) ]:
+					self.__forget_pending(covered)
 
-				if full_path_file in self.__check_expected:
-					logging.monitor(TRACE_INOTIFIER,  TRACELEVEL_3,
-									'{0}: expected file {1}',
+				# the subtree itself may have been counted as a path.
+				self.__forget_pending(path)
+
+				pending[path] = (True, True)
+
+			else:
+				pending[path] = (expiry_check, False)
+
+				parent = os.path.dirname(path)
+				count  = self.__pending_dirs.get(parent, 0) + 1
+
+				self.__pending_dirs[parent] = count
+
+				if count >= settings.licornd.inotifier.coalesce_burst \
+											and parent.startswith(home):
+					logging.monitor(TRACE_INOTIFIER, TRACELEVEL_1,
+									'{0}: burst in {1}, collapsed',
 										(ST_NAME, self.name),
-										(ST_PATH, full_path_file))
-					continue
+										(ST_PATH, parent))
+					self.__coalesce_check(parent, subtree=True)
 
+			if len(pending) > settings.licornd.inotifier.coalesce_max:
 				logging.monitor(TRACE_INOTIFIER, TRACELEVEL_1,
-							'{0}: fast-chk missed file {1} [from {2}]',
-								(ST_NAME, self.name),
-								(ST_PATH, full_path_file),
-								(ST_PATH, directory))
+								'{0}: too many pending checks, check {1}',
+									(ST_NAME, self.name),
+									(ST_PATH, home))
+				pending.clear()
+				self.__pending_dirs.clear()
+				pending[home] = (True, True)
+
+			if self.__pending_timer is None:
+				self.__pending_timer = timer_service().schedule(
+									settings.licornd.inotifier.coalesce_delay,
+									workers.aclcheck_enqueue,
+									priorities.NORMAL,
+									self.__run_pending_checks)
+	def __forget_pending(self, path):
+		""" Remove `path` from the pending checks, if it is there. """
+
+		try:
+			expiry_check, subtree = self.__pending_checks.pop(path)
 
-				workers.aclcheck_enqueue(priorities.NORMAL,
-						self._fast_aclcheck, full_path_file, expiry_check=True)
+		except KeyError:
+			return
 
-			# we had to wait a little before checking the main dir, thus we
-			# do it at the end of the loop, this should imply a small but
-			#  sufficient kind of delay. This should have given enough time
-			# to the process which created the dir to handle its own work
-			# before we try to set a new ACL on it.
-			logging.monitor(TRACE_INOTIFIER,  TRACELEVEL_1,
-							'{0}: fast-chk missed directory {1}',
-							(ST_NAME, self.name), (ST_PATH, path))
+		if not subtree:
+			parent = os.path.dirname(path)
+			count  = self.__pending_dirs.get(parent, 1) - 1
+
+			if count > 0:
+				self.__pending_dirs[parent] = count
+
+			else:
+				self.__pending_dirs.pop(parent, None)
+	def __run_pending_checks(self):
+		""" Run the coalesced fast checks (called in an ACL checker thread). """
 
-			workers.aclcheck_enqueue(priorities.NORMAL,
-								self._fast_aclcheck, path, expiry_check=True)
+		with self.__pending_lock:
+			pending = self.__pending_checks
+
+			self.__pending_checks = OrderedDict()
+			self.__pending_dirs   = {}
+			self.__pending_timer  = None
+
+		traced = logging.monitoring(TRACE_INOTIFIER)
+
+		for path, (expiry_check, subtree) in pending.iteritems():
+			try:
+				if subtree:
+					for entry in fsapi.minifind(path):
+						# don't re-check what a previous check just changed,
+						# this would loop on our own inotify events.
+						if entry in self.__check_expected:
+							if traced:
+								logging.monitor(TRACE_INOTIFIER, TRACELEVEL_3,
+												'{0}: expected path {1}',
+													(ST_NAME, self.name),
+													(ST_PATH, entry))
+							continue
+
+						self._fast_aclcheck(entry, expiry_check=True)
+
+				else:
+					self._fast_aclcheck(path, expiry_check=expiry_check)
+
+			except:
+				logging.exception(_(u'{0}: exception while fast-checking {1}'),
+									(ST_NAME, self.name), (ST_PATH, path))
 
 	# This method must not fail on any exception, else the INotifier will
 	# crash and become unusable. Thus just warn if any exception occurs.
@@ -669,6 +819,11 @@ class CoreFSUnitObject(object):
 									object_info=self.__object_info,
 									vars_to_replace=self.__vars_to_replace)
 
+			if event is not None:
+				# the rules file changed: entries checked against the old
+				# rules must be checked again.
+				self.check_state.invalidate()
+
 			return self.__check_rules
 	def reload_check_rules(self, vars_to_replace):
 		""" called from a group, when permissiveness is changed. """
@@ -680,6 +835,8 @@ class CoreFSUnitObject(object):
 									rules_path=self.__check_file,
 									object_info=self.__object_info,
 									vars_to_replace=self.__vars_to_replace)
+
+			self.check_state.invalidate()
 	def _inotifier_del_watch(self, inotifier=None, full=False):
 		""" delete a user/group watch. Called by Controller before deleting.
 			CoreStoredObject. """
@@ -832,10 +989,17 @@ class CoreFSUnitObject(object):
 							length     = 0
 							old_length = 0
 
+						if settings.core.checks.skip_unchanged and not force:
+							state = self.check_state
+
+						else:
+							state = None
+
 						for checked_path in fsapi.check_full(
 											self.check_rules, batch=batch,
 											auto_answer=auto_answer,
-											full_display=full_display):
+											full_display=full_display,
+											state=state):
 
 							checked.add(checked_path)
 
@@ -938,7 +1102,7 @@ class CoreFSUnitObject(object):
 
 				if expiry:
 					# don't check a previously checked file,
-					# if previous check was less than 5 seconds.
+					# if previous check was less than 10 seconds.
 					if time.time() - expiry < self.__expire_time:
 						assert ltrace(TRACE_CHECKS, '  %s._fast_aclcheck: '
 										'not expired %s' % (self.name, path))
@@ -1051,14 +1215,27 @@ class CoreFSUnitObject(object):
 					is_root_dir=(rule_name is ''), full_display=__debug__))
 
 		with self.__expiry_lock:
+			# re-insert, to keep the time order.
+			self.__last_fast_check.pop(path, None)
 			self.__last_fast_check[path] = time.time()
+
+			if len(self.__last_fast_check) > settings.licornd.inotifier.coalesce_max:
+				# forgetting the oldest can only trigger a useless check.
+				self.__last_fast_check.popitem(last=False)
 	def _expire_events(self):
 		""" remove all expired events. """
 
+		limit = time.time() - self.__expire_time
+
 		with self.__expiry_lock:
-			for key, value in self.__last_fast_check.items():
-				if time.time() - value >= self.__expire_time:
-					assert ltrace(TRACE_CHECKS, '  %s: expired %s' % (self.name, key))
-					del self.__last_fast_check[key]
+			# oldest first: stop at the first one which is not expired.
+			while self.__last_fast_check:
+				key, value = next(self.__last_fast_check.iteritems())
+
+				if value > limit:
+					break
+
+				assert ltrace(TRACE_CHECKS, '  %s: expired %s' % (self.name, key))
+				del self.__last_fast_check[key]
 
 __all__ = ('CoreUnitObject', 'CoreStoredObject', 'CoreFSUnitObject')
@@ -25,7 +25,8 @@ from licorn.foundations.styles    import *
 from licorn.foundations.ltrace    import *
 from licorn.foundations.ltraces   import *
 from licorn.foundations.base      import DictSingleton
-from licorn.foundations.constants import priorities
+from licorn.foundations           import logging
+from licorn.foundations.constants import priorities, backend_actions
 from licorn.core                  import LMC
 from licorn.core.classes          import ModulesManager, CoreModule
 from licorn.foundations.events import LicornEvent
@@ -111,8 +112,33 @@ class UsersBackend(NSSBackend):
 		* `load_Users()`
 		* `save_Users(users)`
 
+		and may overload `create_Users(users)`.
 	"""
-	pass
+	def create_Users(self, users):
+		""" Save newly created users, for massive imports. This default
+			version saves them one by one; if one fails, the ones already
+			saved are deleted before the exception is re-raised.
+
+			.. versionadded:: 1.6.1
+		"""
+
+		saved = []
+
+		try:
+			for user in users:
+				self.save_User(user, backend_actions.CREATE)
+				saved.append(user)
+
+		except:
+			for user in saved:
+				try:
+					self.delete_User(user)
+
+				except Exception, e:
+					logging.warning(_(u'{0}: cannot delete {1} while '
+						u'cancelling the batch (was: {2}).').format(
+							self.pretty_name, stylize(ST_LOGIN, user.login), e))
+			raise
 class GroupsBackend(NSSBackend):
 	"""	Abstract groups backend class allowing access to groups data.
 
@@ -60,6 +60,11 @@ class OpenldapBackend(Singleton, UsersBackend, GroupsBackend):
 			self.openldap_conn.unbind_s()
 		except:
 			pass
+
+		try:
+			self.pool.close()
+		except:
+			pass
 	def load_defaults(self):
 		""" Return mandatory defaults needed for LDAP Backend.
 
@@ -200,6 +205,12 @@ class OpenldapBackend(Singleton, UsersBackend, GroupsBackend):
 
 			self.openldap_conn = pyldap.initialize(self.uri)
 
+			# Bound connections for users / groups modifications, which
+			# can thus run in parallel and don't need to bind every time.
+			self.pool = ldaputils.LDAPConnectionPool(self.uri,
+							lambda conn: self.bind(conn=conn),
+							settings.backends.openldap.pool_size)
+
 			self.available = True
 
 		assert ltrace(TRACE_OPENLDAP, '< initialize(%s)' % self.available)
@@ -670,7 +681,7 @@ class OpenldapBackend(Singleton, UsersBackend, GroupsBackend):
 		return True
 
 	# LDAP specific methods
-	def sasl_bind(self):
+	def sasl_bind(self, conn=None):
 		"""
 		Gain superadmin access to the OpenLDAP server.
 		This is far more than simple "cn=admin,*" access.
@@ -678,23 +689,30 @@ class OpenldapBackend(Singleton, UsersBackend, GroupsBackend):
 		the server if needed.
 
 		by the way, fix #133.
+
+		:param conn: the connection to bind, defaults to the main one.
 		"""
 
 		assert ltrace_func(TRACE_OPENLDAP)
 
 		logging.progress(_(u'{0}: binding in EXTERNAL SASL mode.').format(self.pretty_name))
 
-		self.openldap_conn.sasl_interactive_bind_s('', pyldapsasl.external())
-	def bind(self, need_write_access=True):
-		""" Bind as admin or user, when LDAP needs a stronger authentication."""
+		(conn or self.openldap_conn).sasl_interactive_bind_s('', pyldapsasl.external())
+	def bind(self, need_write_access=True, conn=None):
+		""" Bind as admin or user, when LDAP needs a stronger authentication.
 
+			:param conn: the connection to bind, defaults to the main one
+				(the pooled ones are bound with it when created).
+		"""
+
+		conn = conn or self.openldap_conn
 
 		if self.bind_as_admin:
 			try:
 				logging.progress(_(u'{0}: binding as as {1}.').format(
 								self.pretty_name, stylize(ST_LOGIN, self.bind_dn)))
 
-				self.openldap_conn.bind_s(self.bind_dn, self.secret, pyldap.AUTH_SIMPLE)
+				conn.bind_s(self.bind_dn, self.secret, pyldap.AUTH_SIMPLE)
 
 			except pyldap.INVALID_CREDENTIALS:
 				# in rare cases, the error could raise because the LDAP DB is
@@ -702,11 +720,11 @@ class OpenldapBackend(Singleton, UsersBackend, GroupsBackend):
 				# try to bind as root as a last resort, in case we can correct
 				# the problem (we are probably in the first intialization of the
 				# backend, checking for everything).
-				self.sasl_bind()
+				self.sasl_bind(conn)
 		else:
 			if process.whoami() == 'root':
 
-				self.sasl_bind()
+				self.sasl_bind(conn)
 			else:
 				if need_write_access:
 					#
@@ -718,7 +736,7 @@ class OpenldapBackend(Singleton, UsersBackend, GroupsBackend):
 					logging.info(_(u'{0}: binding as as {1}.').format(
 								self.pretty_name, stylize(ST_LOGIN, self.bind_dn)))
 
-					self.openldap_conn.bind_s(self.bind_dn,
+					conn.bind_s(self.bind_dn,
 						getpass.getpass('Please enter your LDAP password: '),
 						pyldap.AUTH_SIMPLE)
 				#else:
@@ -779,13 +797,13 @@ class OpenldapBackend(Singleton, UsersBackend, GroupsBackend):
 		if process.whoami() == 'root':
 			self.bind(False)
 
-		try:
-			openldap_result = self.openldap_conn.search_s(
+		# entries are fetched by pages and users built as they come, to
+		# avoid holding the whole subtree in memory on big directories.
+		openldap_result = ldaputils.paged_search(self.openldap_conn,
 									self.nss_base_shadow,
 									pyldap.SCOPE_SUBTREE,
-									'(objectClass=shadowAccount)')
-		except pyldap.NO_SUCH_OBJECT:
-			return
+									'(objectClass=shadowAccount)',
+									page_size=settings.backends.openldap.page_size)
 
 		try:
 			for dn, entry in openldap_result:
@@ -833,6 +851,9 @@ class OpenldapBackend(Singleton, UsersBackend, GroupsBackend):
 				"""
 
 				#ltrace(TRACE_OPENLDAP, 'userPassword: %s' % temp_user_dict['userPassword'])
+		except pyldap.NO_SUCH_OBJECT:
+			return
+
 		except KeyError:
 			logging.exception(_(u'{0}: skipped account {1}'),
 								self.pretty_name, (ST_NAME, dn))
@@ -845,38 +866,40 @@ class OpenldapBackend(Singleton, UsersBackend, GroupsBackend):
 		assert ltrace_func(TRACE_OPENLDAP)
 		assert ltrace_var(TRACE_OPENLDAP, self.nss_base_group)
 
-		try:
-			openldap_result = self.openldap_conn.search_s(
+		openldap_result = ldaputils.paged_search(self.openldap_conn,
 				self.nss_base_group,
 				pyldap.SCOPE_SUBTREE,
-				'(objectClass=posixGroup)')
-		except pyldap.NO_SUCH_OBJECT:
-			return
+				'(objectClass=posixGroup)',
+				page_size=settings.backends.openldap.page_size)
 
-		for dn, entry in openldap_result:
+		try:
+			for dn, entry in openldap_result:
 
-			assert ltrace(TRACE_OPENLDAP, '  load_group(%s).' % entry)
+				assert ltrace(TRACE_OPENLDAP, '  load_group(%s).' % entry)
 
-			gid  = int(entry['gidNumber'][0])
+				gid  = int(entry['gidNumber'][0])
 
 
-			for key, func in (
-				):
-				if entry.has_key(key):
-					temp_group_dict[key] = func(entry[key][0])
+				for key, func in (
+					):
+					if entry.has_key(key):
+						temp_group_dict[key] = func(entry[key][0])
 
-			yield gid, Group(
-				# Get the cn from the dn here, else we could end in a situation
-				# where the group could not be deleted if it was created manually
-				# and the cn is inconsistent.
-				name=dn.split(',')[0][3:],
-				gidNumber=gid,
-				memberUid=entry.get('memberUid', ()),
-				userPassword=entry.get('userPassword', ('x', ))[0],
-				groupSkel=entry.get('groupSkel', (None, ))[0],
-				description=entry.get('description', ('', ))[0],
-				backend=self
-				)
+				yield gid, Group(
+					# Get the cn from the dn here, else we could end in a situation
+					# where the group could not be deleted if it was created manually
+					# and the cn is inconsistent.
+					name=dn.split(',')[0][3:],
+					gidNumber=gid,
+					memberUid=entry.get('memberUid', ()),
+					userPassword=entry.get('userPassword', ('x', ))[0],
+					groupSkel=entry.get('groupSkel', (None, ))[0],
+					description=entry.get('description', ('', ))[0],
+					backend=self
+					)
+
+		except pyldap.NO_SUCH_OBJECT:
+			return
 
 		assert ltrace_func(TRACE_OPENLDAP, True)
 	def save_Users(self, users):
@@ -950,40 +973,39 @@ class OpenldapBackend(Singleton, UsersBackend, GroupsBackend):
 		user['shadowLastChange'] = orig_user.shadowLastChange
 
 		try:
-			self.bind()
+			with self.pool.connection() as conn:
+				if mode == backend_actions.UPDATE:
 
-			if mode == backend_actions.UPDATE:
-
-				(dn, old_entry) = self.openldap_conn.search_s(
-									self.nss_base_shadow,
-									pyldap.SCOPE_SUBTREE,
-									'(uid=%s)' % orig_user.login)[0]
+					(dn, old_entry) = conn.search_s(
+										self.nss_base_shadow,
+										pyldap.SCOPE_SUBTREE,
+										'(uid=%s)' % orig_user.login)[0]
 
-				assert ltrace(TRACE_OPENLDAP, 'update user %s: %s\n%s' % (
-										stylize(ST_LOGIN, orig_user.login),
-										old_entry,
-										ldaputils.modifyModlist(old_entry, user,
-													ignore_oldexistent=1)))
+					assert ltrace(TRACE_OPENLDAP, 'update user %s: %s\n%s' % (
+											stylize(ST_LOGIN, orig_user.login),
+											old_entry,
+											ldaputils.modifyModlist(old_entry, user,
+														ignore_oldexistent=1)))
 
-				self.openldap_conn.modify_s(dn, ldaputils.modifyModlist(
-										old_entry, user, ignore_oldexistent=1))
+					conn.modify_s(dn, ldaputils.modifyModlist(
+											old_entry, user, ignore_oldexistent=1))
 
-			elif mode == backend_actions.CREATE:
+				elif mode == backend_actions.CREATE:
 
-				# prepare the LDAP entry like the LDAP daemon assumes it will
-				# be : add or change necessary fields.
-				user['objectClass'] = ('inetOrgPerson', 'posixAccount', 'shadowAccount')
+					# prepare the LDAP entry like the LDAP daemon assumes it will
+					# be : add or change necessary fields.
+					user['objectClass'] = ('inetOrgPerson', 'posixAccount', 'shadowAccount')
 
-				assert ltrace(TRACE_OPENLDAP, 'add user %s: %s' % (
-					stylize(ST_LOGIN, orig_user.login),
-					ldaputils.addModlist(user)))
+					assert ltrace(TRACE_OPENLDAP, 'add user %s: %s' % (
+						stylize(ST_LOGIN, orig_user.login),
+						ldaputils.addModlist(user)))
 
-				self.openldap_conn.add_s('uid=%s,%s' % (orig_user.login,
-							self.nss_base_shadow), ldaputils.addModlist(user))
-			else:
-				logging.warning(_(u'{0}: unknown mode {1} for user '
-								u'{2}(uid={3}).').format(self.pretty_name,
-								mode, orig_user.login, orig_user.uid))
+					conn.add_s('uid=%s,%s' % (orig_user.login,
+								self.nss_base_shadow), ldaputils.addModlist(user))
+				else:
+					logging.warning(_(u'{0}: unknown mode {1} for user '
+									u'{2}(uid={3}).').format(self.pretty_name,
+									mode, orig_user.login, orig_user.uid))
 
 		except:
 			logging.warning(_(u'{0}: unable to save user {1}.').format(
@@ -1026,36 +1048,35 @@ class OpenldapBackend(Singleton, UsersBackend, GroupsBackend):
 		#group['memberGid'] = orig_group.memberGid
 
 		try:
-			self.bind()
-
-			if mode == backend_actions.UPDATE:
+			with self.pool.connection() as conn:
+				if mode == backend_actions.UPDATE:
 
-				(dn, old_entry) = self.openldap_conn.search_s(
-									self.nss_base_group,
-									pyldap.SCOPE_SUBTREE,
-									'(cn=%s)' % orig_group.name)[0]
+					(dn, old_entry) = conn.search_s(
+										self.nss_base_group,
+										pyldap.SCOPE_SUBTREE,
+										'(cn=%s)' % orig_group.name)[0]
 
-				assert ltrace(TRACE_OPENLDAP,'updating group %s.' % \
-									stylize(ST_LOGIN, orig_group.name))
+					assert ltrace(TRACE_OPENLDAP,'updating group %s.' % \
+										stylize(ST_LOGIN, orig_group.name))
 
-				self.openldap_conn.modify_s(dn, ldaputils.modifyModlist(
-											old_entry, group,
-											ignore_oldexistent=1))
+					conn.modify_s(dn, ldaputils.modifyModlist(
+												old_entry, group,
+												ignore_oldexistent=1))
 
-			elif mode == backend_actions.CREATE:
+				elif mode == backend_actions.CREATE:
 
-				assert ltrace(TRACE_OPENLDAP,'creating group %s.' % (
-					stylize(ST_LOGIN, orig_group.name)))
+					assert ltrace(TRACE_OPENLDAP,'creating group %s.' % (
+						stylize(ST_LOGIN, orig_group.name)))
 
-				group['objectClass'] = ('posixGroup', 'licornGroup')
+					group['objectClass'] = ('posixGroup', 'licornGroup')
 
-				self.openldap_conn.add_s('cn=%s,%s' % (
-									orig_group.name, self.nss_base_group),
-									ldaputils.addModlist(group))
-			else:
-				logging.warning(_(u'{0}: unknown mode {1} for group '
-								u'{2}(gid={3}).').format(self.pretty_name,
-								mode, orig_group.name, orig_group.gid))
+					conn.add_s('cn=%s,%s' % (
+										orig_group.name, self.nss_base_group),
+										ldaputils.addModlist(group))
+				else:
+					logging.warning(_(u'{0}: unknown mode {1} for group '
+									u'{2}(gid={3}).').format(self.pretty_name,
+									mode, orig_group.name, orig_group.gid))
 
 		except:
 			# there is also e['info'] on ldap.STRONG_AUTH_REQUIRED, but
@@ -1072,9 +1093,9 @@ class OpenldapBackend(Singleton, UsersBackend, GroupsBackend):
 		assert ltrace_func(TRACE_OPENLDAP)
 
 		try:
-			self.bind()
-			self.openldap_conn.delete_s('uid=%s,%s' % (
-										user.login, self.nss_base_shadow))
+			with self.pool.connection() as conn:
+				conn.delete_s('uid=%s,%s' % (
+											user.login, self.nss_base_shadow))
 
 		except pyldap.NO_SUCH_OBJECT:
 			pass
@@ -1090,9 +1111,9 @@ class OpenldapBackend(Singleton, UsersBackend, GroupsBackend):
 		assert ltrace_func(TRACE_OPENLDAP)
 
 		try:
-			self.bind()
-			self.openldap_conn.delete_s('cn=%s,%s' % (
-										group.name, self.nss_base_group))
+			with self.pool.connection() as conn:
+				conn.delete_s('cn=%s,%s' % (
+											group.name, self.nss_base_group))
 
 		except pyldap.NO_SUCH_OBJECT:
 			pass
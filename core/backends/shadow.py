@@ -13,25 +13,44 @@ Licorn Shadow backend - http://docs.licorn.org/core/backends/shadow.html
 
 import os, crypt, tempfile
 
-from threading  import Timer
+from threading  import RLock
 from contextlib import nested
 
 from licorn.foundations           import settings, logging, exceptions
-from licorn.foundations           import readers, hlstr, fsapi
+from licorn.foundations           import readers, hlstr, fsapi, events
 from licorn.foundations.workers   import workers
 from licorn.foundations.styles    import *
 from licorn.foundations.ltrace    import *
 from licorn.foundations.ltraces   import *
 from licorn.foundations.base      import Singleton, BasicCounter
 from licorn.foundations.classes   import FileLock
-from licorn.foundations.constants import priorities
+from licorn.foundations.constants import priorities, backend_actions
 from licorn.core                  import LMC
 from licorn.core.users            import User
 from licorn.core.groups           import Group
 from licorn.core.backends         import NSSBackend, UsersBackend, GroupsBackend
+from licorn.daemon.threads        import timer_service
 
 class ShadowBackend(Singleton, UsersBackend, GroupsBackend):
-	""" A backend to cope with /etc/* UNIX shadow traditionnal files. """
+	""" A backend to cope with /etc/* UNIX shadow traditionnal files.
+
+		Saving individual objects is write-coalesced:
+
+		- a created user or group is appended to the system files at once,
+		  because other tools (Samba, ACL checks…) need it on disk to
+		  operate.
+		- updates and deletions are recorded in an append-only journal
+		  (:obj:`settings.backends.shadow.journal_file`), and the files
+		  are rewritten only once per
+		  :obj:`settings.backends.shadow.save_delay` seconds, whatever the
+		  number of changes in this window. The journal is replayed at
+		  next start if the daemon crashed before the rewrite.
+
+		Setting ``backends.shadow.save_delay`` to ``0`` restores the
+		synchronous, one-rewrite-per-change behaviour.
+
+		.. versionadded:: 1.6.1 the write-coalescing mechanism.
+	"""
 
 	init_ok = False
 
@@ -94,6 +113,18 @@ class ShadowBackend(Singleton, UsersBackend, GroupsBackend):
 		self.__hint_grp = BasicCounter(1)
 		self.__hint_gsh = BasicCounter(1)
 
+		# write-coalescing: kinds of data to rewrite ('users', 'groups'),
+		# the timer service entry which will do it, and the journal of
+		# pending changes.
+		self.__dirty         = set()
+		self.__flush_timer   = None
+		self.__journal_lock  = RLock()
+		self.__journal_path  = settings.backends.shadow.journal_file
+		self.__journal       = None
+
+		# in case we crashed between a change and its flush.
+		self.__replay_journal()
+
 		return self.available
 	def load_User(self, user):
 		assert ltrace_func(TRACE_SHADOW)
@@ -104,10 +135,26 @@ class ShadowBackend(Singleton, UsersBackend, GroupsBackend):
 		return self.load_Users()
 	def save_User(self, user, mode):
 		assert ltrace_func(TRACE_SHADOW)
-		return self.save_Users(LMC.users)
+
+		if mode == backend_actions.CREATE:
+			return self.__append_lines('users', self.__user_lines(user))
+
+		return self.__schedule_save('users',
+						('update', ) + self.__user_lines(user))
+	def create_Users(self, users):
+		""" Append all new users at once: one write per system file,
+			whatever the number of users. """
+
+		assert ltrace_func(TRACE_SHADOW)
+
+		lines = zip(*(self.__user_lines(user) for user in users))
+
+		if lines:
+			return self.__append_lines('users', [ '\n'.join(file_lines)
+												for file_lines in lines ])
 	def delete_User(self, user):
 		assert ltrace_func(TRACE_SHADOW)
-		return self.save_Users(LMC.users)
+		return self.__schedule_save('users', ('delete', user.login))
 	def load_Group(self, group):
 		""" Load an individual group.
 
@@ -145,7 +192,11 @@ class ShadowBackend(Singleton, UsersBackend, GroupsBackend):
 
 		assert ltrace_func(TRACE_SHADOW)
 
-		return self.save_Groups(LMC.groups)
+		if mode == backend_actions.CREATE:
+			return self.__append_lines('groups', self.__group_lines(group))
+
+		return self.__schedule_save('groups',
+						('update', ) + self.__group_lines(group))
 	def delete_Group(self, group):
 		""" Delete an individual group. Default action (coming from abstract
 			:class:`~licorn.core.backends.GroupsBackend`) is to call
@@ -166,18 +217,41 @@ class ShadowBackend(Singleton, UsersBackend, GroupsBackend):
 				version of the method).
 		"""
 		assert ltrace_func(TRACE_SHADOW)
-		return self.save_Groups(LMC.groups)
+		return self.__schedule_save('groups', ('delete', group.name))
 	def load_Users(self):
-		""" Load user accounts from /etc/{passwd,shadow} """
+		""" Load user accounts from /etc/{passwd,shadow}. """
+
+		assert ltrace_func(TRACE_SHADOW)
+
+		for uid, data in self.load_Users_data():
+			yield uid, User(backend=self, **data)
+
+		assert ltrace_func(TRACE_SHADOW, True)
+	def load_Users_data(self):
+		""" Read /etc/{passwd,shadow} and yield ``(uid, data)`` tuples,
+			``data`` being a dict of :class:`~licorn.core.users.User`
+			constructor arguments (without the backend). This is used by
+			:meth:`load_Users` and by the incremental reload of the
+			:class:`~licorn.core.users.UsersController`, which must compare
+			on-disk data with in-memory objects before building any of them.
+
+			:file:`/etc/shadow` is indexed by login in one pass before
+			walking :file:`/etc/passwd`, which keeps the whole load linear
+			in the number of accounts.
+		"""
 
 		assert ltrace_func(TRACE_SHADOW)
 
 		is_allowed = True
 		need_rewriting = False
 
+		# an empty index if we are not allowed to read /etc/shadow: every
+		# account will get a fake entry, which is harmless for a `get`.
+		shadow = {}
+
 		with self.shlock:
 			try:
-				shadow = readers.ug_conf_load_list("/etc/shadow")
+				shadow = readers.ug_conf_load_dict("/etc/shadow")
 			except (OSError, IOError), e:
 				if e.errno == 13:
 					is_allowed = False
@@ -192,27 +266,24 @@ class ShadowBackend(Singleton, UsersBackend, GroupsBackend):
 			login = entry[0]
 			uid   = int(entry[2])
 
-			not_found=True
-
-			for sentry in shadow:
-				if sentry[0] == login:
-					# "sentry" will remain, to be used in the main loop.
-					not_found=False
-					break
+			try:
+				sentry = shadow[login]
 
-			if not_found:
+			except KeyError:
 				# create a fake shadow entry for the load() to work.
 				# this will eventually allow the file to be automatically
 				# corrected on next forced write.
 				sentry = [ login, '', '0', '0', '99999', '7', '', '', '' ]
 
-				logging.warning(_(u'{0}: added missing entry for user {1} '
-					'in {2}.').format(self.pretty_name, stylize(ST_LOGIN, login),
-						stylize(ST_PATH, '/etc/shadow')))
+				if is_allowed:
+					logging.warning(_(u'{0}: added missing entry for user {1} '
+						'in {2}.').format(self.pretty_name,
+							stylize(ST_LOGIN, login),
+							stylize(ST_PATH, '/etc/shadow')))
 
-				need_rewriting = True
+					need_rewriting = True
 
-			yield uid, User(
+			yield uid, dict(
 					uidNumber=uid,
 					login=login,
 					gidNumber=int(entry[3]),
@@ -226,8 +297,7 @@ class ShadowBackend(Singleton, UsersBackend, GroupsBackend):
 					shadowWarning=int(sentry[5]) if sentry[5] != '' else 7,
 					shadowInactive=int(sentry[6]) if sentry[6] != '' else 0,
 					shadowExpire=int(sentry[7]) if sentry[7] != '' else 0,
-					shadowFlag=int(sentry[8]) if sentry[8] != '' else '',
-					backend=self
+					shadowFlag=int(sentry[8]) if sentry[8] != '' else ''
 				)
 
 			assert ltrace(TRACE_SHADOW, 'loaded user %s' % entry[0])
@@ -246,6 +316,23 @@ class ShadowBackend(Singleton, UsersBackend, GroupsBackend):
 
 		assert ltrace_func(TRACE_SHADOW)
 
+		for gid, data in self.load_Groups_data():
+			yield gid, Group(backend=self, **data)
+
+		assert ltrace_func(TRACE_SHADOW, True)
+	def load_Groups_data(self):
+		""" Read /etc/{group,gshadow} and /etc/licorn/group and yield
+			``(gid, data)`` tuples, ``data`` being a dict of
+			:class:`~licorn.core.groups.Group` constructor arguments (without
+			the backend). See :meth:`load_Users_data` for why.
+
+			Like :file:`/etc/shadow`, the extended group file and
+			:file:`/etc/gshadow` are indexed by group name in one pass each,
+			instead of being scanned for every :file:`/etc/group` entry.
+		"""
+
+		assert ltrace_func(TRACE_SHADOW)
+
 		with self.grlock:
 			etc_group = readers.ug_conf_load_list("/etc/group")
 
@@ -254,13 +341,13 @@ class ShadowBackend(Singleton, UsersBackend, GroupsBackend):
 		# shadow-backend always rewrite everything (no need for more granularity).
 		need_rewriting = False
 
-		extras      = []
-		etc_gshadow = []
+		extras      = {}
+		etc_gshadow = {}
 		is_allowed  = True
 
 		with self.gelock:
 			try:
-				extras = readers.ug_conf_load_list(
+				extras = readers.ug_conf_load_dict(
 								settings.backends.shadow.extended_group_file)
 			except IOError, e:
 				if e.errno != 2:
@@ -269,7 +356,7 @@ class ShadowBackend(Singleton, UsersBackend, GroupsBackend):
 
 		with self.gslock:
 			try:
-				etc_gshadow = readers.ug_conf_load_list("/etc/gshadow")
+				etc_gshadow = readers.ug_conf_load_dict("/etc/gshadow")
 			except IOError, e:
 				if e.errno == 13:
 					# don't raise an exception or display a warning, this is
@@ -299,59 +386,64 @@ class ShadowBackend(Singleton, UsersBackend, GroupsBackend):
 			else:
 				members = entry[3].split(',')
 
-			# TODO: we could load the extras data in another structure before
-			# loading groups from /etc/group to avoid this for() loop and just
-			# get extras[LMC.groups[gid]['name']] directly. this could gain
-			# some time on systems with many groups.
 			description = ''
 			groupSkel   = ''
-			for extra_entry in extras:
-				if name == extra_entry[0]:
-					try:
-						description = extra_entry[1]
-						groupSkel   = extra_entry[2]
 
-					except IndexError, e:
-						raise exceptions.CorruptFileError(
-							settings.backends.shadow.extended_group_file,
-							'for group "%s" (was: %s).' %
-								(extra_entry[0], str(e)))
-					break
+			try:
+				extra_entry = extras[name]
+
+			except KeyError:
+				pass
 
-			# load data from /etc/gshadow
-			not_found = True
-			for gshadow_entry in etc_gshadow:
-				if name ==  gshadow_entry[0]:
-					try:
-						userPassword = gshadow_entry[1]
+			else:
+				try:
+					description = extra_entry[1]
+					groupSkel   = extra_entry[2]
 
-					except IndexError, e:
-						# TODO: set need_rewriting = True, construct a good
-						# default entry and continue.
-						raise exceptions.CorruptFileError("/etc/gshadow",
+				except IndexError, e:
+					raise exceptions.CorruptFileError(
+						settings.backends.shadow.extended_group_file,
 						'for group "%s" (was: %s).' %
-							(gshadow_entry[0], str(e)))
-					not_found = False
-					break
-
-			if not_found and is_allowed:
-				# do some auto-correction stuff if we are able too.
-				# this happens if debian tools were used between 2 Licorn CLI
-				# calls, or on first call of CLI tools on a Debian system.
-				logging.notice(_(u'{0}: added missing record '
-					'for group {1} in {2}.').format(self.pretty_name,
-						stylize(ST_NAME, name),
-						stylize(ST_PATH, '/etc/gshadow')))
-				need_rewriting = True
-
-			yield gid, Group(
+							(extra_entry[0], str(e)))
+
+			# load data from /etc/gshadow
+			try:
+				gshadow_entry = etc_gshadow[name]
+
+			except KeyError:
+				# Fall back to the /etc/group password field; it will be
+				# written back to /etc/gshadow on next save.
+				userPassword = entry[1]
+
+				if is_allowed:
+					# do some auto-correction stuff if we are able too.
+					# this happens if debian tools were used between 2 Licorn
+					# CLI calls, or on first call of CLI tools on a Debian
+					# system.
+					logging.notice(_(u'{0}: added missing record '
+						'for group {1} in {2}.').format(self.pretty_name,
+							stylize(ST_NAME, name),
+							stylize(ST_PATH, '/etc/gshadow')))
+					need_rewriting = True
+
+			else:
+				try:
+					userPassword = gshadow_entry[1]
+
+				except IndexError, e:
+					# TODO: set need_rewriting = True, construct a good
+					# default entry and continue.
+					raise exceptions.CorruptFileError("/etc/gshadow",
+					'for group "%s" (was: %s).' %
+						(gshadow_entry[0], str(e)))
+
+			yield gid, dict(
 					gidNumber=gid,
 					name=name,
 					userPassword=userPassword,
 					memberUid=members,
 					description=description,
-					groupSkel=groupSkel,
-					backend=self)
+					groupSkel=groupSkel)
 
 			assert ltrace(TRACE_SHADOW, 'loaded group %s' % name)
 
@@ -383,54 +475,20 @@ class ShadowBackend(Singleton, UsersBackend, GroupsBackend):
 				if user.backend.name != self.name:
 					continue
 
-				etcpasswd.append(":".join((
-											user.login,
-											'x',
-											str(user.uidNumber),
-											str(user.gidNumber),
-											user.gecos,
-											user.homeDirectory,
-											user.loginShell
-										))
-								)
-
-				etcshadow.append(":".join((
-											user.login,
-											user.userPassword,
-											str(user.shadowLastChange),
-											str(user.shadowMin),
-											str(user.shadowMax),
-											str(user.shadowWarning),
-											'' if user.shadowInactive == 0
-												else str(user.shadowInactive),
-											'' if user.shadowExpire == 0
-												else str(user.shadowExpire),
-											str(user.shadowFlag)
-										))
-								)
+				passwd, shadow = self.__user_lines(user)
+				etcpasswd.append(passwd)
+				etcshadow.append(shadow)
 
 		with nested(self.pslock, self.shlock):
 
 			fsapi.backup_file('/etc/passwd')
 			fsapi.backup_file('/etc/shadow')
 
-			# for /etc/passwd
-			ftempp, fpathp = tempfile.mkstemp(dir='/etc')
-			os.write(ftempp, '%s\n' % '\n'.join(etcpasswd))
-			os.fchmod(ftempp, 0644)
-			os.fchown(ftempp, 0, 0)
-			os.close(ftempp)
 			self.__hint_pwd += 1
-			os.rename(fpathp, '/etc/passwd')
-
-			# for /etc/shadow
-			ftemps, fpaths = tempfile.mkstemp(dir='/etc')
-			os.write(ftemps, '%s\n' % '\n'.join(etcshadow))
-			os.fchmod(ftemps, 0640)
-			os.fchown(ftemps, 0, self.__shadow_gid)
-			os.close(ftemps)
+			self.__write_file('/etc/passwd', etcpasswd, 0644, 0)
+
 			self.__hint_shw += 1
-			os.rename(fpaths, '/etc/shadow')
+			self.__write_file('/etc/shadow', etcshadow, 0640, self.__shadow_gid)
 
 		logging.progress(_(u'{0}: saved users data to disk.').format(self.pretty_name))
 	def save_Groups(self, groups):
@@ -452,57 +510,310 @@ class ShadowBackend(Singleton, UsersBackend, GroupsBackend):
 				if group.backend.name != self.name:
 					continue
 
-				etcgroup.append(":".join((
-											group.name,
-											group.userPassword,
-											str(group.gid),
-											','.join(group.memberUid)
-										))
-								)
-				etcgshadow.append(":".join((
-											group.name,
-											group.userPassword,
-											'',
-											','.join(group.memberUid)
-										))
-								)
-				extgroup.append(':'.join((
-											group.name,
-											group.description,
-											group.groupSkel
-												if group.is_standard
-												else ''
-										))
-								)
+				group_line, gshadow, extended = self.__group_lines(group)
+				etcgroup.append(group_line)
+				etcgshadow.append(gshadow)
+				extgroup.append(extended)
 
 		with nested(self.grlock, self.gslock, self.gelock):
 
-			ftempg, fpathg = tempfile.mkstemp(dir='/etc')
-			os.write(ftempg, '%s\n' % '\n'.join(etcgroup))
-			os.fchmod(ftempg, 0644)
-			os.fchown(ftempg, 0, 0)
-			os.close(ftempg)
 			self.__hint_grp += 1
-			os.rename(fpathg, '/etc/group')
+			self.__write_file('/etc/group', etcgroup, 0644, 0)
 
-			ftemps, fpaths = tempfile.mkstemp(dir='/etc')
-			os.write(ftemps, '%s\n' % '\n'.join(etcgshadow))
-			os.fchmod(ftemps, 0640)
-			os.fchown(ftemps, 0, self.__shadow_gid)
-			os.close(ftemps)
 			self.__hint_gsh += 1
-			os.rename(fpaths, '/etc/gshadow')
+			self.__write_file('/etc/gshadow', etcgshadow, 0640, self.__shadow_gid)
 
-			ftempe, fpathe = tempfile.mkstemp(dir='/etc')
-			os.write(ftempe, '%s\n' % '\n'.join(extgroup))
-			os.fchmod(ftempe, 0644)
-			os.fchown(ftempe, 0, 0)
-			os.close(ftempe)
-			os.rename(fpathe, settings.backends.shadow.extended_group_file)
+			self.__write_file(settings.backends.shadow.extended_group_file,
+														extgroup, 0644, 0)
 
 		logging.progress(_(u'{0}: saved groups data to disk.').format(self.pretty_name))
 
 		assert ltrace_func(TRACE_SHADOW, True)
+	def flush(self, kinds=('users', 'groups')):
+		""" Rewrite the system files for the pending changes (see the class
+			documentation), and forget the journal entries they cover.
+			Called by the coalescing timer, at daemon shutdown, and safe to
+			call at any time.
+
+			Each kind is flushed under its controller lock only, which is
+			the order used by the callers of :meth:`save_User` and
+			:meth:`save_Group` (controller lock, then ours). Holding it
+			during the whole rewrite also guarantees that no line appended
+			by :meth:`__append_lines` can be lost by a concurrent rename.
+		"""
+
+		assert ltrace_func(TRACE_SHADOW)
+
+		with self.__journal_lock:
+			# a partial flush (e.g. from __append_lines()) must leave the
+			# timer armed for the other kinds, else their rewrite would wait
+			# for the next change, or the daemon shutdown.
+			if (self.__flush_timer is not None
+								and self.__dirty.issubset(kinds)):
+				timer_service().cancel(self.__flush_timer)
+				self.__flush_timer = None
+
+		for kind, controller, save in (
+					('users',  LMC.users,  self.save_Users),
+					('groups', LMC.groups, self.save_Groups)
+				):
+			if kind not in kinds:
+				continue
+
+			with controller.lock:
+				with self.__journal_lock:
+					if kind not in self.__dirty:
+						continue
+
+					self.__dirty.discard(kind)
+
+					offset = (None if self.__journal is None
+									else self.__journal.tell())
+
+				save(controller)
+
+				if offset:
+					self.__trim_journal(kind, offset)
+
+		assert ltrace_func(TRACE_SHADOW, True)
+	@events.handler_method
+	def daemon_shutdown(self, *args, **kwargs):
+		""" Don't leave pending changes in the journal when we stop. """
+		self.flush()
+	def __user_lines(self, user):
+		""" Return the :file:`/etc/passwd` and :file:`/etc/shadow` lines
+			of a user. """
+
+		return (':'.join((
+							user.login,
+							'x',
+							str(user.uidNumber),
+							str(user.gidNumber),
+							user.gecos,
+							user.homeDirectory,
+							user.loginShell
+						)),
+				':'.join((
+							user.login,
+							user.userPassword,
+							str(user.shadowLastChange),
+							str(user.shadowMin),
+							str(user.shadowMax),
+							str(user.shadowWarning),
+							'' if user.shadowInactive == 0
+								else str(user.shadowInactive),
+							'' if user.shadowExpire == 0
+								else str(user.shadowExpire),
+							str(user.shadowFlag)
+						)))
+	def __group_lines(self, group):
+		""" Return the :file:`/etc/group`, :file:`/etc/gshadow` and extended
+			group file lines of a group. """
+
+		return (':'.join((
+							group.name,
+							group.userPassword,
+							str(group.gid),
+							','.join(group.memberUid)
+						)),
+				':'.join((
+							group.name,
+							group.userPassword,
+							'',
+							','.join(group.memberUid)
+						)),
+				':'.join((
+							group.name,
+							group.description,
+							group.groupSkel
+								if group.is_standard
+								else ''
+						)))
+	def __write_file(self, path, lines, mode, gid):
+		""" Atomically replace ``path`` with ``lines``. """
+
+		ftemp, fpath = tempfile.mkstemp(dir=os.path.dirname(path))
+		os.write(ftemp, '%s\n' % '\n'.join(lines))
+		os.fchmod(ftemp, mode)
+		os.fchown(ftemp, 0, gid)
+		os.close(ftemp)
+		os.rename(fpath, path)
+	def __append_lines(self, kind, lines):
+		""" Append the lines of a newly created object at the end of the
+			system files, which is enough to make it visible to the rest of
+			the system, without rewriting everything.
+
+			If a rewrite of the same files is pending, it could conflict with
+			the appended lines (e.g. an object deleted then re-created in the
+			same window): flush them instead, they contain the new object.
+		"""
+
+		controller = LMC.users if kind == 'users' else LMC.groups
+
+		with controller.lock:
+			with self.__journal_lock:
+				if self.__save_delay() and kind not in self.__dirty:
+					append = True
+
+				else:
+					append = False
+					self.__dirty.add(kind)
+
+			if not append:
+				return self.flush((kind, ))
+
+			if kind == 'users':
+				paths = (('/etc/passwd', self.__hint_pwd),
+						('/etc/shadow', self.__hint_shw))
+				locks = (self.pslock, self.shlock)
+
+			else:
+				paths = (('/etc/group', self.__hint_grp),
+						('/etc/gshadow', self.__hint_gsh),
+						(settings.backends.shadow.extended_group_file, None))
+				locks = (self.grlock, self.gslock, self.gelock)
+
+			with nested(*locks):
+				for (path, hint), line in zip(paths, lines):
+					if hint is not None:
+						# one write() means one IN_MODIFY for the inotifier.
+						hint += 1
+
+					fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+
+					try:
+						os.write(fd, '%s\n' % line)
+
+					finally:
+						os.close(fd)
+	def __save_delay(self):
+		# the configuration reader returns strings for non-integer values.
+		return float(settings.backends.shadow.save_delay)
+	def __schedule_save(self, kind, record):
+		""" Record a change in the journal and make sure a flush will occur
+			at the end of the current coalescing window. """
+
+		delay = self.__save_delay()
+
+		if not delay:
+			if kind == 'users':
+				return self.save_Users(LMC.users)
+
+			return self.save_Groups(LMC.groups)
+
+		with self.__journal_lock:
+			if self.__journal is None:
+				self.__journal = open(self.__journal_path, 'a+')
+				os.fchmod(self.__journal.fileno(), 0600)
+
+			self.__journal.write('%s\n' % '\t'.join((kind, ) + record))
+			self.__journal.flush()
+			os.fsync(self.__journal.fileno())
+
+			self.__dirty.add(kind)
+
+			if self.__flush_timer is None:
+				# the timer service only hands the rewrite to a worker.
+				self.__flush_timer = timer_service().schedule(delay,
+										workers.service_enqueue,
+										priorities.NORMAL, self.flush)
+	def __trim_journal(self, kind, offset):
+		""" Forget the ``kind`` records written before ``offset``, they are
+			on disk now. Keep the other ones. """
+
+		with self.__journal_lock:
+			self.__journal.flush()
+			self.__journal.seek(0)
+
+			head = self.__journal.read(offset)
+			tail = self.__journal.read()
+
+			self.__journal.seek(0)
+			self.__journal.truncate()
+			self.__journal.writelines(line for line in head.splitlines(True)
+										if not line.startswith(kind + '\t'))
+			self.__journal.write(tail)
+			self.__journal.flush()
+			os.fsync(self.__journal.fileno())
+	def __replay_journal(self):
+		""" Apply journal records left by a crash to the system files. The
+			records are full lines (or a deletion order), so replaying them
+			twice is harmless. """
+
+		try:
+			records = [ line[:-1].split('\t')
+							for line in open(self.__journal_path) ]
+
+		except (IOError, OSError), e:
+			if e.errno == 2:
+				return
+			raise
+
+		if not records:
+			return
+
+		logging.warning(_(u'{0}: replaying {1} pending change(s) from '
+			u'{2}.').format(self.pretty_name, len(records),
+				stylize(ST_PATH, self.__journal_path)))
+
+		files = {
+			'users'  : (('/etc/passwd', 0644, self.pslock),
+						('/etc/shadow', 0640, self.shlock)),
+			'groups' : (('/etc/group', 0644, self.grlock),
+						('/etc/gshadow', 0640, self.gslock),
+						(settings.backends.shadow.extended_group_file,
+													0644, self.gelock))
+			}
+
+		for kind, targets in files.iteritems():
+			kind_records = [ r for r in records if r[0] == kind ]
+
+			if not kind_records:
+				continue
+
+			with nested(*(lock for path, mode, lock in targets)):
+				for index, (path, mode, lock) in enumerate(targets):
+					try:
+						# keep the file order, but index lines on names.
+						lines = [ line[:-1] for line in open(path) ]
+
+					except IOError, e:
+						if e.errno != 2:
+							raise
+						lines = []
+
+					positions = dict((line.split(':', 1)[0], position)
+										for position, line in enumerate(lines))
+
+					for record in kind_records:
+						if record[1] == 'delete':
+							try:
+								lines[positions.pop(record[2])] = None
+
+							except KeyError:
+								pass
+						else:
+							line = record[2 + index]
+							name = line.split(':', 1)[0]
+
+							try:
+								lines[positions[name]] = line
+
+							except KeyError:
+								positions[name] = len(lines)
+								lines.append(line)
+
+					try:
+						gid = os.stat(path).st_gid
+
+					except OSError:
+						gid = 0
+
+					fsapi.backup_file(path)
+					self.__write_file(path, [ l for l in lines
+												if l is not None ], mode, gid)
+
+		open(self.__journal_path, 'w').close()
 	def compute_password(self, password, salt=None, ascii=False):
 
 		assert ltrace_func(TRACE_SHADOW)
@@ -514,7 +825,7 @@ class ShadowBackend(Singleton, UsersBackend, GroupsBackend):
 
 		assert ltrace_func(TRACE_SHADOW)
 
-		self.__conffiles_threads = {}
+		self.__conffiles_timers = {}
 
 		for watched_file, controller, hint, callback_func in (
 				('/etc/passwd',  LMC.users,  self.__hint_pwd, self.__event_on_passwd),
@@ -524,7 +835,8 @@ class ShadowBackend(Singleton, UsersBackend, GroupsBackend):
 			):
 			inotifier.watch_conf(watched_file, controller, callback_func, hint)
 	def __reload_controller_unix(self, path, controller, *args, **kwargs):
-		""" Timer() callback for watch threads.
+		""" Run by a service worker, after the delay scheduled by
+		:meth:`__event_on_config_file`.
 		*args and **kwargs are not used. """
 
 		assert ltrace_func(TRACE_SHADOW)
@@ -534,7 +846,8 @@ class ShadowBackend(Singleton, UsersBackend, GroupsBackend):
 				stylize(ST_PATH, path),
 				stylize(ST_NAME, controller.name)))
 
-		controller.reload_backend(self)
+		controller.reload_backend(self,
+				incremental=settings.backends.shadow.incremental_reload)
 	def __event_on_config_file(self, pathname, controller, index):
 		""" We only watch GAMCreated events, because when
 			{user,group}{add,mod,del} change their files, they create it
@@ -546,22 +859,20 @@ class ShadowBackend(Singleton, UsersBackend, GroupsBackend):
 			'conf_file %s change -> reload controller %s (index %s)' % (
 				pathname, controller.name, index))
 
-		create_thread = False
-		try:
-			if self.__conffiles_threads[index].is_alive():
-				self.__conffiles_threads[index].cancel()
+		# restart the delay at each event; cancel() does nothing if the
+		# previous reload was already handed to a worker.
+		service = timer_service()
 
-			self.__conffiles_threads[index].join()
-			del self.__conffiles_threads[index]
-			create_thread = True
+		try:
+			service.cancel(self.__conffiles_timers.pop(index))
 
-		except (KeyError, AttributeError):
-			create_thread = True
+		except KeyError:
+			pass
 
-		if create_thread:
-			self.__conffiles_threads[index] = Timer(0.25,
-				self.__reload_controller_unix, [ pathname, controller ])
-			self.__conffiles_threads[index].start()
+		self.__conffiles_timers[index] = service.schedule(0.25,
+								workers.service_enqueue, priorities.HIGH,
+								self.__reload_controller_unix,
+								pathname, controller)
 	def __event_on_passwd(self, pathname):
 		return self.__event_on_config_file(pathname, LMC.users, 1)
 	def __event_on_group(self, pathname):
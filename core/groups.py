@@ -28,7 +28,8 @@ from licorn.foundations.constants import filters, backend_actions, \
 											distros, priorities, relation
 
 from licorn.core                import LMC
-from licorn.core.classes        import CoreFSController, CoreStoredObject, CoreFSUnitObject
+from licorn.core.classes        import CoreFSController, CoreStoredObject, \
+										CoreFSUnitObject, IdAllocatingController
 from licorn.contrib             import getent
 #from licorn.core.users          import User
 
@@ -785,6 +786,96 @@ class Group(CoreStoredObject, CoreFSUnitObject):
 
 		if rewrite:
 			yield self
+	def _update_from_backend(self, data):
+		""" Update the current group in place from backend ``data`` (see
+			:meth:`~licorn.core.backends.shadow.ShadowBackend.load_Groups_data`),
+			which has just been read from the backend and thus must not be
+			serialized back. Auxilliary members are diffed against the
+			``memberUid`` list and linked / unlinked one by one, emitting the
+			same events as :meth:`add_Users` and :meth:`del_Users`.
+
+			:return: the list of changed attribute names (empty if the
+				group is unchanged).
+		"""
+
+		changed = []
+
+		with self.lock:
+			for attr in ('description', 'groupSkel', 'userPassword'):
+				private = '_Group__' + attr
+
+				if data[attr] != getattr(self, private):
+					setattr(self, private, data[attr])
+					changed.append(attr)
+
+			current = {}
+
+			for member in self.__members[:]:
+				user = member()
+
+				if user is None:
+					# a dead link, left by a user rebuilt or deleted.
+					self.__members.remove(member)
+
+				else:
+					current[user.login] = user
+
+			wanted  = set(data['memberUid'])
+			added   = []
+			removed = [ current[login] for login in current
+										if login not in wanted ]
+
+			for login in wanted:
+				if login in current:
+					continue
+
+				try:
+					user = LMC.users.by_login(login)
+
+				except KeyError:
+					user = None
+
+				if user is None:
+					logging.warning(_(u'group {0}: skipped relationship for '
+										u'non-existing user {1}.').format(
+											stylize(ST_NAME, self.__name),
+											stylize(ST_LOGIN, login)))
+					continue
+
+				if user.weakref in self.__gidMembers:
+					continue
+
+				# link_Group() will call back our link_User().
+				user.link_Group(self)
+				added.append(user)
+
+			for user in removed:
+				self.__members.remove(user.weakref)
+				user.unlink_Group(self)
+
+			if added or removed:
+				changed.append('memberUid')
+
+			if changed:
+				if self.__is_helper and self.standard_group is not None:
+					self.standard_group._cli_invalidate()
+				else:
+					self._cli_invalidate()
+
+		for attr in ('description', 'groupSkel'):
+			if attr in changed:
+				LicornEvent('group_%s_changed' % attr,
+								group=self.proxy).emit(priorities.LOW)
+
+		for user in added:
+			LicornEvent('group_member_added', group=self.proxy,
+							user=user.proxy).emit(priorities.LOW)
+
+		for user in removed:
+			LicornEvent('group_member_deleted', group=self.proxy,
+							user=user.proxy).emit(priorities.LOW)
+
+		return changed
 	def serialize(self, backend_action=backend_actions.UPDATE):
 		""" Save group data to originating backend. """
 
@@ -1853,7 +1944,7 @@ class Group(CoreStoredObject, CoreFSUnitObject):
 			return self.__is_system and not self.__is_helper
 		else:
 			return self.__is_system and not self.__is_helper and not self.__is_privilege
-class GroupsController(DictSingleton, CoreFSController):
+class GroupsController(DictSingleton, IdAllocatingController, CoreFSController):
 	""" Manages the groups and the associated shared data on a Linux system.
 	"""
 
@@ -1942,10 +2033,19 @@ class GroupsController(DictSingleton, CoreFSController):
 
 		if send_event:
 			LicornEvent('groups_reloaded', groups=self).emit(synchronous=True)
-	def reload_backend(self, backend):
-		""" reload only one backend contents (used from inotifier). """
+	def reload_backend(self, backend, incremental=False):
+		""" reload only one backend contents (used from inotifier).
+
+			:param incremental: if ``True`` and the backend implements
+				``load_Groups_data()``, diff the backend data with the
+				current groups and only create, update or delete the ones
+				which changed. See :meth:`__reload_backend_incremental`.
+		"""
 
 		assert ltrace_func(TRACE_GROUPS)
+
+		if incremental and hasattr(backend, 'load_Groups_data'):
+			return self.__reload_backend_incremental(backend)
 		assert ltrace_locks(self.lock, LMC.users.lock)
 
 		# lock users too, because we feed the members cache inside.
@@ -1983,6 +2083,84 @@ class GroupsController(DictSingleton, CoreFSController):
 		# we need to reload them, as they connect groups to them.
 		LMC.privileges.reload()
 		LMC.profiles.reload()
+	def __reload_backend_incremental(self, backend):
+		""" Diff the backend data with the in-memory groups: build only new
+			groups, update changed ones in place (see
+			:meth:`Group._update_from_backend`), delete the disappeared ones,
+			and emit one event per affected group or membership.
+
+			Renamed groups (or groups coming from another backend) are
+			rebuilt; this needs all links to be set up again, like in the
+			full :meth:`reload_backend`.
+		"""
+
+		assert ltrace_func(TRACE_GROUPS)
+
+		added, updated, deleted = [], 0, 0
+		relink_all = False
+		seen       = set()
+
+		# lock users too, because we feed the members cache inside.
+		with nested(self.lock, LMC.users.lock):
+
+			for gid, data in backend.load_Groups_data():
+				seen.add(gid)
+
+				try:
+					group = self[gid]
+
+				except KeyError:
+					group = Group(backend=backend, **data)
+					self[gid] = group
+					added.append(group)
+
+					LicornEvent('group_added', group=group.proxy).emit(priorities.LOW)
+					continue
+
+				if group.backend.name != backend.name \
+										or group.name != data['name']:
+					logging.progress(_(u'{0}.reload: Overwritten gid {1}.').format(
+							stylize(ST_NAME, self.name), gid))
+
+					group = Group(backend=backend, **data)
+					self[gid] = group
+					updated += 1
+					relink_all = True
+
+					LicornEvent('group_changed', group=group.proxy).emit(priorities.LOW)
+					continue
+
+				if group._update_from_backend(data):
+					updated += 1
+					LicornEvent('group_changed', group=group.proxy).emit(priorities.LOW)
+
+			for gid, group in self.items():
+				if group.backend.name == backend.name and gid not in seen:
+					logging.progress(_(u'{0}: removing disapeared group '
+						u'{1}.').format(stylize(ST_NAME, self.name),
+							stylize(ST_NAME, group.name)))
+
+					self.del_Group(group, batch=True, force=True)
+					deleted += 1
+
+			if relink_all:
+				self.__connect_groups()
+				self.__connect_users(clear_first=True)
+
+			elif added:
+				self.__connect_groups()
+				self.__connect_users(groups=added)
+
+		assert ltrace_locks(self.lock, LMC.users.lock)
+
+		logging.progress(_(u'{0}: incremental reload from {1}: {2} added, '
+			u'{3} updated, {4} deleted.').format(stylize(ST_NAME, self.name),
+				stylize(ST_NAME, backend.name), len(added), updated, deleted))
+
+		if added or deleted or relink_all:
+			# we need to reload them, as they connect groups to them.
+			LMC.privileges.reload()
+			LMC.profiles.reload()
 	def get_hidden_state(self):
 		""" See if /home/groups is readable or not. """
 
@@ -2191,35 +2369,51 @@ class GroupsController(DictSingleton, CoreFSController):
 	def to_script(self, selected=None, script_format=None, script_separator=None):
 		""" Export the user accounts list to XML. """
 
+		return ''.join(self.to_script_iter(selected, script_format,
+															script_separator))
+	def to_script_iter(self, selected=None, script_format=None, script_separator=None):
+		""" Same as :meth:`to_script`, but yield the output group by group. """
+
 		with self.lock:
 			if selected is None:
-				groups = self
+				groups = self.values()
 			else:
-				groups = selected
+				groups = list(selected)
 
-		return script_separator.join(script_format.format(group=group, g=group, self=group)
-														for group in groups)
+		separator = ''
+		for group in groups:
+			yield separator + script_format.format(group=group, g=group, self=group)
+			separator = script_separator
 	def to_XML(self, selected=None, long_output=False):
 		""" Export the groups list to XML. """
 
+		return u''.join(self.to_XML_iter(selected, long_output))
+	def to_XML_iter(self, selected=None, long_output=False):
+		""" Same as :meth:`to_XML`, but yield the output piece by piece
+			(one piece per group), for streaming. """
+
 		with self.lock:
 			if selected is None:
-				groups = self
+				groups = self.values()
 			else:
-				groups = selected
-				for g in groups:
+				groups = list(selected)
+				for g in groups[:]:
 					if not g.is_system:
 						groups.append(g.responsible_group)
 						groups.append(g.guest_group)
 
-			assert ltrace(TRACE_GROUPS, '| to_XML(%s)' % ','.join(
+			assert ltrace(TRACE_GROUPS, '| to_XML_iter(%s)' % ','.join(
 											group.name for group in groups))
 
-		return (u'<?xml version="1.0" encoding="UTF-8"?>\n'
-				u'<groups-list>\n'
-				u'%s\n'
-				u'</groups-list>\n') % u'\n'.join(
-						group.to_XML() for group in groups)
+		yield (u'<?xml version="1.0" encoding="UTF-8"?>\n'
+				u'<groups-list>\n')
+
+		separator = u''
+		for group in groups:
+			yield separator + group.to_XML()
+			separator = u'\n'
+
+		yield u'\n</groups-list>\n'
 	def get_CSV_data(self, selected=None, long_output=False):
 		""" return the group accounts list ready to be parsed by python csv module.
 			name;gid;desc;members;backend;permissive
@@ -2467,11 +2661,11 @@ class GroupsController(DictSingleton, CoreFSController):
 		# Find a new GID
 		if manual_gid is None:
 			if system:
-				gid = pyutils.next_free(self.keys(),
+				gid = self._free_id(
 					LMC.configuration.groups.system_gid_min,
 					LMC.configuration.groups.system_gid_max)
 			else:
-				gid = pyutils.next_free(self.keys(),
+				gid = self._free_id(
 					LMC.configuration.groups.gid_min,
 					LMC.configuration.groups.gid_max)
 
@@ -2897,20 +3091,24 @@ class GroupsController(DictSingleton, CoreFSController):
 	def _cli_get(self, selected=None, long_output=False, no_colors=False):
 		""" Export the groups list to human readable (= « get group ») form. """
 
+		return u''.join(self._cli_get_iter(selected, long_output,
+															no_colors)) or u'\n'
+	def _cli_get_iter(self, selected=None, long_output=False, no_colors=False):
+		""" Same as :meth:`_cli_get`, but yield the output group by group. The
+			lock is held only to sort the selection, not while rendering. """
+
 		with self.lock:
 			if selected is None:
 				groups = self.values()
 			else:
 				groups = selected
 
-			# FIXME: forward long_output to _cli_get(), or remove it
-			if long_output:
-				return u'%s\n' % u'\n'.join((group._cli_get()
-								for group in sorted(groups, key=attrgetter('gid'))))
-			else:
-				return u'%s\n' % u'\n'.join((group._cli_get()
-								for group in sorted(groups, key=attrgetter('gid'))
-									if not group.is_helper))
+			groups = sorted(groups, key=attrgetter('gid'))
+
+		# FIXME: forward long_output to _cli_get(), or remove it
+		for group in groups:
+			if long_output or not group.is_helper:
+				yield group._cli_get() + u'\n'
 
 	@events.handler_method
 	def group_pre_del(self, *args, **kwargs):
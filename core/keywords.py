@@ -9,7 +9,10 @@ Licorn core: keywords - http://docs.licorn.org/core/privileges.html
 :license: GNU GPL version 2
 """
 
-import xattr, os.path, stat
+import xattr, os.path, stat, time
+
+from threading import Thread
+from Queue     import Queue
 
 from licorn.foundations         import settings, exceptions, logging
 from licorn.foundations         import fsapi, readers, hlstr, pyutils
@@ -38,6 +41,9 @@ class KeywordsController(Singleton, LockedController):
 		self.changed       = False
 		self.licorn_xattr  = "user.Licorn.keywords"
 
+		#: the daemon keywords cache, when it runs (it registers itself).
+		self.cache         = None
+
 		self.work_path     = os.getenv('LICORN_KEYWORDS_PATH',
 										LMC.configuration.groups.base_path)
 		#
@@ -212,32 +218,6 @@ class KeywordsController(Singleton, LockedController):
 		return children
 	def RenameKeyword(self, name, newname):
 		""" Rename a keyword (parent or not) """
-		def __rename_keyword_from_path(file_path):
-			actual_kw = []
-			try:
-				actual_kw = xattr.getxattr(file_path,
-					self.licorn_xattr).split(',')
-			except IOError, e:
-				if e.errno == 61:
-					# No data available (ie self.licorn_xattr is not created)
-					pass
-				else: raise e
-			try:
-				i = actual_kw.index(name)
-
-			except ValueError:
-				pass
-
-			else:
-				actual_kw[i] = newname
-
-			try:
-				xattr.setxattr(file_path, self.licorn_xattr, ','.join(actual_kw))
-
-			except IOError, e:
-				if e.errno == 1:
-					# Operation not permitted
-					pass
 		try:
 			self.AddKeyword(newname,
 							description=self.keywords[name]['description'])
@@ -246,9 +226,9 @@ class KeywordsController(Singleton, LockedController):
 				self.keywords[child]["parent"] = newname
 
 			# TODO: affine path
-			map(
-				lambda x: __rename_keyword_from_path(x),
-				 fsapi.minifind(self.work_path, itype=(stat.S_IFREG,)) )
+			self.__tag_files(self.work_path, True,
+				lambda current: [ newname if k == name else k
+														for k in current ])
 			self.DeleteKeyword(name, del_children=True, modify_file=False)
 			self.WriteConf()
 		except KeyError:
@@ -298,124 +278,160 @@ class KeywordsController(Singleton, LockedController):
 			except: pass
 			good_keywords.append(k)
 		return good_keywords
-	def AddKeywordsToPath(self, path, keywords_to_add, recursive=False):
-		""" Add keywords to a file or directory files
+	def __tag_files(self, path, recursive, new_keywords):
+		""" Set the keywords of a file, or of the files of a directory (and
+			of its sub-directories if `recursive`). `new_keywords` gets the
+			current keywords of a file and returns the ones it must have; the
+			attribute is removed if there are none left.
+
+			The directory is walked by :func:`~licorn.foundations.fsapi.minifind`
+			while a pool of :obj:`settings.core.keywords.tag_workers` threads
+			reads and writes the attributes. Files which already hold the
+			right keywords are not written. One summary is logged at the end,
+			and the daemon cache (if any) gets all changes at once.
+
+			.. versionadded:: 1.6.1
 		"""
-		def __add_keywords_to_file(file_path):
-			actual_kw = []
-			try:
-				actual_kw = xattr.getxattr(file_path,
-											self.licorn_xattr).split(',')
 
-			except IOError, e:
-				if e.errno in (61, 95):
-					# No data available (ie self.licorn_xattr is not created) or
-					# attr not supported (FS not mounted with user_xattr option)
-					logging.warning2(_(u'Cannot get current keywords.'), once=True)
+		start = time.time()
 
-				else:
-					raise e
+		if os.path.isfile(path):
+			workers = 1
+			files   = [ path ]
 
-			keywords_to_add_tmp = list(keywords_to_add)
-			keywords_to_add_tmp.extend(actual_kw)
-			keywords_to_set = pyutils.list2set(keywords_to_add_tmp)
+		else:
+			workers = max(1, settings.core.keywords.tag_workers)
+			files   = fsapi.minifind(path, maxdepth=99 if recursive else 1,
+							itype=(stat.S_IFREG,),
+							workers=settings.fsapi.minifind_workers)
 
-			try:
-				attr = ','.join(self.__remove_bad_keywords(keywords_to_set))
-				xattr.setxattr(file_path, self.licorn_xattr, attr)
-				logging.info(_(u'Applyed {0} xattr {1} on {2}.').format(
-									stylize(ST_NAME, self.licorn_xattr),
-									stylize(ST_ACL, attr),
-									stylize(ST_PATH, file_path)))
-			except IOError, e:
-				if e.errno is (1, 95): # Operation not permitted / not supported
-					logging.warning2(_(u'Unable to modify {0} xattr of {1} '
-									u'(was: {2}).').format(
-										stylize(ST_NAME, self.licorn_xattr),
-										stylize(ST_PATH, file_path), e))
-				else:
-					raise e
+		# bounded, to not hold a whole 100k files tree in memory.
+		jobs    = Queue(maxsize=workers * 64)
+		results = []
 
-		# file case
-		if os.path.isfile(path):
-			__add_keywords_to_file(path)
+		def tag_worker(counters, changes):
+			while True:
+				file_path = jobs.get()
 
-		# dir case
-		else:
-			if recursive: max = 99
-			else:         max = 1
-			map(lambda x: __add_keywords_to_file(x),
-				 fsapi.minifind(path, maxdepth=max, itype=(stat.S_IFREG,)))
-	def DeleteKeywordsFromPath(self, path, keywords_to_del, recursive=False):
-		""" Delete keywords from a file or directory files
-		"""
-		def __delete_keywords_from_file(file_path):
-			actual_kw = []
-			try:
-				actual_kw = xattr.getxattr(file_path,
-					self.licorn_xattr).split(',')
-			except IOError, e:
-				if e.errno in (61, 95):
-					# No data available (ie self.licorn_xattr is not created)
-					# or Operation not supported (partition is not mounted
-					# with user_xattr option).
-					logging.warning2(_(u'Cannot get current keywords.'), once=True)
-					pass
-				else: raise e
-			keywords_to_set = []
-			for k in actual_kw:
-				if k not in keywords_to_del:
-					keywords_to_set.append(k)
-			try:
-				if keywords_to_set == []:
-					xattr.removexattr(file_path, self.licorn_xattr)
-					logging.info(_(u'Removed xattr {0} from {1}.').format(
+				if file_path is None:
+					return
+
+				try:
+					try:
+						current = [ k for k in xattr.getxattr(file_path,
+										self.licorn_xattr).split(',') if k ]
+
+					except IOError, e:
+						if e.errno != 61:
+							raise
+
+						# No data available (ie self.licorn_xattr is not created)
+						current = []
+
+					keywords = new_keywords(current)
+
+					if set(keywords) == set(current):
+						counters['unchanged'] += 1
+						continue
+
+					if keywords == []:
+						xattr.removexattr(file_path, self.licorn_xattr)
+
+					else:
+						xattr.setxattr(file_path, self.licorn_xattr,
+													','.join(keywords))
+
+					counters['changed'] += 1
+
+					if self.cache is not None:
+						changes.append((file_path, os.lstat(file_path),
+																keywords))
+
+				except (IOError, OSError), e:
+					counters['failed'] += 1
+
+					if e.errno in (1, 95):
+						# Operation not permitted / not supported (partition
+						# is not mounted with user_xattr option).
+						logging.warning2(_(u'Unable to modify {0} xattr of {1} '
+							u'(was: {2}).').format(
 								stylize(ST_NAME, self.licorn_xattr),
-								stylize(ST_PATH, file_path)))
-				else:
-					attr = ','.join(self.__remove_bad_keywords(keywords_to_set))
-					xattr.setxattr(file_path, self.licorn_xattr, attr)
-					logging.info(_(u'Applyed {0} xattr {1} on {2}.').format(
+								stylize(ST_PATH, file_path), e), once=True)
+
+					elif e.errno != 2:
+						# (2: the file vanished meanwhile, nothing to say.)
+						logging.warning(_(u'Unable to modify {0} xattr of {1} '
+							u'(was: {2}).').format(
 								stylize(ST_NAME, self.licorn_xattr),
-									stylize(ST_ACL, attr),
-									stylize(ST_PATH, file_path)))
-			except IOError, e:
-				if e.errno in (1, 95): # Operation not permitted / not supported
-					logging.warning(_(u'Unable to modify {0} xattr of {1} '
-									u'(was: {2}).').format(
-										stylize(ST_NAME, self.licorn_xattr),
-										stylize(ST_PATH, file_path), e))
-				else:
-					raise e
+								stylize(ST_PATH, file_path), e))
 
-		# file case
-		if os.path.isfile(path):
-			__delete_keywords_from_file(path)
+				except Exception:
+					# a dead worker would leave the feeding loop blocked on
+					# the bounded queue: count it and go on.
+					counters['failed'] += 1
 
-		# directory case
-		else:
-			if recursive: max = 99
-			else:         max = 1
+					logging.exception(_(u'{0}: exception while tagging {1}'),
+										(ST_NAME, self.name),
+										(ST_PATH, file_path))
+
+		threads = []
+
+		for index in range(workers):
+			counters = { 'changed': 0, 'unchanged': 0, 'failed': 0 }
+			changes  = []
+
+			thread = Thread(target=tag_worker, args=(counters, changes),
+										name='%s-tag-%s' % (self.name, index))
+			thread.daemon = True
+			thread.start()
+
+			threads.append(thread)
+			results.append((counters, changes))
 
-			# TODO: if fsapi.minifind is not configured for cross-mount finding,
-			# skip related files if mount point is not mounted with user_xattr.
+		try:
+			for file_path in files:
+				jobs.put(file_path)
+
+		finally:
+			for thread in threads:
+				jobs.put(None)
+
+			for thread in threads:
+				thread.join()
+
+		totals = dict((key, sum(counters[key] for counters, c in results))
+							for key in ('changed', 'unchanged', 'failed'))
 
-			map(lambda x: __delete_keywords_from_file(x),
-				 fsapi.minifind(path, maxdepth=max, itype=(stat.S_IFREG,)))
+		if self.cache is not None:
+			self.cache.update_keywords([ change for c, changes in results
+												for change in changes ])
+
+		logging.info(_(u'{0}: updated {1} xattr on {2} file(s) in {3} '
+			u'({4} unchanged, {5} failed) in {6:.2f}s with {7} workers.').format(
+				self.pretty_name, stylize(ST_NAME, self.licorn_xattr),
+				stylize(ST_UGID, totals['changed']), stylize(ST_PATH, path),
+				totals['unchanged'], totals['failed'], time.time() - start,
+				workers))
+
+		return totals
+	def AddKeywordsToPath(self, path, keywords_to_add, recursive=False):
+		""" Add keywords to a file or directory files
+		"""
+		return self.__tag_files(path, recursive,
+			lambda current: self.__remove_bad_keywords(
+				pyutils.list2set(list(keywords_to_add) + current)))
+	def DeleteKeywordsFromPath(self, path, keywords_to_del, recursive=False):
+		""" Delete keywords from a file or directory files
+		"""
+		# TODO: if fsapi.minifind is not configured for cross-mount finding,
+		# skip related files if mount point is not mounted with user_xattr.
+		return self.__tag_files(path, recursive,
+			lambda current: self.__remove_bad_keywords(
+				[ k for k in current if k not in keywords_to_del ]))
 	def ClearKeywords(self, path, recursive=False):
 		""" Delete all keywords from a file or directory files
 		"""
-		# file case
-		if os.path.isfile(path):
-			xattr.setxattr(path, self.licorn_xattr, '')
-			logging.info(_(u'Removed xattr from %s.') % stylize(ST_PATH, path))
-
-		# dir case
-		else:
-			if recursive: max = 99
-			else:         max = 1
-			map(lambda x: xattr.setxattr(x, self.licorn_xattr, ''),
-				 fsapi.minifind(path, maxdepth=max, itype=(stat.S_IFREG,)))
+		return self.__tag_files(path, recursive, lambda current: [])
 	def GetKeywordsFromPath(self, path):
 		""" get user_xattr keywords from a given path. """
 		return xattr.getxattr(path, self.licorn_xattr).split(',')
@@ -320,22 +320,10 @@ class Machine(CoreStoredObject, SharedResource):
 		caller = current_thread().name
 		#assert ltrace(TRACE_MACHINES, '> %s: ping(%s)' % (caller, self.mid))
 
-		old_status = self.status
-		UP_status = [ host_status.ONLINE, host_status.PINGS, host_status.ACTIVE ]
-
 		with self.lock:
 
 			if self.myself:
-				self.status = host_status.ACTIVE
-
-				if and_more:
-					workers.network_enqueue(priorities.NORMAL, self.scan_ports)
-					workers.network_enqueue(priorities.LOW, self.arping)
-					workers.network_enqueue(priorities.LOW, self.resolve)
-				assert ltrace(TRACE_MACHINES, '| %s: ping(%s) → %s' % (
-									caller, self.mid, host_status[self.status]))
-
-				self.has_already_been_online = True
+				self.ping_status(True, and_more)
 				return
 
 			try:
@@ -344,10 +332,7 @@ class Machine(CoreStoredObject, SharedResource):
 
 			except (exceptions.DoesntExistException,
 					exceptions.TimeoutExceededException), e:
-
-				self.status = host_status.OFFLINE
-				if old_status in UP_status:
-					LicornEvent('host_offline', host=self).emit()
+				self.ping_status(False)
 
 			except Exception, e:
 				assert ltrace(TRACE_MACHINES, '  %s: cannot ping %s (was: %s).' % (
@@ -355,18 +340,8 @@ class Machine(CoreStoredObject, SharedResource):
 				pass
 
 			else:
-				self.status = host_status.PINGS
-				if old_status not in UP_status:
-					LicornEvent('host_back_online'
-									if self.has_already_been_online
-									else 'host_online', host=self).emit()
-
-				if and_more:
-					workers.network_enqueue(priorities.NORMAL, self.scan_ports)
-					workers.network_enqueue(priorities.LOW, self.arping)
-					workers.network_enqueue(priorities.LOW, self.resolve)
+				self.ping_status(True, and_more)
 
-				self.has_already_been_online = True
 			# close the socket (no more needed), else we could get
 			# "too many open files" errors (254 open sockets for .
 			pinger.reset(self)
@@ -374,6 +349,42 @@ class Machine(CoreStoredObject, SharedResource):
 
 		assert ltrace(TRACE_MACHINES, '| %s: ping(%s) → %s' % (
 								caller, self.mid, host_status[self.status]))
+	def ping_status(self, up, and_more=False):
+		""" Update the machine status after a ping (or a bulk network scan),
+			emit the related events if it changed, and launch the other
+			discovery jobs if :param:`and_more` is ``True`` and the machine
+			is up.
+
+			:param up: ``True`` if the machine answered, else ``False``.
+		"""
+
+		UP_status = [ host_status.ONLINE, host_status.PINGS, host_status.ACTIVE ]
+
+		with self.lock:
+			old_status = self.status
+
+			if self.myself:
+				self.status = host_status.ACTIVE
+
+			elif up:
+				self.status = host_status.PINGS
+				if old_status not in UP_status:
+					LicornEvent('host_back_online'
+									if self.has_already_been_online
+									else 'host_online', host=self).emit()
+
+			else:
+				self.status = host_status.OFFLINE
+				if old_status in UP_status:
+					LicornEvent('host_offline', host=self).emit()
+				return
+
+			if and_more:
+				workers.network_enqueue(priorities.NORMAL, self.scan_ports)
+				workers.network_enqueue(priorities.LOW, self.arping)
+				workers.network_enqueue(priorities.LOW, self.resolve)
+
+			self.has_already_been_online = True
 	def resolve(self):
 		""" Resolve IP to hostname, if possible. """
 		caller = current_thread().name
@@ -782,10 +793,14 @@ class MachinesController(DictSingleton, CoreController):
 		events.collect(self)
 	def add_machine(self, mid, hostname=None, ether=None, backend=None,
 		system_type=host_types.UNKNOWN, system=None, status=host_status.UNKNOWN,
-		myself=False):
+		myself=False, ping=True):
 		""" Create a machine in the current controller. Parameters are
 			essentially the same as in the
 			:class:`Machine constructor <Machine>`.
+
+			:param ping: if ``False``, don't enqueue the initial ping of
+				the new machine (the caller will take care of it, e.g.
+				:meth:`scan_network`).
 		"""
 		caller = current_thread().name
 
@@ -806,7 +821,8 @@ class MachinesController(DictSingleton, CoreController):
 						myself=myself
 					)
 
-		workers.network_enqueue(priorities.LOW, self[mid].ping, and_more=True)
+		if ping:
+			workers.network_enqueue(priorities.LOW, self[mid].ping, and_more=True)
 
 		return self[mid]
 	@property
@@ -1007,15 +1023,105 @@ class MachinesController(DictSingleton, CoreController):
 				for ipaddr in ipcalc.Network(netw):
 					ips_to_scan.append(str(ipaddr))
 
+		machines = []
+		known    = []
+
 		for ipaddr in ips_to_scan:
 			if ipaddr[-2:] != '.0' and ipaddr[-4:] != '.255':
 				if ipaddr in known_ips:
-					workers.network_enqueue(priorities.LOW,
-											self[str(ipaddr)].ping)
+					known.append(self[ipaddr])
 				else:
-					self.add_machine(mid=str(ipaddr))
+					machines.append(self.add_machine(mid=ipaddr, ping=False))
+
+		# the sweep itself runs in a network worker, not in the caller
+		# (which can be the WMI or a CLI command): known machines only get
+		# their status updated, new ones get the full discovery if up.
+		workers.network_enqueue(priorities.LOW, self.bulk_ping,
+								machines + known, and_more=True,
+								ping_only=known)
 
 		assert ltrace(TRACE_MACHINES, '< %s: scan_network()' % caller)
+	def bulk_ping(self, machines, and_more=False, ping_only=None):
+		""" Ping many machines at once with a :class:`~licorn.foundations.network.BulkPinger`
+			(one raw socket, rate-limited sends, see
+			``licornd.network.scan_rate``), instead of enqueuing one
+			:meth:`Machine.ping` job per machine. Machines which didn't answer
+			pings but whose ARP entry appeared during the sweep (thus
+			confirmed by a fresh ARP reply) are considered up too. Entries
+			already in the ARP cache before the sweep are not trusted, they
+			can be stale.
+
+			:param and_more: launch the other discovery jobs (ports,
+				arping, resolve) on machines found up.
+			:param ping_only: machines of ``machines`` which only get their
+				status updated, even if ``and_more`` is ``True`` (typically
+				the already known ones).
+
+			If the bulk pinger can't be used (no raw socket), fall back to
+			one ping job per machine.
+		"""
+
+		caller    = current_thread().name
+		to_ping   = [ m for m in machines if not m.myself ]
+		ping_only = set(m.mid for m in ping_only or ())
+
+		def more(machine):
+			return and_more and machine.mid not in ping_only
+
+		for machine in machines:
+			if machine.myself:
+				machine.ping_status(True, more(machine))
+
+		if not to_ping:
+			return
+
+		assert ltrace(TRACE_MACHINES, '> %s: bulk_ping(%d machines)' % (
+													caller, len(to_ping)))
+
+		start     = time.time()
+		arp_stale = network.arp_table()
+
+		try:
+			results = network.BulkPinger((m.mid for m in to_ping),
+							rate=settings.licornd.network.scan_rate).run()
+
+		except socket.error, e:
+			logging.warning2(_(u'{0}: cannot bulk ping, falling back to one '
+				u'ping job per machine (was: {1}).').format(caller, e))
+
+			for machine in to_ping:
+				workers.network_enqueue(priorities.LOW, machine.ping,
+												and_more=more(machine))
+			return
+
+		arp_table = network.arp_table()
+		up_count  = 0
+
+		for machine in to_ping:
+			ether = arp_table.get(machine.mid)
+
+			if results.get(machine.mid) is not None:
+				up = True
+
+			else:
+				# no ICMP reply: trust the ARP cache only if the entry is
+				# new (or changed) since the sweep started.
+				up = ether is not None and arp_stale.get(machine.mid) != ether
+
+			if up and ether is not None and machine.ether is None:
+				with machine.lock:
+					machine.ether = ether
+
+			machine.ping_status(up, more(machine))
+
+			if up:
+				up_count += 1
+
+		logging.progress(_(u'{0}: {1} machine(s) up out of {2} scanned '
+			u'in {3:.2f}s.').format(caller, stylize(ST_UGID, up_count),
+				stylize(ST_UGID, len(to_ping)), time.time() - start))
+
+		assert ltrace(TRACE_MACHINES, '< %s: bulk_ping()' % caller)
 	def goodbye_from(self, remote_ips):
 		""" Called from remote `licornd`, when it runs :meth:`announce_shutdown`. """
 
@@ -1149,13 +1255,17 @@ class MachinesController(DictSingleton, CoreController):
 	def ExportCLI(self, selected=None, long_output=False):
 		""" Export the machine accounts list to human readable («passwd») form.
 		"""
+		return u''.join(self.ExportCLI_iter(selected, long_output)) or u'\n'
+	def ExportCLI_iter(self, selected=None, long_output=False):
+		""" Same as :meth:`ExportCLI`, but yield the output machine by
+			machine, for streaming. """
 		if selected is None:
 			mids = self.keys()
 		else:
-			mids = selected
+			mids = list(selected)
 		mids.sort()
 
-		assert ltrace(TRACE_MACHINES, '| ExportCLI(%s)' % mids)
+		assert ltrace(TRACE_MACHINES, '| ExportCLI_iter(%s)' % mids)
 
 		justw=10
 
@@ -1232,19 +1342,23 @@ class MachinesController(DictSingleton, CoreController):
 						]
 			return u'\n'.join(account)
 
-		data = u'\n'.join(map(build_cli_output_machine_data, mids)) + u'\n'
-
-		return data
+		for mid in mids:
+			yield build_cli_output_machine_data(mid) + u'\n'
 	def ExportXML(self, selected=None, long_output=False):
 		""" Export the machine accounts list to XML. """
 
+		return ''.join(self.ExportXML_iter(selected, long_output))
+	def ExportXML_iter(self, selected=None, long_output=False):
+		""" Same as :meth:`ExportXML`, but yield the output machine by
+			machine, for streaming. """
+
 		if selected is None:
 			mids = self.keys()
 		else:
-			mids = selected
+			mids = list(selected)
 		mids.sort()
 
-		assert ltrace(TRACE_MACHINES, '| ExportXML(%s)' % mids)
+		assert ltrace(TRACE_MACHINES, '| ExportXML_iter(%s)' % mids)
 
 		m = self
 
@@ -1264,25 +1378,37 @@ class MachinesController(DictSingleton, CoreController):
 
 			return data + "	</machine>"
 
-		data = "<?xml version='1.0' encoding=\"UTF-8\"?>\n<machines-list>\n" \
-			+ '\n'.join(map(build_xml_output_machine_data, mids)) \
-			+ "\n</machines-list>\n"
+		yield "<?xml version='1.0' encoding=\"UTF-8\"?>\n<machines-list>\n"
 
-		return data
+		separator = ''
+		for mid in mids:
+			yield separator + build_xml_output_machine_data(mid)
+			separator = '\n'
+
+		yield "\n</machines-list>\n"
 	def to_script(self, selected=None, script_format=None, script_separator=None):
 		""" Export the user accounts list to XML. """
 
+		return ''.join(self.to_script_iter(selected, script_format,
+															script_separator))
+	def to_script_iter(self, selected=None, script_format=None, script_separator=None):
+		""" Same as :meth:`to_script`, but yield the output machine by
+			machine. """
+
 		with self.lock:
 			if selected is None:
 				mids = self.keys()
 			else:
-				mids = selected
+				mids = list(selected)
 			mids.sort()
 
-			machines = (self[mid] for mid in mids)
+			machines = [ self[mid] for mid in mids ]
 
-		return script_separator.join(script_format.format(machine=machine, m=machine,
-										self=machine) for machine in machines)
+		separator = ''
+		for machine in machines:
+			yield separator + script_format.format(machine=machine, m=machine,
+																self=machine)
+			separator = script_separator
 	def shutdown(self, mid, warn_users=True):
 		""" Shutdown a machine, after having warned the connected user(s) if
 			asked to."""
@@ -113,15 +113,22 @@ CLI examples
 
 		get task example1
 
+	Or only the tasks which will run in the next hour::
+
+		get tasks --within 3600
+
 
 Developer documentation
 =======================
 
 
 """
-import types, json, calendar, errno, re, gc, sys
+import types, json, calendar, errno, re, gc, sys, bisect
 import time
-from operator   import attrgetter
+from operator    import attrgetter
+from itertools   import islice
+from collections import deque
+from threading   import Lock
 
 from datetime                     import datetime, timedelta
 from dateutil.rrule               import *
@@ -144,6 +151,10 @@ from licorn.daemon.threads        import LicornJobThread
 
 from licorn.foundations.events    import LicornEvent
 
+#: how many occurrences of a task are computed in advance, see
+#: :class:`Occurrences`.
+occurrences_ahead = 16
+
 # ranges of temporal args
 ranges = {
 	'second'  : range(60),
@@ -165,6 +176,117 @@ days = {
 	'*': _('ALL')
 }
 
+class Occurrences(object):
+	""" The upcoming occurrences of a task. The dates generator (and thus its
+		``rrule``, with the exclusion lists) is built once, and consumed
+		:data:`occurrences_ahead` dates at a time after the first one: getting
+		the next date after a run doesn't recompute anything most of the time.
+		The recurrence of a task never changes in place (a modified task is
+		a new :class:`Task`), so there is nothing to invalidate.
+
+		:param dates: a callable returning the dates generator from a given
+			``now``, e.g. :meth:`Task.get_running_dates`.
+
+		.. versionadded:: 1.6.1
+	"""
+	def __init__(self, dates):
+		self.dates = dates
+		self.lock  = Lock()
+
+		self.__dates = None
+		self.__ahead = deque()
+		self.__batch = 1
+
+		# the most recent `now` we were asked for: older dates are dropped.
+		self.__now   = None
+	def next(self, now):
+		""" Return the first occurrence strictly after `now`, or ``None`` if
+			there is none. """
+
+		with self.lock:
+			ahead = self.__ahead
+
+			# dates before `now` could have been dropped already.
+			if self.__dates is None or now < self.__now:
+				self.__restart(now)
+
+			self.__now = now
+			restarted  = False
+
+			while True:
+				while ahead and ahead[0] <= now:
+					ahead.popleft()
+
+				if ahead:
+					self.__batch = occurrences_ahead
+					return ahead[0]
+
+				ahead.extend(islice(self.__dates, self.__batch))
+
+				if not ahead:
+					return None
+
+				if ahead[-1] <= now and not restarted:
+					# we are far behind (the daemon was stopped, the
+					# machine asleep…): start again from now, instead of
+					# walking through all the missed occurrences.
+					self.__restart(now)
+					restarted = True
+	def __restart(self, now):
+		self.__dates = self.dates(now=now)
+		self.__ahead.clear()
+
+		# only one date for the first schedule, which must be quick for all
+		# tasks at (re)load; the others will be needed after the first run.
+		self.__batch = 1
+class ScheduleIndex(object):
+	""" Keys (task IDs) sorted by their next running time, to answer
+		“what runs between A and B” with two bisections instead of looking at
+		every task.
+
+		.. versionadded:: 1.6.1
+	"""
+	def __init__(self):
+		self.lock = Lock()
+
+		# sorted `(time, key)` tuples, and the current time of each key.
+		self.__entries = []
+		self.__times   = {}
+	def __len__(self):
+		return len(self.__entries)
+	def update(self, key, when):
+		""" (Re-)index `key` at `when`; ``None`` removes it. """
+
+		with self.lock:
+			self.__remove(key)
+
+			if when is not None:
+				bisect.insort(self.__entries, (when, key))
+				self.__times[key] = when
+	def remove(self, key):
+		with self.lock:
+			self.__remove(key)
+	def __remove(self, key):
+		try:
+			when = self.__times.pop(key)
+
+		except KeyError:
+			return
+
+		index = bisect.bisect_left(self.__entries, (when, key))
+		del self.__entries[index]
+	def between(self, start, end):
+		""" Return the keys whose time is in [`start`, `end`], by time. """
+
+		with self.lock:
+			first = bisect.bisect_left(self.__entries, (start, ))
+			last  = bisect.bisect_right(self.__entries, (end, sys.maxint))
+
+			return [ key for when, key in self.__entries[first:last] ]
+	def next_time(self):
+		""" Return the time of the first entry, or ``None``. """
+		with self.lock:
+			return self.__entries[0][0] if self.__entries else None
 class Task(CoreStoredObject):
 	"""
 		Create a new Task object.
@@ -189,7 +311,7 @@ class Task(CoreStoredObject):
 	# from upper class, manage what to drop during Pyro pickle
 	_lpickle_ = {
 		'to_drop': [
-				'thread', 'action_func'
+				'thread', 'action_func', 'occurrences'
 			]
 		}
 
@@ -251,6 +373,9 @@ class Task(CoreStoredObject):
 
 		self.neg_to_exclude = []
 
+		#: our upcoming dates, computed from a single dates generator.
+		self.occurrences = Occurrences(self.get_running_dates)
+
 		self.__class__.by_name[self.name] = self.weakref
 
 	def __del__(self):
@@ -400,9 +525,7 @@ class Task(CoreStoredObject):
 		if now is None:
 			now = datetime.now()
 
-		for d in self.get_running_dates():
-			if d > now:
-				return d
+		return self.occurrences.next(now)
 	def get_running_dates(self, now=None):
 		""" generator yield next task occurence.
 		This function massively used the ``rrule`` function from the ``dateutil``
@@ -413,6 +536,9 @@ class Task(CoreStoredObject):
 		# Prepare its kwargs dict.
 		kwargs_rrule = {}
 
+		# filled by check_for_exclusion(), don't accumulate them.
+		self.neg_to_exclude = []
+
 		if now is None:
 			now = datetime.now()
 
@@ -656,6 +782,8 @@ class Task(CoreStoredObject):
 
 			self.scheduled = True
 
+			self.controller.schedule_index.update(self.id, running_time)
+
 		return self.scheduled
 
 	def stop(self):
@@ -912,6 +1040,9 @@ class TasksController(DictSingleton, CoreController, SelectableController):
 		self.threads_by_task_id = {}
 		self.threads = []
 
+		#: task IDs by next running time, see :meth:`upcoming`.
+		self.schedule_index = ScheduleIndex()
+
 		#self.load()
 
 		events.collect(self)
@@ -1060,6 +1191,16 @@ class TasksController(DictSingleton, CoreController, SelectableController):
 				LicornEvent('task_added', task=task).emit(priorities.LOW)
 
 			return task
+	def upcoming(self, delay, now=None):
+		""" Return the tasks which will run in the next `delay` seconds,
+			ordered by running time. """
+
+		if now is None:
+			now = datetime.now()
+
+		with self.lock:
+			return [ self[task_id] for task_id in self.schedule_index.between(
+									now, now + timedelta(seconds=delay)) ]
 	def get_next_unset_id(self):
 		# TODO: use settings.core.tasks.max_tasks
 		return pyutils.next_free(self.keys(), 0, 65535)
@@ -1081,6 +1222,7 @@ class TasksController(DictSingleton, CoreController, SelectableController):
 
 			# cancel it from the scheduler
 			task.stop()
+			self.schedule_index.remove(task.id)
 
 			# del its reference
 			del self[task.id].__class__.by_name[task.name]
@@ -18,7 +18,7 @@ from licorn.foundations        import logging, exceptions, process, fsapi
 from licorn.foundations.ltrace import lprint
 
 from licorn.core       import LMC
-from licorn.core.tasks import TasksController, Task
+from licorn.core.tasks import TasksController, Task, Occurrences, ScheduleIndex
 
 def tasks(method_name, *args, **kwargs):
 	try:
@@ -1085,6 +1085,50 @@ def test_massive():
 			if task != None:
 				tasks('del_task', task.id)
 
+def test_occurrences():
+	start   = datetime(2012, 1, 1)
+	created = []
 
+	def dates(now):
+		created.append(now)
+		d = now.replace(minute=0, second=0) + timedelta(hours=1)
+		while d < datetime(2012, 2, 1):
+			yield d
+			d += timedelta(hours=1)
 
+	occ = Occurrences(dates)
 
+	assert occ.next(start) == datetime(2012, 1, 1, 1)
+	assert occ.next(datetime(2012, 1, 1, 1)) == datetime(2012, 1, 1, 2)
+
+	# no new generator while going forward...
+	assert len(created) == 1
+
+	# ...but a new one when asked for an older date.
+	assert occ.next(start) == datetime(2012, 1, 1, 1)
+	assert len(created) == 2
+
+	# far behind: restart from now instead of walking all the dates.
+	assert occ.next(datetime(2012, 1, 3, 5, 30)) == datetime(2012, 1, 3, 6)
+	assert len(created) == 3
+
+	assert occ.next(datetime(2013, 1, 1)) is None
+def test_schedule_index():
+	now   = datetime(2012, 1, 1)
+	index = ScheduleIndex()
+
+	index.update(1, now + timedelta(minutes=30))
+	index.update(2, now + timedelta(minutes=5))
+	index.update(3, now + timedelta(hours=2))
+
+	assert index.between(now, now + timedelta(hours=1)) == [ 2, 1 ]
+
+	# re-indexing moves the task.
+	index.update(2, now + timedelta(hours=3))
+	assert index.between(now, now + timedelta(hours=1)) == [ 1 ]
+
+	index.remove(1)
+	index.update(3, None)
+
+	assert len(index) == 1
+	assert index.between(now, now + timedelta(days=1)) == [ 2 ]
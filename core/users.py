@@ -12,6 +12,8 @@ Licorn core: users - http://docs.licorn.org/core/users.html
 
 import os, sys, time, re, gc, weakref
 
+from threading  import Thread
+from Queue      import Queue
 from operator   import attrgetter
 from traceback  import print_exc
 
@@ -29,7 +31,8 @@ from licorn.foundations.constants import filters, backend_actions, distros, \
 from licorn.core                import LMC
 from licorn.core.groups         import Group
 from licorn.core.classes        import SelectableController, CoreFSController, \
-										CoreStoredObject, CoreFSUnitObject
+										CoreStoredObject, CoreFSUnitObject, \
+										IdAllocatingController
 
 import types
 
@@ -694,6 +697,59 @@ class User(CoreStoredObject, CoreFSUnitObject):
 			del self.__cg_precalc_small
 		except:
 			pass
+	def _needs_rebuild(self, data):
+		""" Return ``True`` if backend ``data`` (see
+			:meth:`~licorn.core.backends.shadow.ShadowBackend.load_Users_data`)
+			changes attributes which cannot be updated in place (login,
+			primary GID, home directory). The user object must then be
+			rebuilt by the controller. """
+
+		return data['login'] != self.__login \
+			or data['gidNumber'] != self.__gidNumber \
+			or self._resolve_home_directory(
+					data['homeDirectory']) != self.__homeDirectory
+	def _update_from_backend(self, data):
+		""" Update the current user in place from backend ``data``, which has
+			just been read from the backend and thus must not be serialized
+			back. Emit the same events as the property setters would.
+
+			:return: the list of changed attribute names (empty if the
+				user is unchanged).
+		"""
+
+		changed = []
+
+		with self.lock:
+			# the defaults are the same as in :meth:`__init__`.
+			for attr, default in (('gecos', None), ('loginShell', None),
+								('userPassword', None),
+								('shadowLastChange', 0), ('shadowInactive', 0),
+								('shadowWarning', 7), ('shadowExpire', 0),
+								('shadowMin', 0), ('shadowMax', 99999),
+								('shadowFlag', '')):
+				private = '_User__' + attr
+				value   = data[attr] if default is None else data[attr] or default
+
+				if value != getattr(self, private):
+					setattr(self, private, value)
+					changed.append(attr)
+
+			if changed:
+				self._cli_invalidate()
+
+				if 'userPassword' in changed:
+					locked = self.__resolve_locked_state()
+
+					if locked != self.__locked:
+						self.__locked = locked
+						changed.append('locked')
+
+		for attr in ('gecos', 'loginShell', 'userPassword', 'locked'):
+			if attr in changed:
+				LicornEvent('user_%s_changed' % attr,
+								user=self.proxy).emit(priorities.LOW)
+
+		return changed
 	def serialize(self, backend_action=backend_actions.UPDATE):
 		""" Save group data to originating backend. """
 
@@ -1214,7 +1270,8 @@ class User(CoreStoredObject, CoreFSUnitObject):
 		return d
 	def to_JSON(self):
 			return json.dumps(self.to_WMI())
-class UsersController(DictSingleton, CoreFSController, SelectableController):
+class UsersController(DictSingleton, IdAllocatingController, CoreFSController,
+														SelectableController):
 	""" Handle global operations on unit User objects,
 		from a system-wide perspective.
 	"""
@@ -1305,11 +1362,20 @@ class UsersController(DictSingleton, CoreFSController, SelectableController):
 
 		if send_event:
 			LicornEvent('users_reloaded', users=self).emit(synchronous=True)
-	def reload_backend(self, backend):
-		""" Reload only one backend data (called from inotifier). """
+	def reload_backend(self, backend, incremental=False):
+		""" Reload only one backend data (called from inotifier).
+
+			:param incremental: if ``True`` and the backend implements
+				``load_Users_data()``, diff the backend data with the
+				current users and only create, update or delete the ones
+				which changed. See :meth:`__reload_backend_incremental`.
+		"""
 
 		assert ltrace(TRACE_USERS, '| reload_backend(%s)' % backend.name)
 
+		if incremental and hasattr(backend, 'load_Users_data'):
+			return self.__reload_backend_incremental(backend)
+
 		loaded = []
 
 		assert ltrace(TRACE_LOCKS, '| users.reload_backend enter %s' % self.lock)
@@ -1342,6 +1408,89 @@ class UsersController(DictSingleton, CoreFSController, SelectableController):
 			LMC.groups.reload_backend(backend)
 
 		assert ltrace(TRACE_LOCKS, '| users.reload_backend exit %s' % self.lock)
+	def __reload_backend_incremental(self, backend):
+		""" Diff the backend data with the in-memory users: build only new
+			users, update changed ones in place (see
+			:meth:`User._update_from_backend`), delete the disappeared ones,
+			and emit one event per affected user. Unchanged users are not
+			touched at all, which makes a one-line change in a big
+			:file:`/etc/passwd` cheap.
+
+			The groups controller is reloaded only if users links to groups
+			could have changed (users added, deleted or rebuilt).
+		"""
+
+		assert ltrace_func(TRACE_USERS)
+
+		added, updated, deleted = 0, 0, 0
+		relink  = False
+		rebuilt = False
+		seen    = set()
+
+		with self.lock:
+			for uid, data in backend.load_Users_data():
+				seen.add(uid)
+
+				try:
+					user = self[uid]
+
+				except KeyError:
+					user = User(backend=backend, **data)
+					self[uid] = user
+					added += 1
+					relink = True
+
+					try:
+						user.primaryGroup = LMC.groups[user.gidNumber]
+
+					except KeyError:
+						# the group is not yet loaded, it will link the
+						# user when it is.
+						pass
+
+					LicornEvent('user_added', user=user.proxy).emit(priorities.LOW)
+					continue
+
+				if user.backend.name != backend.name or user._needs_rebuild(data):
+					if user.backend.name != backend.name:
+						logging.warning2(_(u'{0}.reload: Overwritten uid {1}.').format(
+											stylize(ST_NAME, self.name), uid))
+
+					user = User(backend=backend, **data)
+					self[uid] = user
+					updated += 1
+					rebuilt = True
+
+					LicornEvent('user_changed', user=user.proxy).emit(priorities.LOW)
+					continue
+
+				if user._update_from_backend(data):
+					updated += 1
+					LicornEvent('user_changed', user=user.proxy).emit(priorities.LOW)
+
+			for uid, user in self.items():
+				if user.backend.name == backend.name and uid not in seen:
+					logging.progress(_(u'{0}: removing disapeared user '
+						u'{1}.').format(stylize(ST_NAME, self.name),
+							stylize(ST_LOGIN, user.login)))
+
+					self.del_User(user, batch=True, force=True)
+					deleted += 1
+					relink = True
+
+			if rebuilt:
+				# groups hold links to the old objects, they must all be
+				# set up again.
+				LMC.groups.reload_backend(backend)
+
+			elif relink:
+				# new members can appear in groups which didn't
+				# know them at the time they were loaded.
+				LMC.groups.reload_backend(backend, incremental=True)
+
+		logging.progress(_(u'{0}: incremental reload from {1}: {2} added, '
+			u'{3} updated, {4} deleted.').format(stylize(ST_NAME, self.name),
+				stylize(ST_NAME, backend.name), added, updated, deleted))
 	def serialize(self, user=None):
 		""" Write the user data in appropriate system files."""
 
@@ -1594,15 +1743,105 @@ class UsersController(DictSingleton, CoreFSController, SelectableController):
 				'login, or use the --force argument if you really want '
 				'to add this user on the system.').format(
 					stylize(ST_LOGIN, login)))
+	def __resolve_profile(self, profile, primary_group, shell, skel):
+		""" Compute the shell, skel, primary group and additional groups of a
+			new account, from its profile (if any). Explicit `shell` and
+			`skel` take precedence. """
+
+		skel_to_apply = LMC.configuration.users.default_skel or None
+		groups        = []
+
+		if profile is not None:
+
+			if type(profile) == types.IntType:
+				profile = LMC.profiles.by_gid(profile)
+
+			loginShell    = profile.profileShell
+			skel_to_apply = profile.profileSkel
+			primary_group = profile.group
+
+			groups.extend(profile.groups)
+
+		else:
+			logging.warning2('>> FIXME: UsersController.add_User: skel for '
+				'standard group ? system group ?', to_listener=False, to_local=True)
+
+			loginShell = LMC.configuration.users.default_shell
+
+			if primary_group:
+				if primary_group.is_standard:
+					skel_to_apply = primary_group.groupSkel
+
+				# implicit: else: primary_group is system
+				# no default skel to apply
+
+			else:
+				# get the primary group real object anyway, we need to
+				# link the user to it.
+				primary_group = LMC.groups.by_gid(
+								LMC.configuration.users.default_gid)
+
+		# overwrite default data with command-line specified ones.
+		if shell is not None:
+			loginShell = shell
+
+		if skel is not None:
+			skel_to_apply = skel
+
+		return loginShell, skel_to_apply, primary_group, groups
+	def __resolve_memberships(self, login, groups, primary_group):
+		""" Resolve the additional groups of a new account (objects or
+			GIDs), without duplicates nor its primary group, and check they
+			don't conflict: an account cannot be asked to be a standard
+			member, responsible or guest of the same group at the same time.
+
+			Used by :meth:`add_Users` to refuse a batch before creating
+			anything, instead of failing on
+			:meth:`~licorn.core.groups.Group.add_Users` once the accounts
+			exist. """
+
+		resolved = []
+		roles    = {}
+
+		for group in groups:
+			if type(group) == types.IntType:
+				try:
+					group = LMC.groups.by_gid(group)
+
+				except KeyError:
+					raise exceptions.DoesntExistException(_(u'group {0} '
+						u'does not exist.').format(stylize(ST_UGID, group)))
+
+			if group.gidNumber == primary_group.gidNumber \
+													or group in resolved:
+				continue
+
+			resolved.append(group)
+
+			if group.is_standard:
+				roles.setdefault(group.name, []).append(group)
+
+			elif group.is_helper:
+				roles.setdefault(group.standard_group.name, []).append(group)
+
+		for name, wanted in roles.iteritems():
+			if len(wanted) > 1:
+				raise exceptions.BadArgumentError(_(u'{0} cannot be a '
+					u'member of {1} at the same time.').format(
+						stylize(ST_LOGIN, login),
+						u', '.join(stylize(ST_NAME, group.name)
+									for group in wanted)))
+
+		return resolved
 	def _generate_uid(self, login, desired_uid, system):
 		# generate an UID if None given, else verify it matches constraints.
 		if desired_uid is None:
 			if system:
-				uid = pyutils.next_free(self.keys(),
+				uid = self._free_id(
 					LMC.configuration.users.system_uid_min,
 					LMC.configuration.users.system_uid_max)
 			else:
-				uid = pyutils.next_free(self.keys(),
+				uid = self._free_id(
 					LMC.configuration.users.uid_min,
 					LMC.configuration.users.uid_max)
 
@@ -1667,45 +1906,12 @@ class UsersController(DictSingleton, CoreFSController, SelectableController):
 
 			groups_to_add_user_to = in_groups or []
 
-			skel_to_apply = LMC.configuration.users.default_skel or None
 			homeDirectory = self.__validate_home_dir(home, login, system, force)
 
-			if profile is not None:
+			loginShell, skel_to_apply, primary_group, profile_groups = \
+				self.__resolve_profile(profile, primary_group, shell, skel)
 
-				if type(profile) == types.IntType:
-					profile = LMC.profiles.by_gid(profile)
-
-				loginShell    = profile.profileShell
-				skel_to_apply = profile.profileSkel
-				primary_group = profile.group
-
-				groups_to_add_user_to.extend(profile.groups)
-
-			else:
-				logging.warning2('>> FIXME: UsersController.add_User: skel for '
-					'standard group ? system group ?', to_listener=False, to_local=True)
-
-				loginShell = LMC.configuration.users.default_shell
-
-				if primary_group:
-					if primary_group.is_standard:
-						skel_to_apply = primary_group.groupSkel
-
-					# implicit: else: primary_group is system
-					# no default skel to apply
-
-				else:
-					# get the primary group real object anyway, we need to
-					# link the user to it.
-					primary_group = LMC.groups.by_gid(
-									LMC.configuration.users.default_gid)
-
-			# overwrite default data with command-line specified ones.
-			if shell is not None:
-				loginShell = shell
-
-			if skel is not None:
-				skel_to_apply = skel
+			groups_to_add_user_to.extend(profile_groups)
 
 			create_kwargs = dict(uidNumber=uid,
 								login=login,
@@ -1798,6 +2004,255 @@ class UsersController(DictSingleton, CoreFSController, SelectableController):
 		# we always return a `proxy`, not the real object, to avoid too many
 		# strong references anywhere, which produce strange things like #769.
 		return user.proxy, password
+	def add_Users(self, accounts, backend=None, force=False,
+								force_badname=False, workers=None):
+		""" Create a batch of standard user accounts at once (massive
+			imports). This is much faster than one :meth:`add_User` call per
+			account:
+
+			- all accounts are validated before anything is created,
+			  including their group memberships. If any of them is invalid,
+			  nothing is created at all and a
+			  :class:`~licorn.foundations.exceptions.BadArgumentError`
+			  listing all the errors is raised.
+			- the accounts are created in memory and written to the backend
+			  all at once. If this fails, they are removed from the controller
+			  and the batch is cancelled. If anything fails after that (an
+			  extension, a group membership), the created accounts are
+			  deleted before the exception is raised again.
+			- home directories and skels are created by a pool of `workers`
+			  threads (default: :obj:`settings.core.users.import_workers`).
+			  A failure there is only reported, the next check will repair it.
+			- group memberships are added one group at a time, and each
+			  group is saved only once.
+
+			:param accounts: a list of dicts holding :meth:`add_User`
+				arguments: ``login``, ``password``, ``gecos``, ``firstname``,
+				``lastname``, ``profile``, ``primary_group``, ``in_groups``,
+				``shell`` and ``skel``.
+			:returns: a list of ``(user proxy, password)`` tuples, in the
+				order of `accounts`.
+
+			.. versionadded:: 1.6.1
+		"""
+
+		assert ltrace_func(TRACE_USERS)
+
+		if backend is None:
+			backend = self._prefered_backend
+
+		if workers is None:
+			workers = settings.core.users.import_workers
+
+		start   = time.time()
+		errors  = []
+		batch   = []
+		logins  = set()
+
+		# Step 1: validate everything, without creating anything.
+		with self.lock:
+			for index, account in enumerate(accounts):
+				try:
+					login, firstname, lastname, gecos, shell, skel = \
+						self.__validate_basic_fields(account.get('login'),
+							force_badname, account.get('firstname'),
+							account.get('lastname'), account.get('gecos'),
+							account.get('shell'), account.get('skel'))
+
+					if login in logins:
+						raise exceptions.AlreadyExistsError(_(u'login {0} '
+							u'appears more than once in the batch.').format(
+								stylize(ST_LOGIN, login)))
+
+					self.__validate_important_fields(None, login, False, force)
+
+					homeDirectory = self.__validate_home_dir(None, login,
+																False, force)
+
+					loginShell, skel_to_apply, primary_group, profile_groups = \
+						self.__resolve_profile(account.get('profile'),
+											account.get('primary_group'),
+											shell, skel)
+
+					groups = self.__resolve_memberships(login,
+									(account.get('in_groups') or [])
+										+ profile_groups, primary_group)
+
+				except exceptions.LicornException, e:
+					errors.append(_(u'account #{0}: {1}').format(index + 1, e))
+					continue
+
+				logins.add(login)
+
+				batch.append(Enumeration(login=login, gecos=gecos,
+									password=account.get('password'),
+									homeDirectory=homeDirectory,
+									loginShell=loginShell,
+									skel=skel_to_apply,
+									primary_group=primary_group,
+									groups=groups))
+
+		if errors:
+			raise exceptions.BadArgumentError(_(u'{0} invalid account(s), '
+				u'nothing was created:\n{1}').format(len(errors),
+													u'\n'.join(errors)))
+
+		# Step 2: create the accounts in memory, then save them at once.
+		created = []
+
+		with self.lock:
+			try:
+				for entry in batch:
+					uid = self._generate_uid(entry.login, None, False)
+
+					if entry.password is None:
+						entry.password = hlstr.generate_password(
+									LMC.configuration.users.min_passwd_size)
+
+					LicornEvent('user_pre_add', uid=uid, login=entry.login,
+									system=False, password=entry.password
+									).emit(synchronous=True)
+
+					created.append(User(uidNumber=uid,
+										login=entry.login,
+										gecos=entry.gecos,
+										password=entry.password,
+										primaryGroup=entry.primary_group,
+										loginShell=entry.loginShell,
+										homeDirectory=entry.homeDirectory,
+										inotified=True,
+										backend=backend,
+										initialyLocked=False))
+
+					self[uid] = created[-1]
+
+				backend.create_Users(created)
+
+			except:
+				logging.warning(_(u'{0}: batch creation failed, removing the '
+					u'{1} account(s) already created.').format(
+						stylize(ST_NAME, self.name), len(created)))
+
+				for user in created:
+					if user.uidNumber in self:
+						del self[user.uidNumber]
+
+				del created[:]
+				gc.collect()
+				raise
+
+		saved = time.time()
+
+		# Step 3: homes and skels, in parallel. Each user has its own lock.
+		jobs = Queue()
+
+		def check_worker():
+			while True:
+				job = jobs.get()
+
+				if job is None:
+					return
+
+				user, skel_to_apply = job
+
+				try:
+					user.check(initial=True, minimal=True,
+								skel_to_apply=skel_to_apply, batch=True,
+								full_display=False)
+
+				except Exception, e:
+					logging.warning(_(u'{0}: could not setup the home of {1}, '
+						u'it will be repaired by next check (was: {2}).').format(
+							stylize(ST_NAME, self.name),
+							stylize(ST_LOGIN, user.login), e))
+
+		for user, entry in zip(created, batch):
+			jobs.put((user, entry.skel))
+
+		threads = []
+
+		for index in range(max(1, min(workers, len(created)))):
+			thread = Thread(target=check_worker, name='add_Users-%s' % index)
+			thread.daemon = True
+			thread.start()
+			threads.append(thread)
+
+		for thread in threads:
+			jobs.put(None)
+
+		for thread in threads:
+			thread.join()
+
+		checked = time.time()
+
+		# From here, the accounts exist in the backend: if anything fails,
+		# delete them, to leave the system as it was before the batch.
+		try:
+			for user, entry in zip(created, batch):
+				# Fired after the check, like in add_User(). With `batch`,
+				# handlers can defer their work to `users_post_add`.
+				LicornEvent('user_post_add', user=user.proxy,
+										password=entry.password,
+										batch=True).emit(synchronous=True)
+
+			# Handlers do their deferred work at once, and can add a line to
+			# our summary.
+			summary = []
+
+			LicornEvent('users_post_add',
+							users=[ user.proxy for user in created ],
+							summary=summary).emit(synchronous=True)
+
+			extended = time.time()
+
+			# Step 4: memberships, group by group.
+			members = {}
+
+			for user, entry in zip(created, batch):
+				for group in entry.groups:
+					members.setdefault(group.gidNumber, (group, []))[1].append(user)
+
+			for group, users in members.itervalues():
+				group.add_Users(users, batch=True, emit_event=False)
+
+		except:
+			# keep it, the deletions could replace it.
+			exc_info = sys.exc_info()
+
+			logging.warning(_(u'{0}: batch creation failed, deleting the '
+				u'{1} account(s) already created.').format(
+					stylize(ST_NAME, self.name), len(created)))
+
+			for user in created:
+				try:
+					self.del_User(user, no_archive=True, batch=True)
+
+				except Exception, e:
+					logging.warning(_(u'{0}: could not delete {1} (was: '
+						u'{2}).').format(stylize(ST_NAME, self.name),
+							stylize(ST_LOGIN, user.login), e))
+
+			raise exc_info[0], exc_info[1], exc_info[2]
+
+		for user in created:
+			LicornEvent('user_added', user=user.proxy).emit(priorities.LOW)
+
+		duration = time.time() - start
+
+		logging.notice(_(u'Created {0} standard users in backend {1} in '
+			u'{2:.2f}s ({3:.1f} accounts/s; save: {4:.2f}s, homes: {5:.2f}s '
+			u'with {6} workers, extensions: {7:.2f}s, groups and events: '
+			u'{8:.2f}s).{9}').format(
+				stylize(ST_UGID, len(created)), backend.pretty_name,
+				duration, len(created) / duration if duration else 0,
+				saved - start, checked - saved, len(threads),
+				extended - checked, time.time() - extended,
+				u''.join(u'\n\t' + line for line in summary)))
+
+		assert ltrace_func(TRACE_USERS, True)
+
+		return [ (user.proxy, entry.password)
+					for user, entry in zip(created, batch) ]
 	def del_User(self, user, no_archive=False, force=False, batch=False):
 		""" Delete a user. """
 
@@ -1978,19 +2433,28 @@ class UsersController(DictSingleton, CoreFSController, SelectableController):
 	def to_XML(self, selected=None, long_output=False):
 		""" Export the user accounts list to XML. """
 
+		return ''.join(self.to_XML_iter(selected, long_output))
+	def to_XML_iter(self, selected=None, long_output=False):
+		""" Same as :meth:`to_XML`, but yield the output piece by piece
+			(one piece per user), for streaming. """
+
 		with self.lock:
 			if selected is None:
-				users = self
+				users = self.values()
 			else:
-				users = selected
+				users = list(selected)
+
+			assert ltrace(TRACE_USERS, '| to_XML_iter(%r)' % users)
 
-			assert ltrace(TRACE_USERS, '| to_XML(%r)' % users)
+		yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+				'<users-list>\n')
 
-		return ('<?xml version="1.0" encoding="UTF-8"?>\n'
-					'<users-list>\n'
-					'%s\n'
-					'</users-list>\n') % '\n'.join(
-						user.to_XML() for user in users)
+		separator = ''
+		for user in users:
+			yield separator + user.to_XML()
+			separator = '\n'
+
+		yield '\n</users-list>\n'
 	def to_JSON(self, selected=None):
 		""" Export the user accounts list to XML. """
 
@@ -2006,14 +2470,21 @@ class UsersController(DictSingleton, CoreFSController, SelectableController):
 	def to_script(self, selected=None, script_format=None, script_separator=None):
 		""" Export the user accounts list to XML. """
 
+		return ''.join(self.to_script_iter(selected, script_format,
+															script_separator))
+	def to_script_iter(self, selected=None, script_format=None, script_separator=None):
+		""" Same as :meth:`to_script`, but yield the output user by user. """
+
 		with self.lock:
 			if selected is None:
-				users = self
+				users = self.values()
 			else:
-				users = selected
+				users = list(selected)
 
-		return script_separator.join(script_format.format(user=user, u=user, self=user)
-															for user in users)
+		separator = ''
+		for user in users:
+			yield separator + script_format.format(user=user, u=user, self=user)
+			separator = script_separator
 	def chk_Users(self, users_to_check=[], minimal=True, batch=False,
 														auto_answer=None):
 		"""Check user accounts and account data consistency."""
@@ -2069,6 +2540,12 @@ class UsersController(DictSingleton, CoreFSController, SelectableController):
 	def _cli_get(self, selected=None, long_output=False, no_colors=False):
 		""" Export the user accounts list to human readable («passwd») form. """
 
+		return ''.join(self._cli_get_iter(selected, long_output,
+															no_colors)) or '\n'
+	def _cli_get_iter(self, selected=None, long_output=False, no_colors=False):
+		""" Same as :meth:`_cli_get`, but yield the output user by user. The
+			lock is held only to sort the selection, not while rendering. """
+
 		with self.lock:
 
 			if selected is None:
@@ -2076,13 +2553,13 @@ class UsersController(DictSingleton, CoreFSController, SelectableController):
 			else:
 				users = selected
 
-			users.sort()
+			users = sorted(users, key=attrgetter('uid'))
 
-			assert ltrace(TRACE_USERS, '| _cli_get(%r)' % users)
+			assert ltrace(TRACE_USERS, '| _cli_get_iter(%r)' % users)
 
-			# FIXME: forward long_output, or remove it.
-			return '%s\n' % '\n'.join((user._cli_get()
-							for user in sorted(users, key=attrgetter('uid'))))
+		# FIXME: forward long_output, or remove it.
+		for user in users:
+			yield user._cli_get() + '\n'
 
 	@events.handler_method
 	def user_pre_del(self, *args, **kwargs):
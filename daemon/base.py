@@ -210,6 +210,17 @@ class LicornBaseDaemon:
 			'licornd.threads.network.min'     : 12,
 			'licornd.threads.network.max'     : 80,
 
+			# Pyro request handlers. Idle CLI / WMI / peer daemon connections
+			# don't hold one; over the max, calls wait in a queue.
+			'licornd.threads.pyro.min'        : 2,
+			'licornd.threads.pyro.max'        : 32,
+
+			# Workers kept for HIGH priority jobs (interactive operations),
+			# whatever the load of lower priority ones.
+			'licornd.threads.aclcheck.reserved' : 1,
+			'licornd.threads.service.reserved'  : 2,
+			'licornd.threads.network.reserved'  : 4,
+
 			# Wipe dead thread every 10 minutes
 			'licornd.threads.wipe_time'       : 600,
 
@@ -220,12 +231,24 @@ class LicornBaseDaemon:
 			#'licornd.socket_path'             : '/var/run/licornd.sock',
 
 			'licornd.buffer_size'             : 16*1024,
+
+			# `get` commands send their output to the CLI by chunks of
+			# this size, while rendering it. 0: all output in one message.
+			'licornd.output_chunk_size'       : 64*1024,
 			'licornd.log_file'                : '/var/log/licornd.log',
 			'licornd.pid_file'                : '/var/run/licornd.pid',
 
 			# the inotifier on users/groups is enabled by default
 			'licornd.inotifier.enabled'       : True,
 
+			# fast checks triggered by inotify events are merged during
+			# this delay (in seconds); bursts of more than `coalesce_burst`
+			# paths in a directory become one check of the directory, and
+			# no more than `coalesce_max` paths are remembered per home.
+			'licornd.inotifier.coalesce_delay' : 0.5,
+			'licornd.inotifier.coalesce_burst' : 64,
+			'licornd.inotifier.coalesce_max'   : 10000,
+
 			# We scan the LANs connected to each network interface
 			'licornd.network.lan_scan'        : True,
 
@@ -233,6 +256,10 @@ class LicornBaseDaemon:
 			# e.g if if is not a private LAN (10.*.*.*, 172.16.*.*, 192.168.*.*)
 			'licornd.network.lan_scan_public' : False,
 
+			# The LAN scan sends at most this number of ICMP echo requests
+			# per second (one raw socket for the whole scan).
+			'licornd.network.scan_rate'       : 500,
+
 			# ==================================================== WMI settings
 			'licornd.wmi.enabled'          : True,
 			'licornd.wmi.group'            : 'licorn-wmi',
@@ -322,7 +349,11 @@ class LicornBaseDaemon:
 				(settings.licornd.threads.network.min,  2,   24,
 									'licornd.threads.network.min'),
 				(settings.licornd.threads.network.max,  32,  160,
-									'licornd.threads.network.max')
+									'licornd.threads.network.max'),
+				(settings.licornd.threads.pyro.min,     1,   8,
+									'licornd.threads.pyro.min'),
+				(settings.licornd.threads.pyro.max,     8,   128,
+									'licornd.threads.pyro.max')
 				):
 			if directive < vmin or directive > vmax:
 				err_message += ('\n\tinvalid value %s for configuration '
@@ -2,7 +2,10 @@
 """
 Licorn Daemon Cache.
 The cache centralize data coming from and going to other threads (ACLChecker, Inotifier, Searcher).
-It is built on top of a SQLite database.
+It is built on top of a SQLite database, in WAL mode: the :class:`Cache`
+thread is the only writer, and applies queued writes in batched transactions,
+while every other thread reads through its own connection, without waiting
+for the writer.
 
 Copyright (C) 2007-2009 Olivier Cortès <olive@deep-ocean.net>
 Licensed under the terms of the GNU GPL version 2.
@@ -11,10 +14,12 @@ Licensed under the terms of the GNU GPL version 2.
 import os, xattr, stat, re
 import sqlite3 as sqlite
 
-from Queue              import Queue
-from threading          import Thread, Event
+from Queue              import Queue, Empty
+from threading          import Thread, Event, local
 
 from licorn.foundations         import logging, exceptions, styles, fsapi
+from licorn.foundations.ltrace  import *
+from licorn.foundations.ltraces import *
 from licorn.daemon              import cache_path
 
 # FIXME: convert this to LicornThread.
@@ -26,8 +31,21 @@ class Cache(Thread):
 	_dbfname      = ''
 	_db           = None
 	_cursor       = None
+
+	#: writes waiting for the writer thread. Each item is a list of
+	#: ``(request, arguments)`` applied in the same transaction.
 	_queue        = Queue()
 
+	#: set when the database exists and has its tables, e.g. when readers
+	#: can connect to it.
+	_ready        = Event()
+
+	#: per-thread read connections.
+	_readers      = local()
+
+	#: the writer groups up to this number of statements in one transaction.
+	batch_size    = 1000
+
 	def __init__(self, daemon, allkeywords=None, dbfname=cache_path):
 		assert ltrace(TRACE_CACHE, '| Cache.__init__()')
 
@@ -45,19 +63,42 @@ class Cache(Thread):
 				Cache.allkeywords = allkeywords
 
 		Cache._dbfname = dbfname
+
+		# keywords changes made by the controller come here directly.
+		Cache.allkeywords.cache = self
 	def stop(self):
 		"""Stop this thread."""
 		if not Cache._stop_event.isSet():
 			logging.progress("%s: stopping thread." % (self.getName()))
 			Cache._stop_event.set()
-			Cache._queue.put((None, None, None))
+			Cache._queue.put(None)
 	def status(self):
 		""" Return statistics as a sequence. """
 
-		knb = self.select('SELECT COUNT(*) FROM keywords;')
-		fnb = self.select('SELECT COUNT(*) FROM files;')
+		knb = self.select('SELECT COUNT(*) FROM keywords;')[0][0]
+		fnb = self.select('SELECT COUNT(*) FROM files;')[0][0]
 
 		return (knb, fnb)
+	def __connect(self):
+		""" Return a new connection to the database. """
+
+		db = sqlite.connect(Cache._dbfname, timeout=30.0)
+		# prevent string conversion errors from database when filenames are not UTF-8 encoded.
+		db.text_factory = str
+
+		return db
+	def __reader(self):
+		""" Return the read connection of the current thread, creating it
+			if needed. In WAL mode, reads don't block on the writer (nor
+			the writer on them). """
+
+		try:
+			return Cache._readers.db
+
+		except AttributeError:
+			Cache._ready.wait()
+			Cache._readers.db = self.__connect()
+			return Cache._readers.db
 	def setupAndConnectDB(self):
 		""" Create database if needed, or update keywords table if needed, and vacuum some obsolete records if needed. """
 
@@ -66,13 +107,15 @@ class Cache(Thread):
 			os.makedirs(d)
 		del d
 
-		Cache._db     = sqlite.connect(Cache._dbfname)
-		# prevent string conversion errors from database when filenames are not UTF-8 encoded.
-		Cache._db.text_factory = str
-
+		Cache._db     = self.__connect()
 		Cache._cursor = Cache._db.cursor()
 		c             = Cache._cursor
 
+		# WAL is persistent, but setting it again costs nothing. NORMAL is
+		# safe with WAL (a crash can only loose the last transactions).
+		c.execute('PRAGMA journal_mode=WAL;')
+		c.execute('PRAGMA synchronous=NORMAL;')
+
 		syskw = Cache.allkeywords.keywords.keys() # just a speedup
 
 		try:
@@ -136,12 +179,19 @@ class Cache(Thread):
 		c.execute('DELETE FROM k_on_f WHERE kid NOT IN ( SELECT kid FROM keywords );')
 		logging.progress("%s: Removed %d obsolete rows from cache database." % (self.getName(), c.rowcount))
 
-		try: c.execute('COMMIT;')
-		except: pass
+		# created here and not with the tables, for databases created by
+		# older versions. query() and removeEntry() rely on them.
+		c.executescript('''
+	CREATE INDEX IF NOT EXISTS files_fname ON files(fname);
+	CREATE INDEX IF NOT EXISTS k_on_f_kid ON k_on_f(kid);''')
+
+		Cache._db.commit()
+		Cache._ready.set()
 
 		logging.progress('%s: keywords loaded.' % self.getName())
 	def run(self):
-		""" Set up database if needed and wait for any request in the queue."""
+		""" Set up database if needed and apply the writes queued by other
+			threads, many of them in each transaction. """
 
 		self.setupAndConnectDB()
 
@@ -153,32 +203,72 @@ class Cache(Thread):
 
 		while not s.isSet():
 
-			# then process every action
-			request, arguments, result = q.get()
+			statements = q.get()
+
+			if statements is None:
+				continue
 
-			assert logging.debug2('%s: executing %s %s.' % (self.getName(), request, arguments))
+			# gather what is already waiting, to commit it all at once.
+			while len(statements) < Cache.batch_size:
+				try:
+					more = q.get_nowait()
 
-			if request != None:
-				c.execute(request, arguments)
-				if result:
-					for record in c:
-						result.put(record)
-					assert logging.debug('%s: terminating request result.' % self.getName())
-					result.put(False)
+				except Empty:
+					break
+
+				if more is None:
+					break
+
+				statements.extend(more)
+
+			assert logging.debug2('%s: writing %d statements.' % (
+											self.getName(), len(statements)))
+
+			try:
+				with Cache._db:
+					for request, arguments in statements:
+						c.execute(request, arguments)
+
+			except sqlite.Error, e:
+				logging.warning('%s: cannot write %d statements to cache '
+					'(was: %s).' % (self.getName(), len(statements), e))
 
 		Cache._db.close()
 		logging.progress("%s: thread ended." % (self.getName()))
 	def select(self, request, arguments = None):
-		""" Execute a SELECT statement.
-			Put a standard SQL request in the queue.
-			Wait for the result and yield it, line by line.
+		""" Execute a SELECT statement in the current thread, on its own
+			connection, and return the resulting rows as a list.
 		"""
-		result = Queue()
-		Cache._queue.put((request, arguments or tuple(), result))
-		record = result.get()
-		while record:
-			yield record
-			record = result.get()
+		return self.__reader().execute(request, arguments or tuple()).fetchall()
+	def write(self, statements):
+		""" Queue some write statements (a list of ``(request, arguments)``)
+			for the writer thread, which will apply them in one transaction.
+			Return immediately. """
+
+		Cache._queue.put(statements)
+	def update_keywords(self, entries):
+		""" Record the new keywords of some files, from a sequence of
+			``(filename, stat, keywords)``. Setting an xattr doesn't change
+			the file mtime, so :meth:`cache` would not see them. Writes are
+			sent to the writer by batches of :attr:`batch_size` statements. """
+
+		statements = []
+
+		for filename, fstat, keywords in entries:
+			statements.append(('''INSERT OR REPLACE INTO files(fid, fname, fsize, fmtime) VALUES(?,?,?,?);''',
+				(fstat.st_ino, filename, fstat.st_size, fstat.st_mtime)))
+			statements.append(('''DELETE FROM k_on_f WHERE fid=?;''', (fstat.st_ino,)))
+
+			for k in keywords:
+				if k in Cache.localKeywords:
+					statements.append(('''INSERT OR REPLACE INTO k_on_f(fid, kid) VALUES(?,?);''', (fstat.st_ino, Cache.localKeywords[k])))
+
+			if len(statements) >= Cache.batch_size:
+				self.write(statements)
+				statements = []
+
+		if statements:
+			self.write(statements)
 	def vacuumDatabase(self):
 		"""Try to clean the cache as much as possible, remove unused or obsolete rows and so on."""
 
@@ -205,27 +295,33 @@ class Cache(Thread):
 
 		try: c.execute('COMMIT;')
 		except: pass
-	def __cache_one_file(self, filename, batch = False, force = False):
-		""" Add a file to the cache. """
+	def __cache_one_file(self, filename, batch = False, force = False, statements = None):
+		""" Add a file to the cache. If :param:`statements` is given, the
+			writes are appended to it, else they are queued at once. """
 
 		if self._stop_event.isSet():
 			raise exceptions.LicornStopException("%s: stopped, can't cache." % self.getName())
 
 		fstat = os.lstat(filename)
 
-		q = Cache._queue
+		if statements is None:
+			writes = []
+		else:
+			writes = statements
 
-		try:
-			fid, fname, fmtime = self.select('SELECT fid, fname, fmtime FROM files WHERE fid=?;', (fstat.st_ino,))
-		except ValueError:
+		rows = self.select('SELECT fid, fname, fmtime FROM files WHERE fid=?;', (fstat.st_ino,))
+
+		if rows:
+			fid, fname, fmtime = rows[0]
+		else:
 			fid = None
 
 		if force or fid is None or fmtime != fstat.st_mtime:
 
 			logging.progress("%s: updating cache record for %s." % (self.getName(), styles.stylize(styles.ST_PATH, filename)))
 
-			q.put(('''INSERT OR REPLACE INTO files(fid, fname, fsize, fmtime) VALUES(?,?,?,?);''',
-				(fstat.st_ino, filename, fstat.st_size, fstat.st_mtime), None))
+			writes.append(('''INSERT OR REPLACE INTO files(fid, fname, fsize, fmtime) VALUES(?,?,?,?);''',
+				(fstat.st_ino, filename, fstat.st_size, fstat.st_mtime)))
 
 			try:
 				attrs = xattr.getxattr(filename, Cache.allkeywords.licorn_xattr).split(',')
@@ -239,14 +335,14 @@ class Cache(Thread):
 					logging.progress("%s: Inserting inode->kw %d->%s." % (self.getName(), fstat.st_ino, good))
 
 					for k in good:
-						q.put(('''INSERT OR REPLACE INTO k_on_f(fid, kid) VALUES(?,?);''', (fstat.st_ino, Cache.localKeywords[k]), None))
+						writes.append(('''INSERT OR REPLACE INTO k_on_f(fid, kid) VALUES(?,?);''', (fstat.st_ino, Cache.localKeywords[k])))
 
 			except (OSError, IOError), e:
 				if e.errno not in (2, 61, 95):
 					raise e
 				else:
 					# FIXME: why delete the entry on err95 ? why not just let the cache as it is ?
-					q.put(('''DELETE FROM k_on_f WHERE fid=?;''', (fstat.st_ino,), None))
+					writes.append(('''DELETE FROM k_on_f WHERE fid=?;''', (fstat.st_ino,)))
 
 			try:
 				# TODO: get facl / perms and cache them, to answer user requests according to file perms.
@@ -260,37 +356,57 @@ class Cache(Thread):
 			except (OSError, IOError), e:
 				if e.errno not in (2, 61, 95):
 					raise e
+
+			if statements is None:
+				self.write(writes)
 		else:
 			logging.progress("%s: not caching %s, up-to-date." % (self.getName(), styles.stylize(styles.ST_PATH, filename)))
 	def cache(self, path, force = False):
-		""" Recursively fsapi.minifind() a dir and its subdirs for files and update the cache with data found. """
+		""" Recursively fsapi.minifind() a dir and its subdirs for files and update the cache with data found.
+			Writes are sent to the writer by batches of :attr:`batch_size` statements. """
 
 		logging.progress('%s: Starting to Cache(%s, force=%d).' % (self.getName(), styles.stylize(styles.ST_PATH, path), force))
 
+		statements = []
+
 		try:
-			map(lambda x: self.__cache_one_file(x, batch = True, force = force), fsapi.minifind(path, itype=(stat.S_IFREG,)))
+			for filename in fsapi.minifind(path, itype=(stat.S_IFREG,)):
+				self.__cache_one_file(filename, batch=True, force=force,
+												statements=statements)
+
+				if len(statements) >= Cache.batch_size:
+					self.write(statements)
+					statements = []
+
 		except exceptions.LicornStopException:
 			logging.info("%s: stop request received, cleaning up." % self.getName())
+
+		else:
+			if statements:
+				self.write(statements)
 	def removeEntry(self, path):
 		""" Remove one entry from the cache, one dir or one file. """
 
-		q = Cache._queue
-
-		row = list(self.select('''SELECT fid FROM files WHERE fname=?;''', (path,)))
+		row = self.select('''SELECT fid FROM files WHERE fname=?;''', (path,))
 
 		if row == []:
-			# we've got a dir…
-			for regular_file in self.select('SELECT fid FROM files WHERE fname LIKE ?;', (os.path.dirname(path),)):
-				q.put(('DELETE FROM k_on_f WHERE fid=?;', (regular_file[0],), None))
-				q.put(('DELETE FROM files  WHERE fid=?;', (regular_file[0],), None))
-				logging.info("%s: removed cache entry for file %s." % (self.getName(), styles.stylize(styles.ST_PATH, regular_file[0])))
+			# we've got a dir… select its contents with a range on the name
+			# (it uses the index, LIKE wouldn't): '0' comes right after '/'.
+			statements = []
+			for regular_file in self.select('SELECT fid, fname FROM files WHERE fname >= ? AND fname < ?;', (path + '/', path + '0')):
+				statements.append(('DELETE FROM k_on_f WHERE fid=?;', (regular_file[0],)))
+				statements.append(('DELETE FROM files  WHERE fid=?;', (regular_file[0],)))
+				logging.info("%s: removed cache entry for file %s." % (self.getName(), styles.stylize(styles.ST_PATH, regular_file[1])))
+			self.write(statements)
 		else:
-			q.put(('DELETE FROM k_on_f WHERE fid=?;', (row[0]), None))
-			q.put(('DELETE FROM files WHERE fid=?;', (row[0]), None))
+			self.write([ ('DELETE FROM k_on_f WHERE fid=?;', row[0]),
+						('DELETE FROM files WHERE fid=?;', row[0]) ])
 
 		logging.info("%s: removed cache entry for %s." % (self.getName(), styles.stylize(styles.ST_PATH, path)))
 	def query(self, req):
-		""" Query the cache with some keywords and return some files as a sequence. """
+		""" Query the cache with some keywords and return some files as a
+			sequence. Runs in the calling thread, concurrently with the
+			writer. """
 
 		#nbk   = len(req.split(','))
 
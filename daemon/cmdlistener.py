@@ -7,14 +7,17 @@ Licorn Daemon CommandListener, implemented with Pyro (Python Remote Objects)
 :license: GNU GPL version 2.
 """
 
-import signal, os, time, new
-import Pyro.core, Pyro.protocol, Pyro.configuration, Pyro.constants
+import signal, os, time, new, socket, errno, select, fcntl
+import Pyro.core, Pyro.protocol, Pyro.configuration, Pyro.constants, Pyro.errors
 
-from threading import Thread, Timer, current_thread
+from Queue     import Queue
+
+from threading import Thread, current_thread
 from licorn.foundations.threads import RLock
 
 from licorn.foundations           import logging, settings, exceptions
 from licorn.foundations           import process, network, pyutils, events
+from licorn.foundations           import options
 from licorn.foundations.events    import LicornEvent
 from licorn.foundations.styles    import *
 from licorn.foundations.ltrace    import *
@@ -22,7 +25,8 @@ from licorn.foundations.ltraces   import *
 from licorn.foundations.constants import host_status, host_types, priorities, roles
 
 from licorn.core                  import LMC
-from licorn.daemon.threads        import LicornBasicThread
+from licorn.daemon.threads        import LicornBasicThread, BaseLicornThread, \
+										timer_service
 
 def _pyro_thread_dump_status(self, long_output=False, precision=None, as_string=True):
 	if as_string:
@@ -95,7 +99,17 @@ class LicornPyroValidator(Pyro.protocol.DefaultConnValidator):
 		assert ltrace(TRACE_CMDLISTENER, 'connection from %s:%s' % (
 			client_addr, client_socket))
 
-		if client_addr in LicornPyroValidator.local_interfaces:
+		credentials = getattr(connection, 'peer_credentials', None)
+
+		if credentials is not None:
+			# Local connection via the unix socket: the kernel already
+			# told us who is on the other side.
+			client_pid, client_uid, client_gid = credentials
+
+			return self.acceptLocal(daemon, client_uid, client_pid,
+												client_addr, client_socket)
+
+		elif client_addr in LicornPyroValidator.local_interfaces:
 
 			try:
 				client_uid, client_pid = process.find_network_client_infos(
@@ -109,14 +123,8 @@ class LicornPyroValidator(Pyro.protocol.DefaultConnValidator):
 				return 0, Pyro.constants.DENIED_UNSPECIFIED
 
 			else:
-				accept, reason = self.acceptUid(daemon, client_uid, None,
+				return self.acceptLocal(daemon, client_uid, client_pid,
 												client_addr, client_socket)
-
-				if accept and client_pid:
-					# record the PID for SIGUSR2 eventual sending on restart.
-					CommandListener.add_listener_pid(client_pid)
-
-				return accept, reason
 		else:
 			if settings.role == roles.SERVER:
 				# connect to the client's Pyro daemon and make sure the request
@@ -140,7 +148,7 @@ class LicornPyroValidator(Pyro.protocol.DefaultConnValidator):
 						t = self.setup_licorn_thread('root', 0,
 												client_addr, client_socket)
 
-						logging.monitor(TRACE_CMDLISTENER,
+						logging.monitor(TRACE_CMDLISTENER, TRACELEVEL_1,
 							'{0}/{1}: connection check validated for {2}:{3}.',
 								t.name, self.__class__.__name__,
 									client_addr, client_socket)
@@ -148,7 +156,7 @@ class LicornPyroValidator(Pyro.protocol.DefaultConnValidator):
 
 					else:
 						LicornPyroValidator.current_checks.append(client_addr)
-						logging.monitor(TRACE_CMDLISTENER,
+						logging.monitor(TRACE_CMDLISTENER, TRACELEVEL_1,
 							'{0}/{1}: connection check stored for {2}:{3}.',
 								current_thread().name, self.__class__.__name__,
 									client_addr, client_socket)
@@ -175,7 +183,7 @@ class LicornPyroValidator(Pyro.protocol.DefaultConnValidator):
 				if client_addr == LicornPyroValidator.server \
 					or client_addr in LicornPyroValidator.server_addresses:
 
-					logging.monitor(TRACE_CMDLISTENER,
+					logging.monitor(TRACE_CMDLISTENER, TRACELEVEL_1,
 						'{0}/{1}: server connection accepted from {2}:{3}.',
 							current_thread().name, self.__class__.__name__,
 								client_addr, client_socket)
@@ -193,6 +201,15 @@ class LicornPyroValidator(Pyro.protocol.DefaultConnValidator):
 							', '.join(LicornPyroValidator.server_addresses)))
 
 					return 0, Pyro.constants.DENIED_HOSTBLOCKED
+	def acceptLocal(self, daemon, client_uid, client_pid, client_addr, client_socket):
+		accept, reason = self.acceptUid(daemon, client_uid, None,
+										client_addr, client_socket)
+
+		if accept and client_pid:
+			# record the PID for SIGUSR2 eventual sending on restart.
+			CommandListener.add_listener_pid(client_pid)
+
+		return accept, reason
 	def acceptUid(self, daemon, client_uid, client_login, client_addr, client_socket):
 		try:
 			local_login = LMC.users.uid_to_login(client_uid)
@@ -267,7 +284,8 @@ class LicornPyroValidator(Pyro.protocol.DefaultConnValidator):
 		t = current_thread()
 
 		# Set a smarter name than 'Thread-28', easier to track in status.
-		t.setName('Pyro' + t.name)
+		if not t.name.startswith('Pyro'):
+			t.setName('Pyro' + t.name)
 
 		t._licornd                  = LMC.licornd
 		t._licorn_remote_user       = client_login
@@ -278,6 +296,175 @@ class LicornPyroValidator(Pyro.protocol.DefaultConnValidator):
 		t._pyro_thread_dump_status  = new.instancemethod(
 						_pyro_thread_dump_status, t, t.__class__)
 		return t
+class PyroClientSession(object):
+	""" One Pyro connection, and what the daemon knows about its client:
+		the attributes a :class:`PyroHandlerThread` gets while it serves one
+		of its requests (the listener, the translator, the remote user…),
+		and its eventual monitor registration.
+
+		Connections are served one request at a time, by whatever handler
+		is free, so this state cannot stay on a thread like with the
+		thread-per-connection model of Pyro.
+	"""
+	#: thread attributes which belong to the served client, not the thread.
+	client_attributes = ('listener', '_', '_licornd', '_licorn_remote_user',
+						'_licorn_remote_uid', '_licorn_remote_address',
+						'_licorn_remote_port', '_licorn_thread_start_time')
+
+	#: set on the thread by the validator, but replaced by our dump_status().
+	thread_attributes = ('_pyro_thread_dump_status', '_licorn_session')
+
+	def __init__(self, conn, number):
+		self.conn    = conn
+		self.fileno  = conn.fileno()
+		self.name    = 'PyroClient-%d' % number
+
+		#: ``True`` once Pyro's handshake (and our validator) accepted it.
+		self.accepted = False
+
+		#: the thread serving a request of this client, if any.
+		self.handler  = None
+
+		# used by `set_listener_verbose()`, even if not monitoring.
+		self.monitor_lock = RLock()
+	def apply_to(self, thread):
+		""" Give the client attributes to the thread which serves it. """
+
+		for attr in PyroClientSession.client_attributes:
+			if attr in self.__dict__:
+				thread.__dict__[attr] = self.__dict__[attr]
+
+		thread._licorn_session = self
+		self.handler           = thread
+	def collect_from(self, thread):
+		""" Take back the client attributes (possibly set or changed during
+			the request) and clean the thread for the next client. """
+
+		for attr in PyroClientSession.client_attributes:
+			if attr in thread.__dict__:
+				self.__dict__[attr] = thread.__dict__.pop(attr)
+
+		for attr in PyroClientSession.thread_attributes:
+			thread.__dict__.pop(attr, None)
+
+		self.handler = None
+	def dump_status(self, long_output=False, precision=None, as_string=True):
+		handler = self.handler
+
+		if as_string:
+			return u'\t%s: RWI calls for %s(%s) @%s:%s %s%s\n' % (
+				stylize(ST_RUNNING if handler else ST_STOPPED, self.name),
+				stylize(ST_LOGIN, getattr(self, '_licorn_remote_user', None)),
+				stylize(ST_UGID, getattr(self, '_licorn_remote_uid', None)),
+				self.conn.addr[0], self.conn.addr[1],
+				('(connected %s)' % pyutils.format_time_delta(
+						getattr(self, '_licorn_thread_start_time',
+							time.time()) - time.time(),
+						use_neg=True, long_output=False)),
+				(u', served by %s' % stylize(ST_NAME, handler.name))
+					if handler else u'')
+		else:
+			return dict(
+				name=self.name,
+				handler=handler.name if handler else None,
+				remote_user=getattr(self, '_licorn_remote_user', None),
+				remote_uid=getattr(self, '_licorn_remote_uid', None),
+				remote_address=self.conn.addr[0],
+				remote_port=self.conn.addr[1],
+				started=getattr(self, '_licorn_thread_start_time',
+										time.time()) - time.time()
+			)
+class PyroHandlerThread(BaseLicornThread):
+	""" Serve the Pyro requests the :class:`CommandListener` gets ready
+		connections for: the handshake of a new connection, or one request
+		of an established one, then the next job, from any client. Their
+		number is bounded (see ``licornd.threads.pyro.max``), but idle
+		connections don't hold any of them.
+	"""
+	def __init__(self, cmdlistener, number):
+		BaseLicornThread.__init__(self, name='PyroHandler-%d' % number)
+
+		self.daemon       = True
+		self.cmdlistener  = cmdlistener
+		self.base_name    = self.name
+
+		# Pyro needs it on every thread which handles requests.
+		self.localStorage = Pyro.protocol.LocalStorage()
+	def run(self):
+		assert ltrace(TRACE_THREAD, '%s running' % self.name)
+
+		cmdlistener = self.cmdlistener
+
+		cmdlistener.pyro_daemon.initTLS(self.localStorage)
+
+		while True:
+			session = cmdlistener.pending_jobs.get()
+
+			if session is None:
+				break
+
+			try:
+				if session.accepted:
+					keep = self.serve_request(session)
+
+				else:
+					keep = self.serve_handshake(session)
+
+			except Exception:
+				logging.exception(_(u'{0}: exception while serving {1}'),
+									(ST_NAME, self.name), str(session.conn))
+				keep = False
+
+			cmdlistener.job_done(session, keep)
+
+		BaseLicornThread.stop(self)
+
+		assert ltrace(TRACE_THREAD, '%s ended' % self.name)
+	def serve_handshake(self, session):
+		""" Run Pyro's handshake of a new connection, which calls our
+			validator. Return ``True`` if the connection is accepted. """
+
+		pyro_daemon = self.cmdlistener.pyro_daemon
+
+		session.apply_to(self)
+
+		try:
+			if pyro_daemon.getAdapter().handleConnection(session.conn,
+															pyro_daemon):
+				session.accepted = True
+				return True
+
+			return False
+
+		finally:
+			session.collect_from(self)
+			self.name = self.base_name
+	def serve_request(self, session):
+		""" Serve one request of an accepted connection. Return ``True`` if
+			the connection is still usable. """
+
+		pyro_daemon = self.cmdlistener.pyro_daemon
+		conn        = session.conn
+
+		session.apply_to(self)
+
+		try:
+			pyro_daemon.handleInvocation(conn)
+
+		except Pyro.errors.ConnectionClosedError:
+			# client went away.
+			return False
+
+		except Exception:
+			# sends the exception to the client, or closes the connection
+			# on protocol errors.
+			pyro_daemon.handleError(conn)
+
+		finally:
+			session.collect_from(self)
+			self.name = self.base_name
+
+		return bool(conn.connected)
 class CommandListener(LicornBasicThread):
 	""" A Thread which answer to Pyro remote commands. """
 
@@ -311,7 +498,30 @@ class CommandListener(LicornBasicThread):
 		# Wake them with USR2
 		self.pids_to_wake2 = pids_to_wake2 or []
 
-		self.wake_threads = []
+		self.wake_timers = []
+
+		self.unix_socket = None
+
+		# the pool of request handlers, and the jobs waiting for them.
+		self.handlers            = []
+		self.handlers_count      = 0
+		self.handlers_available  = 0
+		self.handlers_lock       = RLock()
+		self.pending_jobs        = Queue()
+
+		# the connections, by file descriptor (those of the established
+		# ones are in `polled`). Protected by `handlers_lock`.
+		self.sessions            = {}
+		self.sessions_count      = 0
+		self.polled              = set()
+		self.poller              = None
+
+		# written to wake the main loop up.
+		self.wake_pipe = os.pipe()
+
+		for fd in self.wake_pipe:
+			flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+			fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
 	def dump_status(self, long_output=False, precision=None, as_string=True):
 		""" get detailled thread status. """
 		if long_output:
@@ -322,12 +532,16 @@ class CommandListener(LicornBasicThread):
 			uri_status = ''
 
 		if as_string:
-			return '%s(%s%s) %s (%d loops, %d wakers)%s%s' % (
+			return ('%s(%s%s) %s (%d loops, %d wakers, %d/%d handlers busy, '
+					'%d clients, %d jobs waiting)%s%s') % (
 				stylize(ST_NAME, self.name),
 				self.ident, stylize(ST_OK, '&') if self.daemon else '',
 				stylize(ST_OK, 'alive') \
 					if self.is_alive() else 'has terminated',
-				self._pyro_loop, len(self.wake_threads), uri_status,
+				self._pyro_loop, len(self.wake_timers),
+				len(self.handlers) - max(0, self.handlers_available),
+				len(self.handlers), len(self.sessions),
+				self.pending_jobs.qsize(), uri_status,
 				self.dump_pyro_connections(long_output, precision)
 			)
 		else:
@@ -337,7 +551,11 @@ class CommandListener(LicornBasicThread):
 				daemon=self.daemon,
 				alive=self.is_alive(),
 				loops=self._pyro_loop,
-				wakers=len(self.wake_threads),
+				wakers=len(self.wake_timers),
+				handlers=len(self.handlers),
+				handlers_busy=len(self.handlers) - max(0, self.handlers_available),
+				clients=len(self.sessions),
+				jobs_waiting=self.pending_jobs.qsize(),
 				uri_status=uri_status,
 				connections=self.dump_pyro_connections(long_output, precision, as_string)
 			)
@@ -346,7 +564,10 @@ class CommandListener(LicornBasicThread):
 		if as_string:
 			data = '\n'
 			for conn in self.pyro_daemon.connections:
-				if isinstance(conn, Pyro.protocol.TCPConnection):
+				if isinstance(conn, PyroClientSession):
+					data += conn.dump_status(long_output, precision, as_string)
+
+				elif isinstance(conn, Pyro.protocol.TCPConnection):
 					#data += '\tTCPConn %s: %s:%s ‣ %s:%s\n'
 					data += '%s\n' % str(conn)
 
@@ -368,7 +589,11 @@ class CommandListener(LicornBasicThread):
 		else:
 			conns = []
 			for conn in self.pyro_daemon.connections:
-				if isinstance(conn, Thread):
+				if isinstance(conn, PyroClientSession):
+					conns.append(conn.dump_status(long_output, precision,
+																as_string))
+
+				elif isinstance(conn, Thread):
 					try:
 						conns.append(conn._pyro_thread_dump_status(
 										long_output, precision, as_string))
@@ -377,6 +602,166 @@ class CommandListener(LicornBasicThread):
 				else:
 					conns.append(dict(name=str(conn)))
 			return conns
+	def unix_listen(self):
+		""" Create the unix socket for local clients, see
+			:ref:`pyro.socket <settings.pyro.socket.en>`. They are
+			identified with the credentials given by the kernel
+			(``SO_PEERCRED``), instead of searching :file:`/proc` for the
+			process on the other side of a TCP connection.
+		"""
+
+		path = settings.pyro.socket
+
+		if not path:
+			return
+
+		try:
+			os.unlink(path)
+
+		except OSError, e:
+			if e.errno != errno.ENOENT:
+				raise
+
+		self.unix_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.unix_socket.bind(path)
+
+		# Anyone can connect, like to the TCP port: the validator will check
+		# the UID of the peer.
+		os.chmod(path, 0666)
+
+		self.unix_socket.listen(Pyro.config.PYRO_TCP_LISTEN_BACKLOG)
+	def accept_connection(self, sock):
+		""" Accept a new connection on one of our listening sockets, and
+			queue its handshake for a :class:`PyroHandlerThread`. Unix
+			socket peers are identified here, with the credentials the
+			kernel gives us. """
+
+		try:
+			csock, addr = sock.accept()
+
+		except socket.error, e:
+			if e.errno not in (errno.EAGAIN, errno.EINTR):
+				logging.warning(_(u'{0}: cannot accept connection '
+									u'(was: {1}).').format(self.name, e))
+			return
+
+		# the listening sockets are non-blocking, not the connections.
+		csock.setblocking(1)
+
+		if sock is self.unix_socket:
+			try:
+				credentials = network.peer_credentials(csock)
+
+			except socket.error, e:
+				logging.warning(_(u'{0}: cannot get local peer credentials, '
+							u'closing connection (was: {1}).').format(
+								self.name, e))
+				csock.close()
+				return
+
+			# The address is only informational: it's displayed in the
+			# status, with the PID in place of the port.
+			conn = Pyro.protocol.TCPConnection(csock, ('unix', credentials[0]))
+			conn.peer_credentials = credentials
+
+		else:
+			conn = Pyro.protocol.TCPConnection(csock, addr)
+
+		with self.handlers_lock:
+			self.sessions_count += 1
+			session = PyroClientSession(conn, self.sessions_count)
+			self.sessions[session.fileno] = session
+
+		self.dispatch(session)
+	def dispatch(self, session):
+		""" Queue the next job of a session (its handshake, or a request
+			which just arrived), starting a new handler if all are busy and
+			the pool is not full. Else the job waits for the first free one.
+		"""
+
+		with self.handlers_lock:
+			if self.handlers_available <= 0 \
+					and len(self.handlers) < settings.licornd.threads.pyro.max:
+				self.spawn_handler()
+
+			self.handlers_available -= 1
+
+		self.pending_jobs.put(session)
+	def job_done(self, session, keep):
+		""" Called by a :class:`PyroHandlerThread` after each job. The
+			connection goes back into the poll set until its next request
+			(``EPOLLONESHOT`` makes sure only one handler serves it at a
+			time), or is closed. """
+
+		with self.handlers_lock:
+			self.handlers_available += 1
+
+			if keep and self.poller is not None \
+									and not self._stop_event.is_set():
+				try:
+					if session.fileno in self.polled:
+						self.poller.modify(session.fileno,
+										select.EPOLLIN | select.EPOLLONESHOT)
+
+					else:
+						self.poller.register(session.fileno,
+										select.EPOLLIN | select.EPOLLONESHOT)
+						self.polled.add(session.fileno)
+						self.pyro_daemon.connections.append(session)
+
+					return
+
+				except (IOError, ValueError), e:
+					logging.warning(_(u'{0}: cannot watch {1} anymore, '
+							u'closing it (was: {2}).').format(self.name,
+								str(session.conn), e))
+
+			self.close_session(session)
+	def close_session(self, session):
+		""" Forget a connection, close it and disengage its monitor if any.
+			Must be called with :attr:`handlers_lock` held. """
+
+		if session.fileno in self.polled:
+			self.polled.discard(session.fileno)
+
+			try:
+				self.poller.unregister(session.fileno)
+
+			except (IOError, ValueError):
+				pass
+
+		self.sessions.pop(session.fileno, None)
+
+		try:
+			self.pyro_daemon.connections.remove(session)
+
+		except ValueError:
+			pass
+
+		with options.monitor_lock:
+			if session in options.monitor_listeners:
+				options.monitor_listeners.remove(session)
+				options.update_monitors()
+
+		session.conn.close()
+	def spawn_handler(self):
+		""" Start one more :class:`PyroHandlerThread`. Must be called with
+			:attr:`handlers_lock` held. """
+
+		self.handlers_count += 1
+		self.handlers.append(PyroHandlerThread(self, self.handlers_count).start())
+		self.handlers_available += 1
+	def wake_up(self):
+		""" Make the main loop re-examine its state. """
+		try:
+			os.write(self.wake_pipe[1], 'w')
+
+		except OSError:
+			# the pipe is full (the loop will wake anyway) or closed.
+			pass
+	def stop(self):
+		LicornBasicThread.stop(self)
+		self.wake_up()
 	def run(self):
 		assert ltrace(TRACE_THREAD, '%s running' % self.name)
 
@@ -445,10 +830,22 @@ class CommandListener(LicornBasicThread):
 
 		self.uris['msgproc'] = self.pyro_daemon.connect(LMC.msgproc, 'msgproc')
 
+		try:
+			self.unix_listen()
+
+		except (OSError, socket.error), e:
+			logging.warning(_(u'{0}: cannot listen on {1}, local clients will '
+								u'use TCP (was: {2}).').format(self.name,
+									stylize(ST_PATH, settings.pyro.socket), e))
+			self.unix_socket = None
+
 		logging.info(_(u'{0}: {1} to answer requests at {2}.').format(
 								self.name, stylize(ST_OK, _(u'ready')),
 								stylize(ST_URL, u'pyro://*:%s'
-									% self.pyro_daemon.port)))
+									% self.pyro_daemon.port)
+								+ (u' and %s' % stylize(ST_PATH,
+										settings.pyro.socket)
+									if self.unix_socket else u'')))
 
 		def wake_pid(pid, wake_signal):
 			try:
@@ -462,50 +859,93 @@ class CommandListener(LicornBasicThread):
 		for pids_list, wake_signal in ((self.pids_to_wake1, signal.SIGUSR1),
 										(self.pids_to_wake2, signal.SIGUSR2)):
 			for pid in pids_list:
-				th = Timer(0.25, wake_pid, (pid, wake_signal))
-				self.wake_threads.append(th)
-				assert ltrace(TRACE_THREAD, '%s starting wake up thread %s.' % (
-															self.name, th.name))
-				th.start()
+				# os.kill() is quick: run from the timer service thread.
+				self.wake_timers.append(timer_service().schedule(0.25,
+											wake_pid, pid, wake_signal))
+
+		listening = [ self.pyro_daemon.sock ]
+
+		if self.unix_socket is not None:
+			listening.append(self.unix_socket)
+
+		for sock in listening:
+			sock.setblocking(0)
+
+		by_fd = dict((sock.fileno(), sock) for sock in listening)
+
+		# No timeout: the loop only runs when a client connects, sends a
+		# request, or when we stop. An idle daemon doesn't wake up at all.
+		# Established connections stay in the poll set while idle, only
+		# their requests take a handler.
+		poller = select.epoll()
+		poller.register(self.wake_pipe[0], select.EPOLLIN)
+
+		for fd in by_fd:
+			poller.register(fd, select.EPOLLIN)
+
+		with self.handlers_lock:
+			self.poller = poller
+
+			for i in range(settings.licornd.threads.pyro.min):
+				self.spawn_handler()
 
-		check_wakers = True
 		self._pyro_loop = 0
+
 		while not self._stop_event.isSet():
 			try:
-				# NOTE: 0.5s seems to be the lowest resources consuming value.
-				# on an idle system with WMI::/system/daemon displayed,
-				#	- 2.0s  leads to
-				#	- 1.0s  leads to
-				#	- 0.5s  leads to 37s SYS for 52min run, 150 loops/sec
-				#	- 0.2s  leads to 10 loops/sec
-				#	- 0.1s  leads to 59m SYS for 55min run, 20 loops/sec
-				#	- 0.01s leads to
-				self.pyro_daemon.handleRequests(0.2)
-				#assert ltrace(TRACE_CMDLISTENER, "pyro daemon %d's loop: %s" % (
-				#	self._pyro_loop, self.pyro_daemon.connections))
-			except Exception, e:
-				logging.warning(e)
+				events = poller.poll()
+
+			except IOError, e:
+				if e.errno == errno.EINTR:
+					continue
+				raise
+
 			self._pyro_loop += 1
 
-			if check_wakers:
-				# we check wake threads only at the beginning of loop. After
-				# that, they should be already stopped.
-				for th in self.wake_threads:
-					if th.is_alive():
-						continue
-					else:
-						th.join()
-						self.wake_threads.remove(th)
-						del th
+			for fd, mask in events:
+				if fd == self.wake_pipe[0]:
+					os.read(fd, 4096)
+
+				elif fd in by_fd:
+					self.accept_connection(by_fd[fd])
+
+				else:
+					# a request (or a disconnection, which the handler will
+					# notice) on an established connection.
+					with self.handlers_lock:
+						session = self.sessions.get(fd)
+
+					if session is not None:
+						self.dispatch(session)
 
-					if len(self.wake_threads) == 0:
-						assert ltrace(TRACE_THREAD,
-							'%s: all wakers terminated at loop#%d.' % (
-								self.name, self._pyro_loop))
-						check_wakers = False
+			if self.wake_timers:
+				self.wake_timers = [ entry for entry in self.wake_timers
+									if timer_service().pending(entry) ]
+
+		# NOTE: the wake pipe is not closed, stop() can still be called.
+		with self.handlers_lock:
+			for session in self.sessions.values():
+				self.close_session(session)
+
+			self.poller = None
+
+		poller.close()
+
+		if self.unix_socket is not None:
+			self.unix_socket.close()
+
+			try:
+				os.unlink(settings.pyro.socket)
+
+			except OSError:
+				pass
 
 		self.pyro_daemon.shutdown(True)
 
+		with self.handlers_lock:
+			for handler in self.handlers:
+				self.pending_jobs.put(None)
+
 		# be sure the pyro_daemon's __del__ method is called, it will
 		# close the server socket properly.
 		del self.pyro_daemon
@@ -513,13 +953,10 @@ class CommandListener(LicornBasicThread):
 		logging.progress('%s: %s Pyro daemon.' % (self.name,
 			stylize(ST_BAD, 'stopped')))
 
-		# NOTE: this is just in case we stop ourselves *before* waker_threads
-		# finish. Happens if Control-C at the beginning of the daemon. Unlikely
-		# to occur, but who knows.
-		for th in self.wake_threads:
-			assert ltrace(TRACE_THREAD, '%s  stopping wake up thread %s.' % (
-				self.name, th.name))
-			th.cancel()
-			th.join()
+		# NOTE: this is just in case we stop ourselves *before* the wake up
+		# timers fire. Happens if Control-C at the beginning of the daemon.
+		# Unlikely to occur, but who knows.
+		for entry in self.wake_timers:
+			timer_service().cancel(entry)
 
 		assert ltrace(TRACE_THREAD, '%s ended' % self.name)
@@ -8,18 +8,18 @@ Licorn Daemon inotifier thread.
 
 import os, time, pyinotify, select, errno
 
-from threading import Timer
 
 from licorn.foundations           import logging, exceptions, settings
 from licorn.foundations           import fsapi, pyutils
 from licorn.foundations.base      import BasicCounter
+from licorn.foundations.workers   import workers
 from licorn.foundations.styles    import *
 from licorn.foundations.ltrace    import *
 from licorn.foundations.ltraces   import *
 from licorn.foundations.threads   import RLock
 from licorn.foundations.constants import filters, priorities
 from licorn.core                  import LMC
-from licorn.daemon.threads        import LicornBasicThread
+from licorn.daemon.threads        import LicornBasicThread, timer_service
 
 class INotifier(LicornBasicThread, pyinotify.Notifier):
 	"""
@@ -163,13 +163,10 @@ class INotifier(LicornBasicThread, pyinotify.Notifier):
 
 		else:
 			try:
-				self._timers[conf_file].cancel()
+				timer_service().cancel(self._timers.pop(conf_file))
 
 			except KeyError:
 				pass
-
-			else:
-				del self._timers[conf_file]
 	def watch_conf(self, conf_file, core_obj, reload_method=None, reload_hint=None):
 		""" Helper / Wrapper method for core objects. This will setup a watcher
 			on dirname(conf_file), if not already setup. returns a reload hint
@@ -252,7 +249,9 @@ class INotifier(LicornBasicThread, pyinotify.Notifier):
 		try:
 			name, lock, hint, reload_method = self._watched_conf_files[event.pathname]
 
-			logging.monitor(TRACE_INOTIFIER, 'New config file event on {0}', event.pathname)
+			if logging.monitoring(TRACE_INOTIFIER):
+				logging.monitor(TRACE_INOTIFIER, TRACELEVEL_1,
+						'New config file event on {0}', event.pathname)
 
 		except (AttributeError, KeyError):
 			assert ltrace(TRACE_INOTIFIER, '| __config_file_event unhandled %s' % event)
@@ -313,10 +312,9 @@ class INotifier(LicornBasicThread, pyinotify.Notifier):
 				hint.set(1)
 
 				try:
-					self._timers[event.pathname].cancel()
-					del self._timers[event.pathname]
+					timer_service().cancel(self._timers.pop(event.pathname))
 
-				except:
+				except KeyError:
 					pass
 
 				def reload_wrapper():
@@ -326,8 +324,10 @@ class INotifier(LicornBasicThread, pyinotify.Notifier):
 							stylize(ST_PATH, event.pathname)))
 					reload_method(event.pathname)
 
-				self._timers[event.pathname] = Timer(1.0, reload_wrapper)
-				self._timers[event.pathname].start()
+				# the timer service only hands the reload to a worker.
+				self._timers[event.pathname] = timer_service().schedule(1.0,
+											workers.service_enqueue,
+											priorities.HIGH, reload_wrapper)
 
 		assert ltrace(TRACE_LOCKS, '| inotifier conf_exit %s' % lock)
 	def collect(self):
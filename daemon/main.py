@@ -28,7 +28,7 @@ import os, sys, signal, select, socket, resource, pybonjour, gc, __builtin__
 from threading  import current_thread, Thread, active_count
 
 from licorn.foundations           import options, settings, logging, ttyutils
-from licorn.foundations           import gettext, process, pyutils, events
+from licorn.foundations           import gettext, process, pyutils, events, cache
 from licorn.foundations.events    import LicornEvent
 from licorn.foundations.styles    import *
 from licorn.foundations.ltrace    import *
@@ -48,7 +48,8 @@ from licorn.daemon.threads        import GQWSchedulerThread, \
 											ServiceWorkerThread, \
 											ACLCkeckerThread, \
 											NetworkWorkerThread, \
-											LicornJobThread
+											LicornJobThread, \
+											timer_service
 from licorn.daemon.inotifier      import INotifier
 from licorn.daemon.cmdlistener    import CommandListener
 
@@ -85,7 +86,8 @@ class LicornDaemon(ObjectSingleton, LicornBaseDaemon):
 			ServiceWorkerThread.setup(self,
 				workers.serviceQ,
 				self.configuration.threads.service.min,
-				self.configuration.threads.service.max
+				self.configuration.threads.service.max,
+				reserved=self.configuration.threads.service.reserved
 			)
 		)
 	def start_aclcheckers(self):
@@ -93,7 +95,8 @@ class LicornDaemon(ObjectSingleton, LicornBaseDaemon):
 			ACLCkeckerThread.setup(self,
 				workers.aclcheckQ,
 				self.configuration.threads.aclcheck.min,
-				self.configuration.threads.aclcheck.max
+				self.configuration.threads.aclcheck.max,
+				reserved=self.configuration.threads.aclcheck.reserved
 			)
 		)
 	def start_networkers(self):
@@ -102,6 +105,7 @@ class LicornDaemon(ObjectSingleton, LicornBaseDaemon):
 				workers.networkQ,
 				self.configuration.threads.network.min,
 				self.configuration.threads.network.max,
+				reserved=self.configuration.threads.network.reserved,
 				# Network threads are daemon, because they can
 				# take ages to terminate and usually block on
 				# sockets. We can't afford waiting for them.
@@ -614,6 +618,9 @@ class LicornDaemon(ObjectSingleton, LicornBaseDaemon):
 		# Event loop status
 		tdata.append(events.dump_status(long_output, precision, as_string))
 
+		# Timers (the LicornJobThreads and others are not real threads)
+		tdata.append(timer_service().dump_status(long_output, precision, as_string))
+
 		# don't use iteritems(), threads are moving targets now and the items
 		# can change very quickly.
 		for tname, thread in self.__threads.items():
@@ -674,6 +681,8 @@ class LicornDaemon(ObjectSingleton, LicornBaseDaemon):
 						(qname, queue.qsize())).center(20)
 							for qname, queue in workers.queues.iteritems()])
 
+			data += _(u'Cache:   %s\n') % cache.dump_status(long_output,
+														precision, as_string)
 
 			"""
 			if thread.is_alive():
@@ -718,6 +727,7 @@ class LicornDaemon(ObjectSingleton, LicornBaseDaemon):
 				queues_infos=dict((qname, queue.qsize())
 								for qname, queue
 									in workers.queues.iteritems()),
+				cache=cache.dump_status(long_output, precision, as_string),
 				threads_data=tdata,
 			)
 	def __register_bonjour_wmi(self):
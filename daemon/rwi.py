@@ -273,6 +273,27 @@ class RealWorldInterface(NamedObject, ListenerObject, Pyro.core.ObjBase):
 		self.setup_listener_gettext()
 
 		remote_output(LMC.extensions.volumes.get_CLI(opts, args))
+	def __stream_output(self, pieces):
+		""" Send the output of a ``get`` command to the CLI in chunks of
+			about ``licornd.output_chunk_size`` bytes, as soon as they are
+			rendered, instead of building the whole output first. With a
+			chunk size of ``0``, the output is sent in one message. """
+
+		chunk_size = settings.licornd.output_chunk_size
+		chunk      = []
+		length     = 0
+
+		for piece in pieces:
+			chunk.append(piece)
+			length += len(piece)
+
+			if chunk_size and length >= chunk_size:
+				remote_output(''.join(chunk))
+				chunk  = []
+				length = 0
+
+		if chunk:
+			remote_output(''.join(chunk))
 	def get_users(self, opts, args):
 		""" Get the list of POSIX user accounts (Samba / LDAP included). """
 
@@ -300,19 +321,18 @@ class RealWorldInterface(NamedObject, ListenerObject, Pyro.core.ObjBase):
 					all=opts.all)
 
 		if opts.to_script:
-			data = LMC.users.to_script(selected=users_to_get,
+			data = LMC.users.to_script_iter(selected=users_to_get,
 										script_format=opts.to_script,
 										script_separator=opts.script_sep)
 
 		elif opts.xml:
-			data = LMC.users.to_XML(selected=users_to_get,
+			data = LMC.users.to_XML_iter(selected=users_to_get,
 										long_output=opts.long_output)
 		else:
-			data = LMC.users._cli_get(selected=users_to_get,
+			data = LMC.users._cli_get_iter(selected=users_to_get,
 										long_output=opts.long_output)
 
-		if data and data != '\n':
-			remote_output(data)
+		self.__stream_output(data)
 
 		assert ltrace(TRACE_GET, '< get_users()')
 	def get_groups(self, opts, args):
@@ -335,20 +355,19 @@ class RealWorldInterface(NamedObject, ListenerObject, Pyro.core.ObjBase):
 				all=opts.all)
 
 		if opts.to_script:
-			data = LMC.groups.to_script(selected=groups_to_get,
+			data = LMC.groups.to_script_iter(selected=groups_to_get,
 										script_format=opts.to_script,
 										script_separator=opts.script_sep)
 
 		elif opts.xml:
-			data = LMC.groups.to_XML(selected=groups_to_get,
+			data = LMC.groups.to_XML_iter(selected=groups_to_get,
 										long_output=opts.long_output)
 		else:
-			data = LMC.groups._cli_get(selected=groups_to_get,
+			data = LMC.groups._cli_get_iter(selected=groups_to_get,
 										long_output=opts.long_output,
 										no_colors=opts.no_colors)
 
-		if data and data != '\n':
-			remote_output(data)
+		self.__stream_output(data)
 
 		assert ltrace(TRACE_GET, '< get_groups()')
 	def get_profiles(self, opts, args):
@@ -473,19 +492,18 @@ class RealWorldInterface(NamedObject, ListenerObject, Pyro.core.ObjBase):
 			machines_to_get = LMC.machines.select(selection, return_ids=True)
 
 		if opts.to_script:
-			data = LMC.machines.to_script(selected=machines_to_get,
+			data = LMC.machines.to_script_iter(selected=machines_to_get,
 											script_format=opts.to_script,
 											script_separator=opts.script_sep)
 
 		elif opts.xml:
-			data = LMC.machines.ExportXML(selected=machines_to_get,
+			data = LMC.machines.ExportXML_iter(selected=machines_to_get,
 											long_output=opts.long_output)
 		else:
-			data = LMC.machines.ExportCLI(selected=machines_to_get,
+			data = LMC.machines.ExportCLI_iter(selected=machines_to_get,
 											long_output=opts.long_output)
 
-		if data and data != '\n':
-			remote_output(data)
+		self.__stream_output(data)
 
 		assert ltrace(TRACE_GET, '< get_machines()')
 
@@ -517,6 +535,16 @@ class RealWorldInterface(NamedObject, ListenerObject, Pyro.core.ObjBase):
 
 		tasks_to_get = LMC.tasks.select(selection)
 
+		if opts.within is not None:
+			upcoming = LMC.tasks.upcoming(opts.within)
+
+			if selection == filters.ALL:
+				tasks_to_get = upcoming
+
+			else:
+				selected     = set(t.id for t in tasks_to_get)
+				tasks_to_get = [ t for t in upcoming if t.id in selected ]
+
 		if opts.to_script:
 			data = LMC.tasks.to_script(selected=tasks_to_get,
 											script_format=opts.to_script,
@@ -917,8 +945,10 @@ class RealWorldInterface(NamedObject, ListenerObject, Pyro.core.ObjBase):
 
 		if opts.confirm_import:
 			# store a ref to the groups locally to avoid selecting them again
-			# and again when creating users, later.
-			groups = {}
+			# and again when creating users, later. Remember the ones we
+			# create, to delete them if the import is cancelled.
+			groups         = {}
+			created_groups = []
 
 			# to print i/length progression
 			i = 0
@@ -927,6 +957,7 @@ class RealWorldInterface(NamedObject, ListenerObject, Pyro.core.ObjBase):
 				try:
 					i += 1
 					groups[g] = LMC.groups.add_Group(name=g, batch=opts.no_sync)
+					created_groups.append(groups[g])
 
 					logging.progress('\r' + _(u'Added group {0} ({1}/{2}); '
 						'progress: {3}%').format( g, i, length_groups,
@@ -987,60 +1018,80 @@ class RealWorldInterface(NamedObject, ListenerObject, Pyro.core.ObjBase):
 					stylize(ST_PATH, string.ljust(_('group'), col_width)),
 					stylize(ST_PATH, _(u'password'))))
 
-		i = 0
-		for u in users_to_add:
+		if opts.confirm_import:
+			# All accounts are validated and created in one batch; if any of
+			# them is invalid, nothing is created. If the batch fails later,
+			# add_Users() deletes the accounts it created before raising.
+			# Either way no imported account remains, and we delete the
+			# groups created above, to leave the system as it was.
+			accounts = []
+			imported = []
+
 			try:
-				i += 1
-				if opts.confirm_import:
-					in_groups = [LMC.groups.guess_one(g) for g in u['group']] \
-						if u['group'] is not None else []
+				for u in users_to_add:
+					if u['login'] in LMC.users.logins:
+						logging.warning(_(u'User account {0} already exists, '
+							u'skipped.').format(stylize(ST_LOGIN, u['login'])),
+							to_local=False)
+						# FIXME: if user already exists,
+						# don't put it in the data / HTML report.
+						continue
+
+					account = {
+							'login'     : u['login'],
+							'password'  : u['password'],
+							'profile'   : LMC.profiles.guess_one(u['profile']),
+							'in_groups' : [ LMC.groups.guess_one(g)
+												for g in u['group'] ]
+										if u['group'] is not None else []
+						}
 
-					_kwargs = {}
 					if u.get('gecos', None) is not None:
-						_kwargs.update({'gecos' : u['gecos']})
+						account['gecos'] = u['gecos']
 					else:
-						_kwargs.update({'firstname' : u['firstname'],
-							'lastname' : u['lastname']})
-
-
-
-					user, password = LMC.users.add_User(
-											login=u['login'],
-											password=u['password'],
-											profile=LMC.profiles.guess_one(u['profile']),
-											in_groups=in_groups,
-											batch=opts.no_sync, **_kwargs)
-
-					logging.progress('\r' + _(u'Added user {0} {1} '
-						'[login={2}, uid={3}, passwd={4}] ({5}/{6}); '
-						'progress: {7}%').format(u['firstname'], u['lastname'],
-						user.login, user.uidNumber, u['password'], i,
-						length_users, math.ceil(progression)), to_local=False)
-
-					# Get a chance for events to be forwarded,
-					# force thread switch in the interpreter.
-					time.sleep(0)
-
-					# the dictionnary key is forged to have something that is sortable.
-					# like this, the user accounts will be sorted in their group.
-					for _group in in_groups:
-						data_to_export_to_html[ _group.name ][
-								'%s%s' % (u['lastname'], u['firstname'])
-							] = [ u['firstname'], u['lastname'],
-									user.login, password ]
-
-					if not in_groups:
-						if profile is None:
-							_profile = u['profile']
-						else:
-							_profile = profile.group.name
+						account['firstname'] = u['firstname']
+						account['lastname']  = u['lastname']
 
-						data_to_export_to_html[_profile][
-								'%s%s' % (u['lastname'], u['firstname'])
-							] = [ u['firstname'], u['lastname'],
-									user.login, password ]
+					accounts.append(account)
+					imported.append(u)
 
-				else:
+				fct_output(_(u'Creating {0} user accounts…').format(
+														len(accounts)) + '\n')
+
+				results = LMC.users.add_Users(accounts, force=opts.force)
+
+			except:
+				for group in created_groups:
+					LMC.groups.del_Group(group, no_archive=True)
+
+				raise
+
+			for u, account, (user, password) in zip(imported, accounts, results):
+
+				# the dictionnary key is forged to have something that is sortable.
+				# like this, the user accounts will be sorted in their group.
+				for _group in account['in_groups']:
+					data_to_export_to_html[ _group.name ][
+							'%s%s' % (u['lastname'], u['firstname'])
+						] = [ u['firstname'], u['lastname'],
+								user.login, password ]
+
+				if not account['in_groups']:
+					if profile is None:
+						_profile = u['profile']
+					else:
+						_profile = profile.group.name
+
+					data_to_export_to_html[_profile][
+							'%s%s' % (u['lastname'], u['firstname'])
+						] = [ u['firstname'], u['lastname'],
+								user.login, password ]
+
+		else:
+			i = 0
+			for u in users_to_add:
+				try:
+					i += 1
 					# Why make_login() for examples and not prepare the logins
 					# when loading CSV file? this is a pure arbitrary choice.
 					# It just feels more consistent for me.
@@ -1085,21 +1136,21 @@ class RealWorldInterface(NamedObject, ListenerObject, Pyro.core.ObjBase):
 						# 10 examples should be sufficient for admin
 						# to see if his options are correct or not.
 						break
-				progression += delta
+					progression += delta
 
-			except exceptions.AlreadyExistsException, e:
-				logging.warning(str(e), to_local=False)
-				progression += delta
-				# FIXME: if user already exists,
-				# don't put it in the data / HTML report.
-				continue
+				except exceptions.AlreadyExistsException, e:
+					logging.warning(str(e), to_local=False)
+					progression += delta
+					# FIXME: if user already exists,
+					# don't put it in the data / HTML report.
+					continue
 
-			except exceptions.LicornException, e:
-				# FIXME: flush the listener.?
-				#sys.stdout.flush()
-				pass
+				except exceptions.LicornException, e:
+					# FIXME: flush the listener.?
+					#sys.stdout.flush()
+					pass
 
-			#FIXME sys.stdout.flush()
+				#FIXME sys.stdout.flush()
 
 		#print str(data_to_export_to_html)
 
@@ -321,12 +321,15 @@ class FileSearchRequestHandler(BaseRequestHandler):
 
 			assert logging.debug("%s/HandleQueryRequest(): querying cache." % self.name)
 
+			# the query runs in this thread, on its own connection to the
+			# cache database: it doesn't wait for the cache writer.
 			result = self.cache.query(req[1])
+			msg    = LCN_MSG_STATUS_OK
 
 			assert logging.debug("%s/HandleQueryRequest(): sending result to client." % self.name)
 
-			self.request.send("%s:%d:\n" % (msg, len(result)))
-			map(lambda x: self.request.send("%s\n" % x[0]), result)
+			self.request.sendall("%s:%d:\n%s" % (msg, len(result),
+							''.join("%s\n" % x[0] for x in result)))
 
 		except sqlite.OperationalError, e:
 			logging.warning('%s/HandleQueryRequest(): Database error (%s).' % (self.name, e))
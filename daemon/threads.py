@@ -11,17 +11,22 @@ Copyright (C) 2010 Olivier Cortès <oc@meta-it.fr>
 Licensed under the terms of the GNU GPL version 2.
 """
 
-import time, __builtin__
-from threading   import Thread
+import os, time, select, fcntl, heapq, itertools, __builtin__
+from threading   import Thread, Lock
 from Queue       import Queue
 
 from licorn.foundations           import logging, exceptions
 from licorn.foundations           import process, pyutils
+from licorn.foundations.constants import priorities
 from licorn.foundations.threads   import RLock, Event
 from licorn.foundations.styles    import *
 from licorn.foundations.ltrace    import *
 from licorn.foundations.ltraces   import *
 
+#: the process-wide :class:`TimerService`, see :func:`timer_service`.
+_timer_service      = None
+_timer_service_lock = Lock()
+
 class BaseLicornThread(Thread):
 	""" A simple class of thread which records its own instances, and whose
 		start() method returns the current instance. This allows to instanciate
@@ -229,14 +234,14 @@ class LicornBasicThread(BaseLicornThread):
 		self._stop_event.set()
 		BaseLicornThread.stop(self)
 class GQWSchedulerThread(BaseLicornThread):
-	""" Try to dynamically adapt the number of workers for a given qsize.
-
-		.. warning:: this scheduler is very basic, and in loaded conditions,
-			the priorities will not be respected: if all workers are currently
-			handling jobs, any incoming one (even with a higher priority) will
-			have to wait before beiing processed.
-			This can eventually be avoided by the use of greenlets everywhere
-			in licorn code, but this will need a deeper level of code rewrite.
+	""" Dynamically adapt the number of workers for a given qsize.
+
+		With a :class:`~licorn.foundations.workers.PriorityJobQueue`, the
+		scheduler wakes up as soon as jobs are queued (instead of polling),
+		spawns workers while jobs are waiting and no worker is idle, and the
+		queue keeps some of them reserved for ``HIGH`` priority jobs: an
+		interactive operation doesn't wait behind a network scan or a mass
+		ACL check. Other queues (e.g. the testsuite one) are polled.
 	"""
 	def __init__(self, klass, *a, **kw):
 		BaseLicornThread.__init__(self, *a, **kw)
@@ -258,8 +263,16 @@ class GQWSchedulerThread(BaseLicornThread):
 			self._ = __builtin__.__dict__['_']
 	def dump_status(self, long_output=False, precision=None, as_string=False):
 
+		try:
+			latencies = self.scheduled_class.input_queue.latencies()
+			buckets   = self.scheduled_class.input_queue.latency_buckets
+
+		except AttributeError:
+			latencies = {}
+			buckets   = ()
+
 		if as_string:
-			return _('{0}{1} for {2} [{3} workers; wake up in {4}]\n{5}').format(
+			return _('{0}{1} for {2} [{3} workers; wake up in {4}]\n{5}{6}').format(
 				stylize(ST_RUNNING if self.is_alive() else ST_STOPPED,
 						self.__class__.__name__),
 				'&' if self.daemon else '',
@@ -267,6 +280,8 @@ class GQWSchedulerThread(BaseLicornThread):
 				# `.instances` is the number of instances
 				self.scheduled_class.instances,
 				pyutils.format_time_delta(self.sleep_start_time + self.sleep_time - time.time()),
+				''.join('\t%s\n' % line for line
+							in self.__format_latencies(latencies, buckets)),
 				'\n'.join(('\t%s' % t.dump_status(long_output, precision, as_string))
 									# `._instances` is the list of threads.
 									for t in self.scheduled_class._instances)
@@ -276,7 +291,27 @@ class GQWSchedulerThread(BaseLicornThread):
 			return dict(workers=[ t.dump_status(long_output, precision, as_string)
 									for t in self.scheduled_class._instances ],
 						wake_up=self.sleep_start_time + self.sleep_time,
+						latencies=latencies,
+						latency_buckets=buckets,
 					**process.thread_basic_info(self))
+	def __format_latencies(self, latencies, buckets):
+		""" One line per priority: how many jobs waited less than each bucket
+			bound in the queue. """
+
+		bounds = [ '<%gs' % bound for bound in buckets ] + [
+														'>%gs' % buckets[-1] ]
+
+		for priority in sorted(latencies):
+			try:
+				name = priorities[priority]
+
+			except (KeyError, AttributeError):
+				name = str(priority)
+
+			yield _(u'latency {0}: {1}').format(
+					stylize(ST_NAME, name),
+					', '.join('%s %s' % (stylize(ST_UGID, count), bound)
+						for count, bound in zip(latencies[priority], bounds)))
 	def run(self):
 		assert ltrace_func(TRACE_THREAD)
 
@@ -293,13 +328,15 @@ class GQWSchedulerThread(BaseLicornThread):
 				# job done, until the configured thread limit is reached.
 
 				n_instances = cls.instances
+				idle        = n_instances - cls.busy
 
-				if qsize > 0 and n_instances == cls.busy:
+				if qsize > idle:
 					if n_instances < cls.peers_max:
-						# sleep a lot, because we start a lot of workers,
-						# but no more that 10 seconds.
-						return min(10.0, float(self.spawn_worker(min(qsize,
-											cls.peers_max - n_instances))))
+						self.spawn_worker(min(qsize - idle,
+											cls.peers_max - n_instances))
+
+						# the new workers will settle the queue by themselves.
+						return 2.0 if pressure else 10.0
 
 					else:
 						if time.time() - cls.last_warning > 5.0:
@@ -349,15 +386,22 @@ class GQWSchedulerThread(BaseLicornThread):
 		q          = cls.input_queue
 		prev_qsize = 0
 
+		# `PriorityJobQueue` wakes us up when jobs come in.
+		wait_for_pressure = getattr(q, 'wait_for_pressure', None)
+
 		from licorn.core import LMC
 
+		# did we wake up because jobs were queued? Initially, we need to
+		# spawn enough workers for already queued jobs.
+		pressure = True
+
 		while not self._stop_event.is_set():
 
 			with cls.lock:
 				qsize = q.qsize()
 
 			with self.sleep_lock:
-				if qsize >= prev_qsize:
+				if qsize >= prev_qsize or pressure:
 					self.sleep_time = throttle_up()
 
 				else:
@@ -393,7 +437,15 @@ class GQWSchedulerThread(BaseLicornThread):
 				# Invalid Argument" exception on Unixes (cf. http://bytes.com/topic/python/answers/29389-behaviour-time-sleep-negative-arg).
 				sleep_time = 0
 
-			time.sleep(sleep_time)
+			if wait_for_pressure is None:
+				time.sleep(sleep_time)
+
+			else:
+				wait_for_pressure(sleep_time)
+
+				# if we waited less than the full time, a job came in.
+				pressure = time.time() - self.sleep_start_time < sleep_time
+
 		assert ltrace_func(TRACE_THREAD, True)
 	def stop(self):
 		assert ltrace_func(TRACE_THREAD)
@@ -417,6 +469,184 @@ class GQWSchedulerThread(BaseLicornThread):
 			self.scheduled_class.input_queue.put_nowait(
 											self.scheduled_class.stop_packet)
 		return number or 1.0
+class TimerService(BaseLicornThread):
+	""" The one thread which waits for all the timers of the daemon.
+
+		Deadlines are kept in a heap on the :func:`monotonic clock
+		<licorn.foundations.pyutils.monotonic>` (a wall-clock change doesn't
+		make timers fire early or late). The thread sleeps in a
+		:func:`select.select` until the nearest deadline, or until a new
+		nearer one is scheduled (it is then woken up through a pipe). A
+		:class:`threading.Condition` can't be used for that: in Python 2,
+		its timed `wait()` polls.
+
+		Callbacks are run in the service thread: they must be quick, the
+		:class:`AbstractTimerThread` ones just hand the real work over to the
+		worker threads. Get the instance with :func:`timer_service`.
+
+		.. versionadded:: 1.6.1
+	"""
+	def __init__(self):
+		BaseLicornThread.__init__(self, name=self.__class__.__name__)
+
+		self.daemon = True
+
+		self.__lock  = Lock()
+		self.__heap  = []
+		self.__seq   = itertools.count()
+		self.__next  = None
+		self.__stop  = False
+
+		# number of cancelled entries still in the heap.
+		self.__cancelled = 0
+
+		self.__wake_read, self.__wake_write = os.pipe()
+
+		for fd in (self.__wake_read, self.__wake_write):
+			fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+			fcntl.fcntl(fd, fcntl.F_SETFL,
+						fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+		#: number of callbacks run, for :meth:`dump_status`.
+		self.fired = 0
+	def dump_status(self, long_output=False, precision=None, as_string=False):
+
+		with self.__lock:
+			pending = len([ e for e in self.__heap if e[2] is not None ])
+			wake_up = self.__next
+
+		if wake_up is not None:
+			wake_up -= pyutils.monotonic()
+
+		if as_string:
+			return '%s%s [%s timers, %s fired, %s]' % (
+				stylize(ST_RUNNING if self.is_alive() else ST_STOPPED,
+						self.name),
+				'&' if self.daemon else '',
+				pending, self.fired,
+				'idle' if wake_up is None else 'wake up in %s'
+					% pyutils.format_time_delta(wake_up, big_precision=True))
+
+		else:
+			return dict(timers=pending, fired=self.fired, wake_up=wake_up,
+						**process.thread_basic_info(self))
+	def schedule(self, delay, callback, *args):
+		""" Run ``callback(*args)`` in `delay` seconds, from the service
+			thread. Return an opaque entry, to give to :meth:`cancel`. """
+
+		entry = [ pyutils.monotonic() + max(delay, 0.0), self.__seq.next(),
+					callback, args ]
+
+		with self.__lock:
+			heapq.heappush(self.__heap, entry)
+
+			# wake the thread only if it sleeps past our deadline.
+			wake = self.__next is None or entry[0] < self.__next
+
+			if wake:
+				self.__next = entry[0]
+
+		if wake:
+			self.__wake()
+
+		return entry
+	def cancel(self, entry):
+		""" Cancel a scheduled callback. Does nothing if it already ran. The
+			entry stays in the heap until its deadline, where it is skipped
+			(no need to re-sort it), or until too many entries are cancelled.
+		"""
+
+		with self.__lock:
+			if entry[2] is None:
+				return
+
+			entry[2] = None
+			entry[3] = None
+
+			self.__cancelled += 1
+
+			# timers reset often with long delays would make the heap grow.
+			if self.__cancelled > 64 and self.__cancelled * 2 > len(self.__heap):
+				self.__heap[:] = [ e for e in self.__heap if e[2] is not None ]
+				heapq.heapify(self.__heap)
+				self.__cancelled = 0
+	def pending(self, entry):
+		""" Return ``True`` if the callback of `entry` has neither run nor
+			been cancelled yet. """
+
+		return entry[2] is not None
+	def __wake(self):
+		try:
+			os.write(self.__wake_write, 'x')
+
+		except OSError:
+			# EAGAIN: the pipe is full, the thread will wake up anyway.
+			pass
+	def run(self):
+		assert ltrace_func(TRACE_THREAD)
+
+		heap = self.__heap
+
+		while not self.__stop:
+			due = []
+
+			with self.__lock:
+				now = pyutils.monotonic()
+
+				while heap and (heap[0][0] <= now or heap[0][2] is None):
+					entry = heapq.heappop(heap)
+
+					if entry[2] is None:
+						self.__cancelled -= 1
+
+					else:
+						due.append((entry[2], entry[3]))
+						entry[2] = None
+
+				self.__next = heap[0][0] if heap else None
+
+			for callback, args in due:
+				try:
+					callback(*args)
+
+				except:
+					logging.exception(_(u'{0}: exception in timer callback '
+								u'{1}'), (ST_NAME, self.name), callback)
+
+				self.fired += 1
+
+			# callbacks could have scheduled new deadlines: don't sleep
+			# without having looked at them.
+			if due:
+				continue
+
+			timeout = None if self.__next is None else max(0.0,
+											self.__next - pyutils.monotonic())
+
+			try:
+				if select.select([ self.__wake_read ], [], [], timeout)[0]:
+					os.read(self.__wake_read, 4096)
+
+			except (select.error, OSError):
+				# EINTR, just loop.
+				pass
+
+		assert ltrace_func(TRACE_THREAD, True)
+	def stop(self):
+		self.__stop = True
+		self.__wake()
+		BaseLicornThread.stop(self)
+def timer_service():
+	""" Return the :class:`TimerService` of the current process, starting it
+		on first call. """
+
+	global _timer_service
+
+	with _timer_service_lock:
+		if _timer_service is None:
+			_timer_service = TimerService().start()
+
+	return _timer_service
 class AbstractTimerThread(LicornBasicThread):
 	""" Base (abstract) class for any advanced timer thread:
 
@@ -442,11 +672,25 @@ class AbstractTimerThread(LicornBasicThread):
 
 		.. versionadded:: 1.2.4
 
+		.. versionchanged:: 1.6.1 despite the name and the
+			:class:`~threading.Thread` interface (:meth:`start`,
+			:meth:`stop`, :meth:`is_alive`, :meth:`join`), no system thread
+			is started anymore: the waits are handled by the
+			:func:`timer_service`, and :meth:`run_action_method` runs in the
+			service workers (or directly in the timer service if
+			:attr:`run_inline` is ``True``). Between two runs, a timer costs
+			one heap entry, instead of a thread waking up every 10ms.
+
 		.. warning:: This class is an abstract one, it does nothing besides
 			sleeping. All inheriting classes must implement a
 			``run_action_method``, else they will fail.
 
 	"""
+
+	#: run :meth:`run_action_method` directly in the timer service, instead
+	#: of a service worker. Only for very quick, non-blocking actions.
+	run_inline = False
+
 	def __init__(self, *args, **kwargs):
 
 		# Pop our args to not bother upper classes.
@@ -462,21 +706,25 @@ class AbstractTimerThread(LicornBasicThread):
 		self.count  = count
 		self.daemon = daemon
 
-		# lock used when accessing self.time_elapsed and self.sleep_delay
+		# protects all the private attributes below, which are shared between
+		# the timer service, the worker running our action and the callers of
+		# reset() / trigger() / stop().
 		self._time_lock = RLock()
 
-		# these 2 variable are internal to the sleep() method, but can be used
-		# R/O in remaining_time().
-		self.__time_elapsed = 0.0
-		self.__sleep_delay  = None
+		self.current_loop    = 0
+		self.__generation    = 0
+		self.__started       = False
+		self.__running       = False
+		self.__entry         = None
+		self.__deadline      = None
+		self.__sleep_delay   = None
 
-		#: used when we want to reset the timer, without running our action.
-		self._reset_event = Event()
+		#: a trigger which comes while the action runs is applied to the next
+		#: wait: ``(delay, )`` or ``None`` when there is none pending.
+		self.__pending_trigger = None
 
-		#: used when we force running our action without waiting the full
-		#: delay. This event is triggered from the outside using methods.
-		self._trigger_event = Event()
-		self.__trigger_delay = None
+		#: set when the timer will not run its action anymore.
+		self._finished_event = Event()
 
 		if self.count is None:
 			self.loop = True
@@ -495,59 +743,141 @@ class AbstractTimerThread(LicornBasicThread):
 		if (self.loop or self.count > 1) and self.delay is None:
 			raise exceptions.BadArgumentError(
 				'must provide a delay for looping.')
-	def sleep(self, delay=None):
-		""" sleep at most self.delay, but with smaller intervals, to allow
-			interruption without waiting to the end of self.delay, which can
-			be very long.
+	def start(self):
+		""" Arm the timer. Like for a real thread, this can be done only once.
 		"""
 
-		if delay:
-			self.__sleep_delay = delay
+		with self._time_lock:
+			if self.__started:
+				raise RuntimeError('threads can only be started once')
 
-		else:
-			self.__sleep_delay = self.delay
+			self.__started = True
+
+			# first occurence: we need to wait until time if it is set. If
+			# already passed, the job is done as soon as possible.
+			if self.time:
+				self.__arm(self.time - time.time())
+
+			else:
+				# we just have to wait a delay before starting (this is a
+				# simple timer thread).
+				self.__arm(self.delay or 0.0)
+
+		return self
+	def is_alive(self):
+		""" ``True`` from :meth:`start` until the last run of the action (or
+			:meth:`stop`). """
+		return self.__started and not self._finished_event.is_set()
+	isAlive = is_alive
+	def join(self, timeout=None):
+		""" Wait until the timer is finished, including a possibly running
+			action. """
+
+		if not self.__started:
+			raise RuntimeError('cannot join thread before it is started')
+
+		self._finished_event.wait(timeout)
+	def __arm(self, delay):
+		""" (Re-)schedule our next run in `delay` seconds. Must be called
+			with the lock held. """
+
+		service = timer_service()
+
+		if self.__entry is not None:
+			service.cancel(self.__entry)
+
+		# a cancelled entry can already be in the hands of the service:
+		# the generation tells __fire() it is outdated.
+		self.__generation += 1
+
+		self.__sleep_delay = max(delay, 0.0)
+		self.__deadline    = pyutils.monotonic() + self.__sleep_delay
+		self.__entry       = service.schedule(self.__sleep_delay, self.__fire,
+														self.__generation)
 
 		assert ltrace(TRACE_THREAD, '| %s.sleep(%s)' % (self.name, delay))
+	def __fire(self, generation):
+		""" Called by the timer service at our deadline. """
 
 		with self._time_lock:
-			self.__time_elapsed = 0.0
+			if generation != self.__generation or self.__entry is None:
+				return
 
-		while self.__time_elapsed < self.__sleep_delay:
-			#print "waiting %.1f < %.1f" % (current_delay, self.delay)
+			self.__entry = None
 
 			if self._stop_event.is_set():
-				break
+				return
 
-			if self._reset_event.is_set():
-				logging.progress(_(u'{0}: timer reset after {1} elapsed.').format(
-						stylize(ST_NAME, self.name),
-						pyutils.format_time_delta(self.__time_elapsed,
-													big_precision=True)))
+			self.__running = True
 
-				with self._time_lock:
-					self.__time_elapsed = 0.0
+		if self.run_inline:
+			self.__run_action()
 
-				self._reset_event.clear()
+		else:
+			# lazy import, the workers module imports us.
+			from licorn.foundations.workers import workers
 
-			if self._trigger_event.is_set():
-				with self._time_lock:
-					if self.__trigger_delay is None:
-						self.__time_elapsed = self.__sleep_delay
-					else:
-						self.__time_elapsed = self.__sleep_delay - self.__trigger_delay
-				self._trigger_event.clear()
+			workers.service_enqueue(priorities.NORMAL, self.__run_action)
+	def __run_action(self):
+		""" Run our action once, then wait again or finish. """
 
-			time.sleep(0.01)
-			with self._time_lock:
-				self.__time_elapsed += 0.01
+		if not self._stop_event.is_set():
+			try:
+				self.run_action_method()
 
-		assert ltrace(TRACE_THREAD, '| %s.sleep(EXIT)' % self.name)
+			except:
+				logging.exception(_(u'{0}: Exception in self.run_action_method(), '
+						u'continuing.'), (ST_NAME, self.name))
+
+		with self._time_lock:
+			self.__running     = False
+			self.current_loop += 1
+
+			if self._stop_event.is_set() or not (self.loop
+											or self.current_loop < self.count):
+				self.__finish()
+
+			elif self.__pending_trigger is not None:
+				self.__arm(self.__pending_trigger[0] or 0.0)
+				self.__pending_trigger = None
+
+			else:
+				self.__arm(self.delay)
+	def __finish(self):
+		if not self._finished_event.is_set():
+			self._finished_event.set()
+			LicornBasicThread.finish(self)
+	def sleep(self, delay=None):
+		""" Kept for compatibility: the waits are not done in our own thread
+			anymore. Re-arm the timer to run in `delay` seconds (default:
+			:attr:`delay`). """
+
+		with self._time_lock:
+			self.__arm(self.delay if delay is None else delay)
 	def trigger_event(self, delay=None):
-		self.__trigger_delay = delay
-		self._trigger_event.set()
+		""" Run the action now, or in `delay` seconds if given. If the action
+			is currently running, this applies to the next wait. """
+
+		with self._time_lock:
+			if self.__entry is not None:
+				self.__arm(delay or 0.0)
+
+			elif self.__running:
+				self.__pending_trigger = (delay, )
 	trigger = trigger_event
 	def reset_timer(self):
-		self._reset_event.set()
+		""" Restart the current wait from the beginning, without running the
+			action. """
+
+		with self._time_lock:
+			if self.__entry is not None:
+				logging.progress(_(u'{0}: timer reset after {1} elapsed.').format(
+					stylize(ST_NAME, self.name),
+					pyutils.format_time_delta(self.__sleep_delay
+											- self.remaining_time(),
+											big_precision=True)))
+
+				self.__arm(self.__sleep_delay)
 	#: :meth:`reset` is an alias to :meth:`reset_timer`
 	reset = reset_timer
 	def remaining_time(self):
@@ -557,46 +887,43 @@ class AbstractTimerThread(LicornBasicThread):
 			if self.__sleep_delay is None:
 				raise exceptions.LicornRuntimeException(
 										'%s: not yet started.' % self.name)
-			return self.__sleep_delay - self.__time_elapsed
-	def run(self):
-		""" TODO. """
-
-		self.current_loop = 0
 
-		# first occurence: we need to wait until time if it is set.
-		if self.time:
-			# only sleep 'til initial time if not already passed. Else just run
-			# the loop, to have the job done as soon as possible.
-			first_delay = self.time - time.time()
-			if first_delay > 0:
-				self.sleep(first_delay)
-		elif self.delay:
-			# we just have to wait a delay before starting (this is a
-			# simple timer thread).
-			self.sleep()
+			if self.__entry is None:
+				# running or finished.
+				return 0.0
 
-		while self.loop or self.current_loop < self.count:
+			return max(0.0, self.__deadline - pyutils.monotonic())
+	def stop(self):
+		""" Cancel the timer. A currently running action is not interrupted,
+			:meth:`join` waits for it. """
 
-			if self._stop_event.is_set():
-				break
+		LicornBasicThread.stop(self)
 
-			self.run_action_method()
+		with self._time_lock:
+			if self.__entry is not None:
+				timer_service().cancel(self.__entry)
+				self.__entry = None
 
-			self.current_loop += 1
-			self.sleep()
-		LicornBasicThread.finish(self)
-class GenericQueueWorkerThread(AbstractTimerThread):
-	""" Inherits from :class:`AbstractTimerThread` to be able to be interrupted
-		in the middle of a :meth:`sleep` triggered by a ``job_delay``. The
-		:meth:`run` method of the :class:`AbstractTimerThread` is totally
-		overriden though, and is never called, this is intended. We just need
-		the :meth:`sleep` one. The :meth:`stop` method comes from
-		:class:`LicornBasicThread`.
+			if not self.__running:
+				self.__finish()
+	def run(self):
+		""" Never called: the timer service drives us. """
+		raise RuntimeError(_(u'{0}: timers have no thread to run in.').format(
+																	self.name))
+class GenericQueueWorkerThread(LicornBasicThread):
+	""" A worker thread, which runs the jobs of its class ``input_queue``.
+		It can be interrupted in the middle of a :meth:`sleep` triggered by
+		a ``job_delay``, not only when idle.
 
 		.. versionadded::
 			- created for the 1.2.5
 			- enhanced for the 1.5: add the ability to stop the thread in the
 			  middle of a sleep, not only when the thread is idle.
+
+		.. versionchanged:: 1.6.1 doesn't inherit from
+			:class:`AbstractTimerThread` anymore, whose instances are not real
+			threads now. The :meth:`sleep` is done by the
+			:func:`timer_service`, instead of polling.
 	"""
 
 	_setup_done  = False
@@ -611,11 +938,16 @@ class GenericQueueWorkerThread(AbstractTimerThread):
 	scheduler    = None
 
 	@classmethod
-	def setup(cls, licornd, input_queue, peers_min, peers_max, daemon=False):
+	def setup(cls, licornd, input_queue, peers_min, peers_max, daemon=False,
+																reserved=1):
 		""" Setup The Worker class. Starts the Scheduler thread, and return it.
 
 			You have to store the scheduler reference somewhere!
 
+			`reserved` is the number of workers that only ``HIGH`` priority
+			jobs can use, if `input_queue` supports it (see
+			:class:`~licorn.foundations.workers.PriorityJobQueue`).
+
 			To stop the workers, invoke the scheduler `stop()` method.
 		"""
 
@@ -628,6 +960,10 @@ class GenericQueueWorkerThread(AbstractTimerThread):
 		cls.peers_min   = peers_min
 		cls.peers_max   = peers_max
 
+		if hasattr(input_queue, 'capacity'):
+			# keep workers for HIGH priority jobs.
+			input_queue.capacity = max(1, peers_max - reserved)
+
 		#: a reference to the licorn daemon
 		cls.licornd = licornd
 
@@ -660,15 +996,13 @@ class GenericQueueWorkerThread(AbstractTimerThread):
 			'tname'   : '%s-%03d' % (cls.__name__, cls.counter),
 			'daemon'  : cls.daemon,
 			'licornd' : cls.licornd,
-
-			# FAKE: we pass 1 for the AbstractTimerThread.__init__() not to
-			# bother us with 'must provide a delay for looping' check error.
-			# Anyway, as we override completely its run() method, this has
-			# no importance at all for the runtime, *we* loop like we want.
-			'count'   : 1,
 		})
 
-		AbstractTimerThread.__init__(self, *a, **kw)
+		LicornBasicThread.__init__(self, *a, **kw)
+
+		#: set by the timer service at the end of a :meth:`sleep`, or by
+		#: :meth:`stop` to interrupt it.
+		self._wakeup_event = Event()
 
 		# trap the original gettext translator, to avoid the builtin '_'
 		# trigerring an exception everytime we need to translate a string.
@@ -718,6 +1052,26 @@ class GenericQueueWorkerThread(AbstractTimerThread):
 							start_time=self.job_start_time,
 							jobbing=self.jobbing.is_set(),
 							**process.thread_basic_info(self))
+	def sleep(self, delay):
+		""" Wait `delay` seconds, or less if the thread is stopped meanwhile.
+		"""
+
+		if delay <= 0:
+			return
+
+		self._wakeup_event.clear()
+
+		service = timer_service()
+		entry   = service.schedule(delay, self._wakeup_event.set)
+
+		if not self._stop_event.is_set():
+			# no timeout: a timed wait() would poll.
+			self._wakeup_event.wait()
+
+		service.cancel(entry)
+	def stop(self):
+		LicornBasicThread.stop(self)
+		self._wakeup_event.set()
 	def __format_job(self):
 
 		try:
@@ -868,6 +1222,9 @@ class TriggerTimerThread(AbstractTimerThread):
 			daemon=daemon, tname=tname)
 
 		self._trigger_event = trigger_event
+	#: setting an event is quick enough to be done by the timer service.
+	run_inline = True
+
 	def run_action_method(self):
 		return self._trigger_event.set()
 class TriggerWorkerThread(LicornBasicThread):
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Licorn Daemon - http://dev.licorn.org/documentation/daemon
+
+threads test - the timer service and the timers built on it.
+
+:copyright:
+	* 2012 Olivier Cortès <olive@deep-ocean.net>
+:license: GNU GPL version 2
+"""
+
+import time, threading
+
+from licorn.foundations.pyutils import monotonic
+from licorn.daemon.threads      import timer_service, LicornJobThread, \
+										TriggerTimerThread
+
+class InlineJobThread(LicornJobThread):
+	""" Don't bother with the service workers, which are not started here. """
+	run_inline = True
+
+def test_schedule_and_cancel():
+	service = timer_service()
+	fired   = []
+
+	service.schedule(0.05, fired.append, 'late')
+	service.schedule(0.01, fired.append, 'early')
+	service.cancel(service.schedule(0.02, fired.append, 'cancelled'))
+
+	time.sleep(0.2)
+
+	assert fired == [ 'early', 'late' ]
+def test_one_shot():
+	fired = []
+	start = monotonic()
+	timer = InlineJobThread(lambda: fired.append(monotonic()),
+						time=time.time() + 0.1, count=1).start()
+
+	assert timer.is_alive()
+	assert 0 < timer.remaining_time() <= 0.1
+
+	timer.join(1)
+
+	assert not timer.is_alive()
+	assert len(fired) == 1 and fired[0] - start >= 0.1
+def test_repeat_and_stop():
+	fired = []
+	timer = InlineJobThread(lambda: fired.append(1), delay=0.01).start()
+
+	time.sleep(0.2)
+	timer.stop()
+	count = len(fired)
+	time.sleep(0.05)
+
+	assert count > 3 and len(fired) == count
+	assert not timer.is_alive()
+def test_reset_and_trigger():
+	event = threading.Event()
+	start = monotonic()
+	timer = TriggerTimerThread(event, delay=0.2, count=1).start()
+
+	time.sleep(0.1)
+	timer.reset()
+
+	# the reset restarted the full delay.
+	assert not event.wait(0.15)
+	assert event.wait(1) and monotonic() - start >= 0.3
+
+	event.clear()
+	timer = TriggerTimerThread(event, delay=3600, count=1).start()
+	timer.trigger()
+
+	assert event.wait(1)
@@ -13,7 +13,6 @@ Extensions can "extend" :ref:`CoreController`s
 """
 
 import os, time
-from threading import Timer
 from licorn.foundations.threads import RLock
 
 from licorn.foundations           import logging, exceptions, settings
@@ -22,11 +21,13 @@ from licorn.foundations.styles    import *
 from licorn.foundations.ltrace    import *
 from licorn.foundations.ltraces   import *
 from licorn.foundations.events    import LicornEvent
+from licorn.foundations.workers   import workers
 from licorn.foundations.base      import DictSingleton
 from licorn.foundations.constants import services, svccmds, roles, priorities
 
 from licorn.core                  import LMC
 from licorn.core.classes          import ModulesManager, CoreModule
+from licorn.daemon.threads        import timer_service
 
 class ExtensionsManager(DictSingleton, ModulesManager):
 	""" Store and manage all Licorn® extensions instances. For now, this
@@ -182,6 +183,9 @@ class ServiceExtension(LicornExtension):
 		#: in ran while this one has not yet completed.
 		self.planned_operation = None
 
+		#: the timer service entry of the delayed command, to reset it.
+		self.command_timer = None
+
 		#: the delay the timer will wait before trigerring the service command.
 		#: any repetition of the same command within this delay will reset it.
 		self.delay = 2.0
@@ -246,34 +250,21 @@ class ServiceExtension(LicornExtension):
 		return self.service_command(svccmds.RESTART)
 	def service_command(self, command_type):
 		""" Run a service operation at the system level. This method will
-			create a :class:`~threading.Timer` thread with a small delay, to
-			optimize batched operations: the service command will not be issued
-			if another command (same type) comes while the timer is running.
+			schedule it with a small delay on the
+			:func:`~licorn.daemon.threads.timer_service`, to optimize batched
+			operations: the service command will not be issued if another
+			command (same type) comes while the timer is running. When the
+			delay expires, the command is run by a service worker.
 
 			This methods
 		"""
 
 		assert ltrace(globals()['TRACE_' + self.name.upper()], '| service_command(%s)' % command_type)
 
-		command = ServiceExtension.commands[self.service_type][command_type][:]
-		command.insert(ServiceExtension.commands[self.service_type][
-							svccmds.POSITION], self.service_name)
-
-		if self.service_long:
-			pre_message = ServiceExtension.messages_long[command_type] % (
-							stylize(ST_NAME, self.service_name))
-		else:
-			pre_message = None
-
-		post_message = ServiceExtension.messages[command_type].format(
-						stylize(ST_NAME, self.service_name), '%s')
-
-		thread_kwargs = {
-				'command'      : command,
-				'pre_message'  : pre_message,
-				'post_message' : post_message,
-				'svcext'       : self
-			}
+		# the timer service thread only hands the command to a worker.
+		timer_args = (self.delay, workers.service_enqueue, priorities.NORMAL,
+						run_service_command) \
+					+ self.__service_command_args(command_type) + (self, )
 
 		if self.planned_operation:
 			if self.planned_operation != command_type:
@@ -304,18 +295,11 @@ class ServiceExtension(LicornExtension):
 					waited += 0.1
 
 			with self.locks.command:
-				# reset the timer.
-				try:
-					self.threads.command.cancel()
-					del self.threads.command
-
-				except (AttributeError, KeyError):
-					# no timer launched.
-					pass
+				# reset the timer (does nothing if it already fired).
+				if self.command_timer is not None:
+					timer_service().cancel(self.command_timer)
 
-				self.threads.command = Timer(self.delay,
-							run_service_command, kwargs=thread_kwargs)
-				self.threads.command.start()
+				self.command_timer = timer_service().schedule(*timer_args)
 
 		else:
 			with self.locks.command:
@@ -324,21 +308,45 @@ class ServiceExtension(LicornExtension):
 				assert ltrace(globals()['TRACE_' + self.name.upper()], '| service_command: delaying '
 					'operation in case there are others coming after this one.')
 
-				try:
-					# wipe any traces of older job to reclaim resources.
-					del self.threads.command
+				self.command_timer = timer_service().schedule(*timer_args)
+	def service_command_now(self, command_type):
+		""" Run a service operation right now, in the calling thread,
+			instead of delaying it like :meth:`service_command`. Useful at
+			daemon shutdown, when a delayed command would never run. A
+			delayed command not yet started is cancelled: this one
+			replaces it. """
 
-				except (AttributeError, KeyError):
-					# happens when no command thread has been started yet.
-					pass
+		with self.locks.command:
+			if self.command_timer is not None:
+				timer_service().cancel(self.command_timer)
+				self.command_timer = None
+
+			self.planned_operation = command_type
+
+			run_service_command(*self.__service_command_args(command_type)
+																+ (self, ))
+	def __service_command_args(self, command_type):
+		""" Return the command line, pre and post messages of a service
+			operation, for :func:`run_service_command`. """
+
+		command = ServiceExtension.commands[self.service_type][command_type][:]
+		command.insert(ServiceExtension.commands[self.service_type][
+							svccmds.POSITION], self.service_name)
+
+		if self.service_long:
+			pre_message = ServiceExtension.messages_long[command_type] % (
+							stylize(ST_NAME, self.service_name))
+		else:
+			pre_message = None
+
+		post_message = ServiceExtension.messages[command_type].format(
+						stylize(ST_NAME, self.service_name), '%s')
 
-				self.threads.command = Timer(self.delay,
-								run_service_command, kwargs=thread_kwargs)
-				self.threads.command.start()
+		return command, pre_message, post_message
 def run_service_command(command, pre_message=None, post_message=None,
 															svcext=None):
-	""" This is the "real" function ran by the :class:`~threading.Timer`
-		thread, managed by the :meth:`~ServiceExtension.service_command`
+	""" This is the "real" function ran by a service worker, after the
+		delay managed by the :meth:`~ServiceExtension.service_command`
 		method.
 
 		It is in charge of displaying messages if given, and run the real
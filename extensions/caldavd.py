@@ -14,9 +14,10 @@ import os, uuid
 from traceback import print_exc
 import xml.etree.ElementTree as ET
 
-from licorn.foundations           import logging, pyutils, fsapi, network
+from licorn.foundations           import settings, logging, pyutils, fsapi, network
 from licorn.foundations           import readers, writers, events
 from licorn.foundations.workers   import workers
+from licorn.foundations.threads   import RLock
 from licorn.foundations.styles    import *
 from licorn.foundations.ltrace    import *
 from licorn.foundations.ltraces   import *
@@ -61,6 +62,25 @@ class CaldavdExtension(ObjectSingleton, ServiceExtension):
 
 		self.data = LicornConfigObject()
 
+		#: the accounts XML elements, by ``(type, uid)``.
+		self.__index = {}
+
+		# protects the accounts tree, its index and the counters below.
+		self.__lock = RLock()
+
+		#: changes are written and caldavd restarted at most once per
+		#: window of `write_delay` seconds.
+		self.write_delay = float(settings.get(
+								'extensions.caldavd.write_delay', 2.0))
+
+		self.__changes         = 0
+		self.__flush_scheduled = False
+
+		#: number of caldavd restarts, and of restarts saved by grouping
+		#: the changes.
+		self.restarts          = 0
+		self.restarts_avoided  = 0
+
 		if LMC.configuration.distro in (distros.UBUNTU, distros.LICORN,
 										distros.DEBIAN):
 			self.paths.service_defaults = '/etc/default/calendarserver'
@@ -124,6 +144,11 @@ class CaldavdExtension(ObjectSingleton, ServiceExtension):
 
 		self.data.accounts = readers.xml_load_tree(self.paths.accounts)
 
+		with self.__lock:
+			self.__index = dict(((xmldata.tag, xmldata.find('uid').text), xmldata)
+								for xmldata in self.data.accounts.getroot()
+									if xmldata.find('uid') is not None)
+
 		self.data.configuration = readers.plist_load_dict(
 											self.paths.configuration)
 	def is_enabled(self):
@@ -238,21 +263,74 @@ class CaldavdExtension(ObjectSingleton, ServiceExtension):
 		""" Write the XML accounts file to disk, after having backed it up. """
 		assert ltrace_func(TRACE_CALDAVD)
 
-		# TODO: assert self.locks.accounts.is_locked()
-		writers.xml_write_from_tree(self.data.accounts, self.paths.accounts, mode=0640)
-		# TODO: self.locks.accounts.release()
+		with self.__lock:
+			writers.xml_write_from_tree(self.data.accounts, self.paths.accounts, mode=0640)
+
 		return True
 	def __write_accounts_and_reload(self):
 		""" Write the accounts file and reload the caldavd service.	A reload
 			is needed, else caldavd doesn't see new user accounts and resources.
+
+			This is done at the end of a :attr:`write_delay` window: all the
+			changes done meanwhile (e.g. a mass import) are written at once,
+			and caldavd is restarted only once.
 		"""
 		assert ltrace_func(TRACE_CALDAVD)
 
-		self.__write_accounts()
+		with self.__lock:
+			self.__changes += 1
+
+			if self.__flush_scheduled:
+				self.restarts_avoided += 1
+				return
+
+			self.__flush_scheduled = True
 
+		self.__schedule_flush()
+	def __schedule_flush(self):
 		# fu...ing caldavd service which doesn't understand reload.
 		# we put this in a service thread to avoid the long wait.
-		workers.service_enqueue(priorities.NORMAL, self.service, svccmds.RESTART)
+		workers.service_enqueue(priorities.NORMAL, self.__flush_accounts,
+												job_delay=self.write_delay)
+	def __flush_accounts(self):
+		""" Write the changes of the window, and restart caldavd. Changes
+			done during the restart will be written by the next window. """
+
+		assert ltrace_func(TRACE_CALDAVD)
+
+		with self.__lock:
+			changes, self.__changes = self.__changes, 0
+
+			if not changes:
+				# already written at daemon shutdown.
+				self.__flush_scheduled = False
+				return
+
+		try:
+			# if the write fails, the finally clause still reschedules
+			# (or clears `__flush_scheduled`), else no change would ever
+			# be written again.
+			with self.__lock:
+				self.__write_accounts()
+
+			self.service(svccmds.RESTART)
+
+		finally:
+			with self.__lock:
+				self.restarts += 1
+
+				# keep `__flush_scheduled` while we reschedule, to never
+				# have two restarts at the same time.
+				self.__flush_scheduled = self.__changes > 0
+
+			logging.progress(_(u'{0}: wrote {1} change(s) and restarted {2} '
+				u'({3} restart(s), {4} avoided so far).').format(
+					stylize(ST_NAME, self.name), changes,
+					stylize(ST_NAME, self.service_name), self.restarts,
+					self.restarts_avoided))
+
+			if self.__flush_scheduled:
+				self.__schedule_flush()
 	def users_load(self):
 		""" eventually load users-related data. Currently this method does
 			nothing. """
@@ -272,7 +350,10 @@ class CaldavdExtension(ObjectSingleton, ServiceExtension):
 		"""
 		assert ltrace_func(TRACE_CALDAVD)
 
+		# the caller holds the lock until the account is complete.
 		account = ET.SubElement(self.data.accounts.getroot(), acttype)
+		self.__index[(acttype, uid)] = account
+
 		account.text = '\n	'
 		account.tail = '\n'
 
@@ -294,75 +375,80 @@ class CaldavdExtension(ObjectSingleton, ServiceExtension):
 
 		assert ltrace_func(TRACE_CALDAVD)
 
-		user = self.__create_account('user', uid, guid, name)
+		with self.__lock:
+			user = self.__create_account('user', uid, guid, name)
 
-		xmlpwd = ET.SubElement(user, 'password')
-		xmlpwd.text = password
-		xmlpwd.tail = '\n'
-		return True
+			xmlpwd = ET.SubElement(user, 'password')
+			xmlpwd.text = password
+			xmlpwd.tail = '\n'
+			return True
 	def add_group(self, uid, guid, name, **kwargs):
 		""" Create a caldav group account. """
 
 		assert ltrace_func(TRACE_CALDAVD)
 
-		group = self.__create_account('group', uid, guid, name)
+		with self.__lock:
+			group = self.__create_account('group', uid, guid, name)
 
-		xmlmembers = ET.SubElement(group, 'members')
-		xmlmembers.text = '\n	'
-		xmlmembers.tail = '\n'
-		return True
+			xmlmembers = ET.SubElement(group, 'members')
+			xmlmembers.text = '\n	'
+			xmlmembers.tail = '\n'
+			return True
 	def add_resource(self, uid, guid, name, type, gst_uid=None, **kwargs):
 		""" Create a caldav resource account. """
 
 		assert ltrace_func(TRACE_CALDAVD)
 
-		resource = self.__create_account('resource', uid, guid, name)
+		with self.__lock:
+			resource = self.__create_account('resource', uid, guid, name)
 
-		xmlproxies = ET.SubElement(resource, 'proxies')
-		xmlproxies.text = '\n		'
-		xmlproxies.tail = '\n'
+			xmlproxies = ET.SubElement(resource, 'proxies')
+			xmlproxies.text = '\n		'
+			xmlproxies.tail = '\n'
 
-		xmlmember = ET.SubElement(xmlproxies, 'member')
-		xmlmember.set('type', type)
-		xmlmember.text = uid
-		xmlmember.tail = '\n	'
+			xmlmember = ET.SubElement(xmlproxies, 'member')
+			xmlmember.set('type', type)
+			xmlmember.text = uid
+			xmlmember.tail = '\n	'
 
-		xmlroproxies = ET.SubElement(resource, 'read-only-proxies')
-		xmlroproxies.text = '\n		'
-		xmlroproxies.tail = '\n'
+			xmlroproxies = ET.SubElement(resource, 'read-only-proxies')
+			xmlroproxies.text = '\n		'
+			xmlroproxies.tail = '\n'
 
-		if gst_uid:
-			xmlromember = ET.SubElement(xmlroproxies, 'member')
-			xmlromember.set('type', type)
-			xmlromember.text = gst_uid
-			xmlromember.tail = '\n	'
+			if gst_uid:
+				xmlromember = ET.SubElement(xmlroproxies, 'member')
+				xmlromember.set('type', type)
+				xmlromember.text = gst_uid
+				xmlromember.tail = '\n	'
 
-		return True
+			return True
 	def add_member(self, name, login, **kwargs):
 		""" Create a new entry in the members element of a group. """
 
 		assert ltrace_func(TRACE_CALDAVD)
 
-		for xmldata in self.data.accounts.findall('group'):
-			if xmldata.find('uid').text == name:
-				xmlmember_list = xmldata.find('members')
+		with self.__lock:
+			xmldata = self.__index.get(('group', name))
 
-				xmlmember = ET.SubElement(xmlmember_list, 'member')
-				xmlmember.set('type', 'users')
-				xmlmember.text = login
-				xmlmember.tail = '\n		'
-				return True
-		return False
+			if xmldata is None:
+				return False
+
+			xmlmember = ET.SubElement(xmldata.find('members'), 'member')
+			xmlmember.set('type', 'users')
+			xmlmember.text = login
+			xmlmember.tail = '\n		'
+			return True
 	def mod_account(self, acttype, uid, attrname, value):
 		""" Alter a caldav account: find a given attribute, then modify its
 			value, then write the configuration to disk and reload the service.
 		"""
 		assert ltrace_func(TRACE_CALDAVD)
 
-		for xmldata in self.data.accounts.findall(acttype):
-			if xmldata.find('uid').text == uid:
-				xmlattr = xmldata.find(attrname)
-				xmlattr.text = value
+		with self.__lock:
+			xmldata = self.__index.get((acttype, uid))
+
+			if xmldata is not None:
+				xmldata.find(attrname).text = value
 				return True
 
 		logging.warning2(_(u'{0}: unable to modify {1} for {2} {3}, not found '
@@ -375,8 +461,10 @@ class CaldavdExtension(ObjectSingleton, ServiceExtension):
 
 		assert ltrace_func(TRACE_CALDAVD)
 
-		for xmldata in self.data.accounts.findall(acttype):
-			if xmldata.find('uid').text == uid:
+		with self.__lock:
+			xmldata = self.__index.pop((acttype, uid), None)
+
+			if xmldata is not None:
 				self.data.accounts.getroot().remove(xmldata)
 				return True
 
@@ -390,10 +478,11 @@ class CaldavdExtension(ObjectSingleton, ServiceExtension):
 
 		assert ltrace_func(TRACE_CALDAVD)
 
-		for xmldata in self.data.accounts.findall('group'):
-			if xmldata.find('uid').text == name:
+		with self.__lock:
+			xmldata = self.__index.get(('group', name))
+
+			if xmldata is not None:
 				for xmlmember in xmldata.findall('members/member'):
-					#logging.warning2('boucle for : membre %s' % xmlmember.text )
 					if xmlmember.text == login:
 						xmldata.find('members').remove(xmlmember)
 						return True
@@ -405,6 +494,27 @@ class CaldavdExtension(ObjectSingleton, ServiceExtension):
 		return False
 	@events.handler_method
 	@only_if_enabled
+	def daemon_shutdown(self, *args, **kwargs):
+		""" Write the changes of the current window and restart caldavd
+			now: the delayed flush would never run. """
+
+		assert ltrace_func(TRACE_CALDAVD)
+
+		with self.__lock:
+			changes, self.__changes = self.__changes, 0
+
+			if not changes:
+				return
+
+			self.__write_accounts()
+
+		self.service_command_now(svccmds.RESTART)
+
+		logging.progress(_(u'{0}: wrote {1} pending change(s) and restarted '
+			u'{2} before stopping.').format(stylize(ST_NAME, self.name),
+				changes, stylize(ST_NAME, self.service_name)))
+	@events.handler_method
+	@only_if_enabled
 	def user_pre_add(self, *args, **kwargs):
 		""" Lock the accounts file in prevision of a change. """
 		#return self.locks.accounts.acquire()
@@ -578,7 +578,6 @@ class RdiffbackupExtension(ObjectSingleton, LicornExtension):
 
 	# a comfort alias
 	statistics = compute_statistics
-	@cache.cached(cache.one_day)
 	def compute_total_space(self, *args, **kwargs):
 		""" This method tries to find the space needed to make a full backup,
 			given the full size of the system, and :program:`rdiff-backup`
@@ -587,6 +586,10 @@ class RdiffbackupExtension(ObjectSingleton, LicornExtension):
 			It computes only an estimation, because it ignores ``**`` entries
 			in the exclusions files. We consider they don't make such a big
 			difference on system with Gb to Tb of data.
+
+			It is not cached anymore: exclusions sizes come from the
+			`volumes` extension size index, which is kept up-to-date and
+			answers quickly.
 		"""
 
 		exclusions = []
@@ -9,10 +9,13 @@ Licorn extensions: samba3 - http://docs.licorn.org/extensions/samba3.html
 
 """
 
-import os, errno
+import os, errno, time, types, hashlib, tempfile
+from threading import Lock
 
 from licorn.foundations           import settings, logging, events
 from licorn.foundations           import process, fsapi
+from licorn.foundations.threads   import Event
+from licorn.foundations.workers   import workers
 from licorn.foundations.styles    import *
 from licorn.foundations.ltrace    import *
 from licorn.foundations.ltraces   import *
@@ -27,6 +30,15 @@ from licorn.extensions   import LicornExtension
 
 import netlogon
 
+def nt_hash(password):
+	""" Return the NT hash of `password` (the MD4 of its UTF-16LE encoding,
+		in upper-case hexadecimal), as stored in :file:`smbpasswd` files. """
+
+	if type(password) != types.UnicodeType:
+		password = password.decode('utf-8')
+
+	return hashlib.new('md4', password.encode('utf-16-le')).hexdigest().upper()
+
 class Samba3Extension(ObjectSingleton, LicornExtension):
 	""" Handle Samba3 the minimal way: just ensure that user accounts are in
 		sync with Samba via :program:`smbpasswd` calls. This implements the exact
@@ -47,6 +59,7 @@ class Samba3Extension(ObjectSingleton, LicornExtension):
 
 		# Path is the same on Ubuntu / Debian
 		self.paths.smbpasswd  = '/usr/bin/smbpasswd'
+		self.paths.pdbedit    = '/usr/bin/pdbedit'
 		self.paths.smb_conf   = '/etc/samba/smb.conf'
 		self.paths.smb_daemon = '/usr/sbin/smbd'
 
@@ -54,6 +67,11 @@ class Samba3Extension(ObjectSingleton, LicornExtension):
 
 		self.__build_default_paths()
 
+		#: accounts queued by batch `user_post_add` events, by login, until
+		#: :meth:`__flush_accounts`.
+		self.__pending      = {}
+		self.__pending_lock = Lock()
+
 		self.users               = LicornConfigObject()
 		self.groups              = LicornConfigObject()
 
@@ -118,6 +136,15 @@ class Samba3Extension(ObjectSingleton, LicornExtension):
 
 			self.has_xdg = process.executable_exists_in_path('xdg-user-dirs-update')
 
+			# batch imports need pdbedit, and an MD4 implementation to
+			# compute the NT hashes (not all hashlib builds have one).
+			try:
+				nt_hash('')
+				self.batch_import = os.path.exists(self.paths.pdbedit)
+
+			except ValueError:
+				self.batch_import = False
+
 		else:
 			logging.info(_(u'{0}: extension disabled because {1} '
 							u' nor ({2} and {3}) not found.').format(
@@ -399,22 +426,108 @@ class Samba3Extension(ObjectSingleton, LicornExtension):
 	@only_if_enabled
 	def user_post_add(self, *args, **kwargs):
 		""" Update Samba user database, mkdir the profile directory and give
-			it to the user. """
+			it to the user. In a batch of creations (``batch`` keyword
+			argument), the account is only queued: :meth:`users_post_add`
+			will do the job for all of them at once. """
 
 		assert ltrace_func(TRACE_SAMBA3)
 
 		user     = kwargs.pop('user')
 		password = kwargs.pop('password')
+		batch    = kwargs.pop('batch', False)
 
 		# we don't deal with system accounts, they don't get a samba account for free.
 		if user.is_system:
 			return True
 
-		all_ok = True
+		if batch:
+			with self.__pending_lock:
+				self.__pending[user.login] = (user.uidNumber, password)
+
+			return True
+
+		all_ok = self.__smbpasswd(user.login, password, '-a')
+
+		# The profiles are just 2 directories, but fsapi.check_full() is
+		# not that quick. The ACL checkers are here for that.
+		workers.aclcheck_enqueue(priorities.NORMAL,
+									self.__check_user_profiles, user)
+
+		return all_ok
+	@events.handler_method
+	@only_if_enabled
+	def users_post_add(self, *args, **kwargs):
+		""" End of a batch of user creations (see
+			:meth:`~licorn.core.users.UsersController.add_Users`): write all
+			the accounts queued by :meth:`user_post_add` to the Samba
+			password database at once, and create their Windows® profiles
+			with the ACL checker threads. Add our figures to the `summary`.
+
+			The profiles are waited for at most
+			:obj:`extensions.samba3.profiles_wait` seconds (30 by default): on a
+			busy system, the figures are then partial and the ACL checkers
+			finish the job in the background.
+
+			.. versionadded:: 1.6.1
+		"""
+
+		assert ltrace_func(TRACE_SAMBA3)
+
+		users   = [ user for user in kwargs.pop('users') if not user.is_system ]
+		summary = kwargs.pop('summary', [])
+
+		start   = time.time()
+		synced  = self.__flush_accounts()
+		flushed = time.time()
+
+		if not users:
+			return True
+
+		lock      = Lock()
+		finished  = Event()
+		remaining = [ len(users) ]
+
+		def done():
+			with lock:
+				remaining[0] -= 1
+
+				if remaining[0] == 0:
+					finished.set()
+
+		for user in users:
+			workers.aclcheck_enqueue(priorities.NORMAL,
+									self.__check_user_profiles, user,
+									full_display=False, done=done)
+
+		# Event.wait() returns None on Python 2.6, don't rely on it.
+		finished.wait(float(settings.get(
+						'extensions.samba3.profiles_wait', 30.0)))
+
+		duration = time.time() - flushed
+
+		with lock:
+			checked = (len(users) - remaining[0]) * 2
+
+		summary.append(_(u'{0}: {1} account(s) synced in {2:.2f}s ({3}), {4} '
+			u'Windows® profiles checked in {5:.2f}s ({6:.1f} profiles/s, by '
+			u'the ACL checkers).{7}').format(self.pretty_name, synced,
+				flushed - start, u'pdbedit import' if self.batch_import
+					else u'smbpasswd', checked, duration,
+				checked / duration if duration else 0,
+				u'' if finished.is_set() else _(u' {0} more are still being '
+					u'checked in the background.').format(
+						len(users) * 2 - checked)))
+
+		return True
+	def __smbpasswd(self, login, password, *options):
+		""" Set the Samba password of `login` with one :program:`smbpasswd`
+			call. Return ``True`` if it worked. """
 
 		try:
-			out, err = process.execute([ self.paths.smbpasswd, '-a', user.login, '-s' ],
+			out, err = process.execute([ self.paths.smbpasswd ] + list(options)
+										+ [ login, '-s' ],
 										'%s\n%s\n' % (password, password))
+
 			if out:
 				logging.info('%s: %s' % (self.pretty_name, out[:-1]))
 
@@ -422,23 +535,88 @@ class Samba3Extension(ObjectSingleton, LicornExtension):
 				logging.warning('%s: %s' % (self.pretty_name, err[:-1]))
 
 		except:
-			logging.exception(_(u'{0}: Exception in user_post_add({1})'),
-									self.pretty_name, (ST_LOGIN, user.login))
-			all_ok = False
+			logging.exception(_(u'{0}: Exception while running smbpasswd '
+							u'for {1}'), self.pretty_name, (ST_LOGIN, login))
+			return False
+
+		return True
+	def __flush_accounts(self):
+		""" Write the queued accounts to the Samba password database with
+			one :program:`pdbedit` import of a temporary :file:`smbpasswd`
+			file (falling back to one :program:`smbpasswd` call per account
+			if we can't), and return their number.
+
+			Existing accounts are updated. No LanMan hash is written, like
+			Samba does by default (``lanman auth = no``).
+		"""
+
+		with self.__pending_lock:
+			pending, self.__pending = self.__pending, {}
+
+		if not pending:
+			return 0
+
+		if not self.batch_import:
+			for login, (uid, password) in pending.iteritems():
+				self.__smbpasswd(login, password, '-a')
+
+			return len(pending)
+
+		# mkstemp() creates the file 0600, nobody else can read the hashes.
+		fd, filename = tempfile.mkstemp(prefix='licorn-samba3-',
+										suffix='.smbpasswd')
 
 		try:
-			for uyp in fsapi.check_full(self.__user_profiles(user), batch=True):
+			with os.fdopen(fd, 'w') as smbpasswd:
+				lct = 'LCT-%08X' % int(time.time())
+
+				for login, (uid, password) in pending.iteritems():
+					smbpasswd.write('%s:%d:%s:%s:[U          ]:%s:\n' % (login,
+									uid, 'X' * 32, nt_hash(password), lct))
+
+			out, err = process.execute([ self.paths.pdbedit, '-i',
+										'smbpasswd:%s' % filename ])
+
+			if out:
+				logging.info('%s: %s' % (self.pretty_name, out[:-1]))
+
+			if err:
+				logging.warning('%s: %s' % (self.pretty_name, err[:-1]))
+
+		except:
+			logging.exception(_(u'{0}: Exception while importing {1} '
+							u'accounts'), self.pretty_name, len(pending))
+
+		finally:
+			os.unlink(filename)
+
+		return len(pending)
+	def __check_user_profiles(self, user, full_display=True, done=None):
+		""" ACL checker job: create and check the Windows® profiles of
+			`user`, then call `done` if given. """
+
+		try:
+			for uyp in fsapi.check_full(self.__user_profiles(user), batch=True,
+										full_display=full_display):
 				pass
 
-			logging.notice(_(u'{0}: created {1}\'s Windows® (empty) '
-								u'profiles.').format(self.pretty_name,
-									stylize(ST_LOGIN, user.login)))
+			if full_display:
+				logging.notice(_(u'{0}: created {1}\'s Windows® (empty) '
+									u'profiles.').format(self.pretty_name,
+										stylize(ST_LOGIN, user.login)))
 
 		except TypeError:
 			# nothing to check (fsapi.... returned None and yielded nothing).
 			pass
 
-		return all_ok
+		except:
+			logging.exception(_(u'{0}: Exception while checking {1}\'s '
+							u'Windows® profiles'), self.pretty_name,
+							(ST_LOGIN, user.login))
+
+		finally:
+			if done is not None:
+				done()
 	def __user_profiles(self, user):
 		""" TODO: when this extension offers more functionnality, move this
 			method in a Samba3User mixin class, that we will add to core.User.__bases__
@@ -494,22 +672,7 @@ class Samba3Extension(ObjectSingleton, LicornExtension):
 		if user.is_system:
 			return True
 
-		try:
-			out, err = process.execute([ self.paths.smbpasswd, user.login, '-s' ],
-										"%s\n%s\n" % (password, password))
-
-			if out:
-				logging.info('%s: %s' % (self.pretty_name, out[:-1]))
-
-			if err:
-				logging.warning('%s: %s' % (self.pretty_name, err[:-1]))
-
-		except:
-			logging.exception(_(u'{0}: Exception in user_post_change_password({1})'),
-									self.pretty_name, (ST_LOGIN, user.login))
-			return False
-
-		return True
+		return self.__smbpasswd(user.login, password)
 	@events.handler_method
 	@only_if_enabled
 	def user_pre_del(self, *args, **kwargs):
@@ -523,6 +686,10 @@ class Samba3Extension(ObjectSingleton, LicornExtension):
 		if user.is_system:
 			return True
 
+		# don't let a pending batch re-create the account.
+		with self.__pending_lock:
+			self.__pending.pop(user.login, None)
+
 		all_ok = True
 
 		try:
@@ -8,12 +8,12 @@ Licorn extensions: volumes - http://docs.licorn.org/extensions/volumes.html
 
 """
 
-import os, dbus, pyudev, select, re, errno, functools, itertools
+import os, dbus, pyudev, pyinotify, select, re, errno, functools, itertools
 
 from collections import deque
 
 from licorn.foundations           import logging, exceptions, settings
-from licorn.foundations           import process, pyutils, hlstr
+from licorn.foundations           import process, pyutils, hlstr, fsapi
 from licorn.foundations.events    import LicornEvent
 from licorn.foundations.base      import DictSingleton, MixedDictObject, Enumeration
 from licorn.foundations.classes   import PicklableObject, SharedResource
@@ -654,6 +654,11 @@ class VolumesExtension(DictSingleton, LicornExtension, SelectableController):
 
 		self.volumes = MixedDictObject('volumes')
 
+		# sizes of the backup exclusions, see global_system_size().
+		self.size_index   = fsapi.SizeIndex(os.path.join(settings.cache_dir,
+															'volumes.sizes'))
+		self.size_watches = {}
+
 		# TODO: add our volumes to notifications, to change the status when
 		# administrator touches or unlinks special files in volume's root.
 		self.inotifications = []
@@ -936,13 +941,12 @@ class VolumesExtension(DictSingleton, LicornExtension, SelectableController):
 					# too-much resource intensive.
 					continue
 
-				try:
-					du_excl = float(process.execute(['du', '-bs', excluded])[0].split()[0])
+				du_excl = self.excluded_size(excluded)
 
-				except IndexError:
-					# occurs when `du` can't find the target, which is
-					# perfectly normal for librdiff exclusions which contain
-					# '**' or any other glob pattern.
+				if du_excl is None:
+					# the target doesn't exist, which is perfectly normal
+					# for librdiff exclusions which contain '**' or any
+					# other glob pattern.
 					continue
 
 				the_total -= du_excl
@@ -956,6 +960,81 @@ class VolumesExtension(DictSingleton, LicornExtension, SelectableController):
 							u'implemented for systems other than Linux. '
 							u'Returning 0 and hoping this will be sufficient.'))
 			return 0
+	def excluded_size(self, path):
+		""" Return the size of `path` (a file or a directory tree), like
+			`du -bs` would, or ``None`` if it doesn't exist.
+
+			Sizes come from :attr:`size_index`, which only scans again what
+			changed since last call (and keeps its data across restarts).
+			The first time, an inotify watch is set up on the tree; if it
+			succeeds, the next calls only look at the directories the
+			watch reported as modified.
+		"""
+
+		if path not in self.size_watches:
+			self.size_watches[path] = self.__watch_size(path)
+
+			# The index of the previous run cannot be trusted: things may
+			# have changed while we weren't watching. The first walk is a
+			# normal one, the next will only look at what the watch reports.
+			size = self.size_index.size(path)
+
+			if self.size_watches[path]:
+				self.size_index.watch(path)
+
+			return size
+
+		return self.size_index.size(path)
+	def __watch_size(self, path):
+		""" Try to watch `path` recursively for the size index. Return the
+			watch descriptors if the whole tree is covered, else ``None``
+			(the index will then rely on directories modification times).
+
+			``IN_MODIFY`` is needed for files which grow while kept open
+			(logs, databases), which never send ``IN_CLOSE_WRITE``. Their
+			events only mark their directory in the index, which is cheap.
+		"""
+
+		if not os.path.isdir(path):
+			return None
+
+		watches = L_inotifier_add(path=path, rec=True, auto_add=True,
+									mask=pyinotify.IN_CLOSE_WRITE
+										| pyinotify.IN_MODIFY
+										| pyinotify.IN_CREATE
+										| pyinotify.IN_DELETE
+										| pyinotify.IN_MOVED_FROM
+										| pyinotify.IN_MOVED_TO
+										| pyinotify.IN_DELETE_SELF,
+									proc_fun=self.__size_event, quiet=True)
+
+		if not watches:
+			# the inotifier is disabled.
+			return None
+
+		if min(watches.itervalues()) < 0:
+			# probably too much directories for fs.inotify.max_user_watches.
+			logging.info(_(u'{0}: could not watch all of {1}, its size will '
+				u'be computed from directories modification times.').format(
+					stylize(ST_NAME, self.name), stylize(ST_PATH, path)))
+
+			L_inotifier_del([ wd for wd in watches.itervalues() if wd > 0 ],
+																quiet=True)
+			return None
+
+		return watches.values()
+	def __size_event(self, event):
+		""" Inotify handler for the size index: the directory which contains
+			the modified entry will be scanned again. """
+
+		if event.mask & pyinotify.IN_DELETE_SELF \
+								and event.path in self.size_watches:
+			# the whole tree is gone, watch it again if it comes back.
+			self.size_index.watch(event.path, False)
+			del self.size_watches[event.path]
+
+		else:
+			self.size_index.touch(event.path)
 	def add_volume_from_device(self, device=None, by_string=None):
 		""" Add a volume from udev data if it doesn't already exist.
 
@@ -38,6 +38,34 @@ class LicornOptions(ObjectSingleton):
 		# (un-)register them-selves while monitor messages are beiing processed.
 		self.monitor_lock = RLock()
 
+		# what the monitor listeners want, all together: the union of their
+		# facilities and their highest verbose level. logging.monitor()
+		# checks them without locking, to return immediately when nobody
+		# listens. Kept up-to-date by update_monitors().
+		self.monitor_mask    = 0
+		self.monitor_verbose = 0
+
+	def update_monitors(self):
+		""" Recompute :attr:`monitor_mask` and :attr:`monitor_verbose`. Must
+			be called after any change in :attr:`monitor_listeners`, or in
+			the verbose level of one of their listeners. """
+
+		mask  = 0
+		level = 0
+
+		with self.monitor_lock:
+			for listener_thread in self.monitor_listeners:
+				mask |= listener_thread.monitor_facilities
+
+				try:
+					level = max(level, listener_thread.listener.verbose)
+
+				except AttributeError:
+					# No listener anymore, logging.monitor() will drop it.
+					pass
+
+			self.monitor_mask    = mask
+			self.monitor_verbose = level
 	def SetVerbose(self, level):
 		""" Change verbose parameter. """
 		assert ltrace(TRACE_OPTIONS, '| SetVerbose(%s)' % level)
@@ -113,6 +113,10 @@ class LicornSettings(ObjectSingleton, NamedObject, LicornConfigObject):
 			'favorite_server'              : None,
 			'pyro.port'                    : int(os.getenv('PYRO_PORT', 299)),
 
+			# local CLI connections go through this unix socket (the peer
+			# is identified by the kernel). Empty: local TCP only.
+			'pyro.socket'                  : u'/var/run/licornd-pyro.sock',
+
 			# timeout for CLI connect; in seconds.
 			'connect.timeout'              : 30,
 
@@ -126,7 +130,31 @@ class LicornSettings(ObjectSingleton, NamedObject, LicornConfigObject):
 			'core.keywords.config_file'    : self.config_dir + u'/keywords.conf',
 			# extensions to /etc/group
 			'backends.shadow.extended_group_file' : self.config_dir + u'/groups',
+			# on inotify events, diff /etc/{passwd,group} with the
+			# controllers instead of rebuilding all objects.
+			'backends.shadow.incremental_reload'  : True,
+			# coalescing window for system files rewrites, in seconds
+			# (0 means rewrite on every change), and its crash journal.
+			'backends.shadow.save_delay'          : 0.5,
+			'backends.shadow.journal_file'        : self.config_dir + u'/shadow.journal',
 			'backends.openldap.organization'      : 'Licorn®',
+			# LDAP entries are loaded by pages of this size, and
+			# modifications use a pool of at most that many connections.
+			'backends.openldap.page_size'         : 500,
+			'backends.openldap.pool_size'         : 4,
+			# threads listing directories during contents checks; more
+			# helps a lot on network file-systems (see `fsapi.minifind()`).
+			'fsapi.minifind_workers'              : 4,
+			# batch checks skip the shared contents which didn't change
+			# since the last one (see `fsapi.CheckState`).
+			'core.checks.skip_unchanged'          : True,
+			'core.checks.state_dir'               : self.cache_dir + u'/checks',
+			# threads creating homes and applying skels during massive
+			# imports (see `UsersController.add_Users()`).
+			'core.users.import_workers'           : 4,
+			# threads reading and writing keywords xattrs when tagging a
+			# directory (see `KeywordsController.AddKeywordsToPath()`).
+			'core.keywords.tag_workers'           : 4,
 			}, emit_event=False)
 	def __convert_settings_values(self):
 		assert ltrace(TRACE_SETTINGS, '| BaseDaemon.__convert_settings_values()')
@@ -10,12 +10,13 @@ cache - small in-memory cache for Licorn®.
 :license: GNU GPL version 2
 """
 
-import time
-from functools import wraps
-
+import sys, time
+from functools   import wraps
+from threading   import Lock, Event
+from collections import Set
 
 # ============================================================== licorn imports
-import styles, hlstr
+import styles, hlstr, pyutils
 from base    import ObjectSingleton
 from styles  import *
 from ltrace  import *
@@ -45,53 +46,266 @@ half_a_year       = six_months
 one_year          = one_day * 365.0
 twelve_months     = one_year
 
+
 default_expire_time = ten_minutes
 
+# Limits of the cache, checked at each insertion. The size is an estimation
+# (see `_sizeof()`), not the exact memory used by the values.
+max_entries = 4096
+max_size    = 32 * 1024 * 1024
+
+# expired entries are purged at most once per this interval, when inserting.
+purge_interval = one_minute
+
+class _Identity(object):
+	""" Hashable stand-in for an unhashable argument (typically a
+		dict-based controller or extension passed as `self`): it compares by
+		identity and keeps the object alive as long as the key exists, thus
+		its `id()` can't be reused by another object meanwhile. """
+	__slots__ = ('obj', )
+
+	def __init__(self, obj):
+		self.obj = obj
+	def __hash__(self):
+		return id(self.obj)
+	def __eq__(self, other):
+		return type(other) == _Identity and other.obj is self.obj
+	def __ne__(self, other):
+		return not self.__eq__(other)
+def _freeze(value):
+	""" Return a hashable equivalent of `value`, for a cache key. """
+
+	vtype = type(value)
+
+	if vtype in (list, tuple):
+		return (vtype, tuple(_freeze(v) for v in value))
+
+	if vtype == dict:
+		return (dict, tuple(sorted((k, _freeze(v))
+									for k, v in value.iteritems())))
+
+	# NOTE: `set` is our own function, at the end of this module.
+	if isinstance(value, Set):
+		return (frozenset, frozenset(_freeze(v) for v in value))
+
+	try:
+		hash(value)
+
+	except TypeError:
+		return _Identity(value)
+
+	return value
+def _sizeof(value, depth=3):
+	""" Estimate the memory used by `value` and by its items, down to
+		`depth` levels of containers. """
+
+	size = sys.getsizeof(value, 64)
+
+	if depth:
+		if isinstance(value, (list, tuple, Set)):
+			size += sum(_sizeof(v, depth - 1) for v in value)
+
+		elif isinstance(value, dict):
+			size += sum(_sizeof(k, 0) + _sizeof(v, depth - 1)
+											for k, v in value.iteritems())
+
+	return size
+
 class LicornCache(ObjectSingleton):
+	""" Thread-safe, bounded in-memory cache.
+
+		- Entries expire after their own delay. Expired entries are dropped
+		  when read, and purged from the whole cache at most every
+		  :data:`purge_interval` seconds, when inserting.
+		- When :data:`max_entries` or :data:`max_size` is exceeded, the
+		  least recently used entries are evicted.
+		- :meth:`get_or_compute` computes a missing value only once, even if
+		  many threads ask for it at the same time.
+
+		.. versionchanged:: 1.6.1 was a plain dictionary, without limits nor
+			locking.
+	"""
 
 	def __init__(self):
-		self.data = {}
+		self.lock = Lock()
+
+		# key -> [ prev, next, key, value, expire time, size ]; the entries
+		# are chained from the most to the least recently used.
+		self.data   = {}
+		self.__root = root = []
+		root[:] = [ root, root, None, None, None, 0 ]
+
+		self.size       = 0
+		self.next_purge = 0
+
+		# key -> Event, for the values being computed.
+		self.__pending = {}
+
+		self.hits        = 0
+		self.misses      = 0
+		self.evictions   = 0
+		self.expirations = 0
+	def __link_first(self, entry):
+		root = self.__root
+		entry[0] = root
+		entry[1] = root[1]
+		root[1][0] = root[1] = entry
+	def __unlink(self, entry):
+		entry[0][1] = entry[1]
+		entry[1][0] = entry[0]
+	def __remove(self, entry):
+		self.__unlink(entry)
+		del self.data[entry[2]]
+		self.size -= entry[5]
+	def __lookup(self, key):
+		""" Return the entry of `key`, counting a hit or a miss. Must be
+			called with the lock held. """
+
+		try:
+			entry = self.data[key]
+
+		except KeyError:
+			self.misses += 1
+			raise
+
+		if time.time() > entry[4]:
+			self.__remove(entry)
+			self.expirations += 1
+			self.misses      += 1
+			raise KeyError(_('Key %s expired!') % (key, ))
+
+		self.__unlink(entry)
+		self.__link_first(entry)
+		self.hits += 1
 
+		return entry
 	def get(self, key):
-		value, expire_time = self.data[key]
 
 		assert ltrace_func(TRACE_CACHE)
 
-		if time.time() > expire_time:
-			raise KeyError(_('Key %s expired!') % key)
-
-		return value
+		with self.lock:
+			return self.__lookup(key)[3]
 	def set(self, key, value, expire_time=None):
 
 		assert ltrace_func(TRACE_CACHE)
 
+		now = time.time()
+
 		if expire_time is None:
-			expire_time = time.time() + default_expire_time
+			expire_time = now + default_expire_time
 
 		else:
-			expire_time += time.time()
+			expire_time += now
+
+		size = _sizeof(value)
+
+		with self.lock:
+			try:
+				self.__remove(self.data[key])
+
+			except KeyError:
+				pass
+
+			if now > self.next_purge:
+				self.__purge(now)
+
+			entry = [ None, None, key, value, expire_time, size ]
+			self.__link_first(entry)
+			self.data[key] = entry
+			self.size     += size
 
-		self.data[key] = (value, expire_time)
+			root = self.__root
+
+			# never evict the new entry, even if it is too big alone.
+			while (len(self.data) > max_entries or self.size > max_size) \
+												and root[0] is not entry:
+				self.__remove(root[0])
+				self.evictions += 1
 	def delete(self, key):
 
 		assert ltrace_func(TRACE_CACHE)
 
-		try:
-			del self.data[key]
+		with self.lock:
+			try:
+				self.__remove(self.data[key])
 
-		except KeyError:
-			pass
+			except KeyError:
+				pass
+	def __purge(self, now):
+		for entry in [ e for e in self.data.itervalues() if now > e[4] ]:
+			self.__remove(entry)
+			self.expirations += 1
+
+		self.next_purge = now + purge_interval
+	def purge(self):
+		""" Drop all expired entries now. """
+
+		with self.lock:
+			self.__purge(time.time())
+	def clear(self):
+		""" Drop everything (the statistics are kept). """
+
+		with self.lock:
+			self.data.clear()
+			root = self.__root
+			root[:] = [ root, root, None, None, None, 0 ]
+			self.size = 0
+	def get_or_compute(self, key, func, expire_time=None):
+		""" Return the value of `key`. If it is missing, compute it with
+			`func()` and store it. While a thread computes a value, the
+			other ones asking for the same key wait for the result instead
+			of computing it again. If the computation fails, the waiting
+			threads try on their own. """
+
+		while True:
+			with self.lock:
+				try:
+					return self.__lookup(key)[3]
+
+				except KeyError:
+					pending = self.__pending.get(key)
+
+					if pending is None:
+						pending = self.__pending[key] = Event()
+						break
+
+			pending.wait()
 
-cache  = LicornCache()
-get    = cache.get
-set    = cache.set
-delete = cache.delete
-expire = delete
+		try:
+			value = func()
+			self.set(key, value, expire_time)
+			return value
+
+		finally:
+			with self.lock:
+				del self.__pending[key]
+
+			pending.set()
+	def stats(self):
+		with self.lock:
+			return dict(entries=len(self.data), size=self.size,
+						max_entries=max_entries, max_size=max_size,
+						hits=self.hits, misses=self.misses,
+						evictions=self.evictions,
+						expirations=self.expirations,
+						pending=len(self.__pending))
+
+cache          = LicornCache()
+get            = cache.get
+set            = cache.set
+delete         = cache.delete
+expire         = delete
+purge          = cache.purge
+get_or_compute = cache.get_or_compute
 
 def cached(expire_time=None):
-	""" This decorator will only work on standard functions (not instance methods).
+	""" Cache the results of the decorated function or method for
+		`expire_time` seconds, per distinct arguments. Pass
+		``cache_force_expire=True`` to compute a fresh value.
 
-		For the instance method implementation hint, see http://code.activestate.com/recipes/577452-a-memoize-decorator-for-instance-methods/
+		Keys are built from the function object itself and the arguments
+		(see :func:`_freeze`), thus two functions or two different arguments
+		never share the same entry.
 	"""
 	def wrap1(func):
 		@wraps(func)
@@ -99,30 +313,37 @@ def cached(expire_time=None):
 
 			force_expire = kwargs.pop('cache_force_expire', False)
 
-			# NOTE: We need the ID, not only the `__name__`, else we get
-			# collisions: in `wmi/*/dynamics.py` there are many cached
-			# functions with the same name and no arguments.
-			# And even with the ID, I fear that we can still have collisions
-			# sooner or later, if the GC collects enough objects and creates
-			# new ones at the place of olds.
-			key = '_%s%s%s%s' % (func.__name__, id(func), ''.join(str(x) for x in args),
-								''.join(str(v) for v in kwargs.itervalues()))
+			key = (func, _freeze(args), _freeze(kwargs))
 
 			if force_expire:
 				res = func(*args, **kwargs)
 				cache.set(key, res, expire_time)
 				return res
 
-			try:
-				return cache.get(key)
-
-			except KeyError:
-
-				res = func(*args, **kwargs)
-				cache.set(key, res, expire_time)
-				return res
+			return cache.get_or_compute(key,
+										lambda: func(*args, **kwargs),
+										expire_time)
 
 		return wrap2
 	return wrap1
-
-__all__ = ('get', 'set', 'delete', 'expire', 'cached')
+def dump_status(long_output=False, precision=None, as_string=True):
+
+	stats = cache.stats()
+
+	if as_string:
+		return _(u'{0}/{1} entries, {2}/{3}, {4} hits, {5} misses '
+				u'({6:.1f}% hits), {7} evictions, {8} expirations{9}').format(
+					stylize(ST_UGID, stats['entries']), stats['max_entries'],
+					pyutils.bytes_to_human(stats['size']),
+					pyutils.bytes_to_human(stats['max_size']),
+					stats['hits'], stats['misses'],
+					stats['hits'] * 100.0 / ((stats['hits']
+											+ stats['misses']) or 1),
+					stats['evictions'], stats['expirations'],
+					_(u', {0} being computed').format(stats['pending'])
+						if stats['pending'] else u'')
+
+	return stats
+
+__all__ = ('get', 'set', 'delete', 'expire', 'purge', 'get_or_compute',
+			'cached', 'dump_status')
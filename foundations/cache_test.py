@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Licorn foundations - http://dev.licorn.org/documentation/foundations
+
+cache test - eviction, expiration, keys and concurrent misses.
+
+:copyright:
+	* 2012 Olivier Cortès <olive@deep-ocean.net>
+:license: GNU GPL version 2
+"""
+
+import time, py.test
+
+from threading import Thread
+
+from licorn.foundations import cache
+
+def setup_function(function):
+	cache.cache.clear()
+def test_lru_eviction():
+	max_entries = cache.max_entries
+	cache.max_entries = 3
+
+	try:
+		for key in ('a', 'b', 'c'):
+			cache.set(key, key)
+
+		# 'a' becomes the most recently used, 'b' is evicted.
+		cache.get('a')
+		cache.set('d', 'd')
+
+		py.test.raises(KeyError, cache.get, 'b')
+		assert [ cache.get(k) for k in ('a', 'c', 'd') ] == [ 'a', 'c', 'd' ]
+
+	finally:
+		cache.max_entries = max_entries
+def test_expiration():
+	cache.set('short', 1, 0.05)
+	assert cache.get('short') == 1
+
+	time.sleep(0.1)
+	py.test.raises(KeyError, cache.get, 'short')
+def test_keys_dont_collide():
+	calls = []
+
+	@cache.cached()
+	def func(*args):
+		calls.append(args)
+		return args
+
+	# these used to share the same key ('1' + '2' == '12').
+	assert func('1', '2') == ('1', '2')
+	assert func('12') == ('12', )
+	assert func('1', '2') == ('1', '2')
+
+	# unhashable arguments are supported.
+	func([ 1, 2 ])
+	func([ 1, 2 ])
+
+	assert len(calls) == 3
+def test_concurrent_misses():
+	calls = []
+
+	@cache.cached()
+	def slow():
+		calls.append(1)
+		time.sleep(0.2)
+		return 42
+
+	threads = [ Thread(target=slow) for i in range(10) ]
+
+	for thread in threads:
+		thread.start()
+
+	for thread in threads:
+		thread.join()
+
+	assert len(calls) == 1
+	assert slow() == 42
@@ -8,14 +8,14 @@ Licorn® foundations - events
 :license: GNU GPL version 2
 """
 
-import types
-from threading import current_thread, Timer
+import types, time
+from threading import current_thread
 
-from Queue     import PriorityQueue
+from Queue     import PriorityQueue, Queue, Empty
 
 # other foundations imports
 import logging, exceptions, pyutils, styles
-from threads   import RLock
+from threads   import RLock, Lock
 from styles    import *
 from ltrace    import *
 from ltraces   import *
@@ -27,7 +27,7 @@ from workers   import workers
 stylize = styles.stylize
 
 # FIXME: this should go elsewhere someday.
-from licorn.daemon.threads import LicornBasicThread
+from licorn.daemon.threads import LicornBasicThread, timer_service
 
 events_queue      = PriorityQueue()
 events_handlers   = {}
@@ -36,6 +36,108 @@ events_collectors = []
 looper_thread     = None
 loop_lock         = RLock()
 
+#: one :class:`CollectorDispatcher` per registered collector.
+events_dispatchers = []
+
+#: per event name: [ queued, processed, total handling time, max time ].
+events_stats       = {}
+stats_lock         = Lock()
+
+#: events are pushed to collectors by batches of at most `batch_size`
+#: events, or what has been emitted during `batch_delay` seconds after
+#: the first one, whichever comes first.
+batch_size         = 100
+batch_delay        = 0.25
+
+class CollectorDispatcher(LicornBasicThread):
+	""" Forward events to one collector (the WMI, generally), by batches.
+
+		Every collector gets its own dispatcher and its own queue: a slow or
+		hung collector only delays itself, and events are delivered in the
+		order they were processed by the event loop. A batch costs one Pyro
+		call (:meth:`process_events`) instead of one per event; collectors
+		which don't implement it get the events one by one, from the same
+		thread.
+
+		.. versionadded:: 1.6.1
+	"""
+	def __init__(self, collector):
+		LicornBasicThread.__init__(self, tname='EventDispatcher')
+
+		self.daemon    = True
+		self.collector = collector
+		self.queue     = Queue()
+
+		# Checked once, at registration: an AttributeError raised inside
+		# process_events() is a collector error, not a missing method.
+		self.batched   = hasattr(collector, 'process_events')
+
+		#: counters, for :func:`dump_status`.
+		self.delivered = 0
+		self.batches   = 0
+	def put(self, event):
+		self.queue.put(event)
+	def stop(self):
+		LicornBasicThread.stop(self)
+
+		# unblock the queue.get() of run_action_method().
+		self.queue.put(None)
+	def run_action_method(self):
+
+		event = self.queue.get()
+
+		if event is None:
+			return
+
+		batch = [ event ]
+		limit = time.time() + batch_delay
+
+		while len(batch) < batch_size:
+			remaining = limit - time.time()
+
+			if remaining <= 0:
+				break
+
+			try:
+				event = self.queue.get(True, remaining)
+
+			except Empty:
+				break
+
+			if event is None:
+				break
+
+			batch.append(event)
+
+		self.deliver(batch)
+	def deliver(self, batch):
+
+		assert ltrace_func(TRACE_EVENTS)
+
+		logging.monitor(TRACE_EVENTS, TRACELEVEL_2, _('Event push to '
+							'collector: {0} event(s) > {1}'), len(batch),
+							self.collector)
+
+		try:
+			if self.batched:
+				self.collector.process_events(batch)
+
+			else:
+				# An older collector, without process_events().
+				for event in batch:
+					self.collector.process_event(event)
+
+		except:
+			# The collector probably disconnected without warning us first.
+			# Even without that, it produced an error; drop it.
+			logging.exception(_(u'Exception while when pushing {0} event(s) '
+							u'to collector {1}'), len(batch), self.collector)
+			unregister_collector(self.collector)
+
+		else:
+			self.delivered += len(batch)
+			self.batches   += 1
+
 class RoundRobinEventLooper(LicornBasicThread):
 	""" Process internal events and run callbacks associated to them,
 		synchronously or not. See :meth:`run_action_method` for
@@ -58,30 +160,15 @@ class RoundRobinEventLooper(LicornBasicThread):
 		.. versionadded:: 1.3
 	"""
 
-	def push_event_to_collectors_thread(self, event):
-		""" Meant to be used in a ServiceThread, because it can take a long time. """
-
-		assert ltrace_func(TRACE_EVENTS)
-
-		for collector in events_collectors[:]:
-			try:
-				logging.monitor(TRACE_EVENTS, TRACELEVEL_2, _('Event push to collector: {0} > {1}'), event.name, collector)
-				collector.process_event(event)
-
-			except:
-				# The collector probably disconnected without warning us first.
-				# Even without that, it produced an error; drop it.
-				logging.exception(_(u'Exception while when pushing event '
-									u'{0} to collector {1}'), event, collector)
-				unregister_collector(collector)
 	def run_action_method(self):
 		""" Try to get the next event from our event-queue (else block on it).
 
 			If `event` is `None`, return.
 
 			If we have event-collectors connected — like the WMI or a
-			`get events` CLI tool, ask a :class:`~licorn.daemon.threads.ServiceWorkerThread`
-			to forward the event to all of them.
+			`get events` CLI tool, hand the event to their
+			:class:`CollectorDispatcher`, which will forward it with the
+			next batch.
 
 			If the event must be run synchronously, do it. This will kind of
 			briefly halt the event-loop, but this is meant to be with a
@@ -99,6 +186,8 @@ class RoundRobinEventLooper(LicornBasicThread):
 		if event is None:
 			return
 
+		push_to_collectors(event)
+
 		# process the event asynchronously in a service thread.
 		workers.service_enqueue(priority, self.run_event, event)
 	def run_methods(self, event, method_type_container, method_type, synchronous):
@@ -155,15 +244,21 @@ class RoundRobinEventLooper(LicornBasicThread):
 
 		assert ltrace_func(TRACE_EVENTS)
 
-		if events_collectors != []:
-			workers.service_enqueue(priorities.HIGH,
-								self.push_event_to_collectors_thread, event)
+		if synchronous:
+			# Asynchronous ones were pushed by run_action_method().
+			push_to_collectors(event)
 
 		logging.monitor(TRACE_EVENTS, TRACELEVEL_1, _('Processing event {0}'),
 														(ST_NAME, event.name))
 
-		self.run_methods(event, events_handlers, _('event handler'), synchronous)
-		self.run_methods(event, events_callbacks, _('event callback'), synchronous)
+		start = time.time()
+
+		try:
+			self.run_methods(event, events_handlers, _('event handler'), synchronous)
+			self.run_methods(event, events_callbacks, _('event callback'), synchronous)
+
+		finally:
+			count_processed(event.name, time.time() - start, not synchronous)
 class LicornEvent(NamedObject):
 	""" Licorn® event object class.
 
@@ -195,9 +290,7 @@ class LicornEvent(NamedObject):
 				raise exceptions.LicornRuntimeError(_(u'A synchronous event '
 						u'cannot be delayed! (on %s)').format(self.name))
 
-			t = Timer(delay, events_queue.put, args=((priority
-												or priorities.NORMAL, self), ))
-			t.start()
+			timer_service().schedule(delay, self.enqueue, priority)
 
 		else:
 			if synchronous:
@@ -212,9 +305,43 @@ class LicornEvent(NamedObject):
 				looper_thread.run_event(self, synchronous=True)
 
 			else:
-				events_queue.put((priority or priorities.NORMAL, self))
+				self.enqueue(priority)
+	def enqueue(self, priority=None):
+		with stats_lock:
+			try:
+				events_stats[self.name][0] += 1
+
+			except KeyError:
+				events_stats[self.name] = [ 1, 0, 0.0, 0.0 ]
+
+		events_queue.put((priority or priorities.NORMAL, self))
 LicornEventType = type(LicornEvent('dummy_event'))
 
+def push_to_collectors(event):
+	""" Hand `event` to all collectors dispatchers. Cheap: the delivery is
+		done by the dispatchers threads. """
+
+	for dispatcher in events_dispatchers[:]:
+		dispatcher.put(event)
+def count_processed(event_name, duration, dequeued=True):
+	""" Update the counters of `event_name` after its handlers and
+		callbacks took `duration` seconds to run. """
+
+	with stats_lock:
+		try:
+			stats = events_stats[event_name]
+
+		except KeyError:
+			stats = events_stats[event_name] = [ 0, 0, 0.0, 0.0 ]
+
+		if dequeued:
+			stats[0] -= 1
+
+		stats[1] += 1
+		stats[2] += duration
+
+		if duration > stats[3]:
+			stats[3] = duration
 def callback_function(func):
 	""" Event callback decorator. The decorated function will
 		be called when all events handlers have been processed for a
@@ -385,6 +512,10 @@ def register_collector(collector):
 			# a pyro proxy, but just a thread. _setTimeout() will fail.
 			pass
 
+		dispatcher = CollectorDispatcher(collector)
+		events_dispatchers.append(dispatcher)
+		dispatcher.start()
+
 	logging.progress( _('{0}: registered event collector {1}.').format(
 									stylize(ST_NAME, current_thread().name),
 									stylize(ST_NAME, collector)))
@@ -401,6 +532,11 @@ def unregister_collector(collector):
 			try:
 				events_collectors.remove(collector)
 
+				for dispatcher in events_dispatchers[:]:
+					if dispatcher.collector == collector:
+						events_dispatchers.remove(dispatcher)
+						dispatcher.stop()
+
 				logging.progress(_(u'{0}: unregistered event '
 									u'collector {0}.').format(
 										stylize(ST_NAME, current_thread().name),
@@ -485,6 +621,12 @@ def stop():
 	# unblock the EventManager run_action_method().
 	events_queue.put((-1, None))
 
+	with loop_lock:
+		for dispatcher in events_dispatchers:
+			dispatcher.stop()
+
+		del events_dispatchers[:]
+
 	logging.progress(_(u'{0}: Licorn® Event Loop stopped.').format(
 									stylize(ST_NAME, current_thread().name)))
 def dump_status(long_output=False, precision=None, as_string=True):
@@ -494,12 +636,16 @@ def dump_status(long_output=False, precision=None, as_string=True):
 	cbks  = events_callbacks
 	colls = events_collectors
 	queue = events_queue
+	disps = events_dispatchers
+
+	with stats_lock:
+		stats = dict((key, value[:]) for key, value in events_stats.iteritems())
 
 	with loop_lock:
 		if as_string:
 			if long_output:
 				return _(u'{0}{1}: {2} events, {3} handler(s) and {4} '
-							u'callback(s) registered,\n{5}\n{6}').format(
+							u'callback(s) registered,\n{5}\n{6}{7}{8}').format(
 								stylize(ST_RUNNING
 											if t.is_alive()
 											else ST_STOPPED, t.name),
@@ -514,7 +660,20 @@ def dump_status(long_output=False, precision=None, as_string=True):
 									for key, value in evts.iteritems()),
 								u'\n'.join(u'%s\n\t%s' % (key,
 										'\n\t'.join(str(x) for x in value))
-									for key, value in cbks.iteritems())
+									for key, value in cbks.iteritems()),
+								u''.join(u'\n' + _(u'{0}: {1} queued, {2} '
+									u'processed, {3:.2f}ms avg, {4:.2f}ms max'
+									).format(stylize(ST_NAME, key),
+										stylize(ST_UGID, value[0]), value[1],
+										value[2] * 1000.0 / (value[1] or 1),
+										value[3] * 1000.0)
+									for key, value in sorted(stats.iteritems())),
+								u''.join(u'\n' + _(u'collector {0}: {1} '
+									u'queued, {2} event(s) in {3} batch(es)'
+									).format(stylize(ST_NAME, d.collector),
+										stylize(ST_UGID, d.queue.qsize()),
+										d.delivered, d.batches)
+									for d in disps)
 								)
 			else:
 				return _(u'{0}{1} ({2} events, {3} handler(s) and {4} '
@@ -539,7 +698,17 @@ def dump_status(long_output=False, precision=None, as_string=True):
 							for key, value in evts.iteritems()),
 					callbacks=dict((key, [ v.__name__ for v in value ])
 							for key, value in cbks.iteritems()),
-					collectors=[ repr(c) for c in colls ]
+					collectors=[ repr(c) for c in colls ],
+					dispatchers=[ dict(collector=repr(d.collector),
+										qsize=d.queue.qsize(),
+										delivered=d.delivered,
+										batches=d.batches)
+									for d in disps ],
+					stats=dict((key, dict(queued=value[0],
+										processed=value[1],
+										total_time=value[2],
+										max_time=value[3]))
+								for key, value in stats.iteritems())
 				)
 
 __all__ = (
@@ -13,7 +13,19 @@ Licensed under the terms of the GNU GPL version 2
 """
 
 import sys, os, locale, posix1e, time, shutil, errno, re, types
-from stat import *
+import hashlib, marshal, tempfile
+from stat        import *
+from threading   import Thread, Lock
+from Queue       import Queue
+from collections import deque
+
+try:
+	# Python 2 backport of `os.scandir()`, which gives us the entries
+	# types without `stat()`ing them (see `minifind()`).
+	from scandir import scandir
+
+except ImportError:
+	scandir = None
 
 # ================================================= Licorn® foundations imports
 
@@ -55,6 +67,18 @@ special_invalid_paths = ('.gvfs', )
 users  = None
 groups = None
 
+# posix.1e ACL objects compiled from check rules texts, see `compiled_acl()`.
+# A shared directory has only a handful of distinct (rule, exec bits)
+# combinations; the limit is only a safety net against unbounded growth.
+# Setting it to 0 disables the cache.
+compiled_acls_max   = 1024
+_compiled_acls      = {}
+_compiled_acls_lock = Lock()
+
+# incremented by each flush: an ACL compiled while names were changing
+# must not enter the cache.
+_compiled_acls_generation = 0
+
 # ============================================================== FS API Classes
 
 class FsapiObject(Enumeration):
@@ -572,6 +596,338 @@ class ACLRule(Enumeration):
 				'~', home).replace(
 				'$HOME', home).replace(
 				home, '')
+class CheckState(object):
+	""" Persistent index of the entries found conforming by a batch
+		:func:`check_full` run on a home directory, to skip them on the next
+		run as long as they did not change.
+
+		For each path, the index records ``(inode, mtime, ctime, rule hash)``.
+		Any ``chmod()``, ``chown()`` or ACL change updates the ``ctime`` (which
+		users cannot forge), a changed rule changes the hash: such entries are
+		checked again.
+
+		The index is rebuilt on each complete run (thus vanished entries are
+		forgotten), and not kept in memory between runs.
+
+		:param filename: where to store the index. It must not be in a place
+			where users could write.
+	"""
+	def __init__(self, filename):
+		self.filename = filename
+		self.__old    = None
+		self.__new    = None
+	@staticmethod
+	def rule_hash(dir_info, file_type):
+		""" Return a string identifying what `check_perms()` would apply on
+			an entry of type ``file_type`` with rule ``dir_info``. """
+
+		return hashlib.md5(repr((file_type,
+								dir_info.uid, dir_info.root_gid,
+								dir_info.content_gid, dir_info.root_dir_perm,
+								dir_info.dirs_perm, dir_info.files_perm,
+								dir_info.root_dir_acl,
+								dir_info.content_acl))).hexdigest()
+	def begin(self):
+		""" Load the index of the previous run. """
+
+		try:
+			with open(self.filename, 'rb') as f:
+				self.__old = marshal.load(f)
+
+		except (IOError, OSError, EOFError, ValueError, TypeError), e:
+			if getattr(e, 'errno', None) != errno.ENOENT:
+				logging.warning2(_(u'Check state {0} unusable, starting '
+									u'from scratch (was: {1}).').format(
+										stylize(ST_PATH, self.filename), e))
+			self.__old = {}
+
+		self.__new = {}
+	def unchanged(self, path, entry_stat, rule_hash):
+		""" Return ``True`` if ``path`` was found conforming to ``rule_hash``
+			by the previous run and did not change since. """
+
+		record = (entry_stat.st_ino, entry_stat.st_mtime,
+						entry_stat.st_ctime, rule_hash)
+
+		if self.__old.get(path) == record:
+			self.__new[path] = record
+			return True
+
+		return False
+	def update(self, path, entry_stat, rule_hash):
+		""" Record ``path`` as just checked. ``entry_stat`` must be taken
+			after the check. """
+
+		self.__new[path] = (entry_stat.st_ino, entry_stat.st_mtime,
+								entry_stat.st_ctime, rule_hash)
+	def commit(self):
+		""" Atomically replace the stored index with the current run one. """
+
+		directory = os.path.dirname(self.filename)
+
+		try:
+			if not os.path.exists(directory):
+				os.makedirs(directory, 0700)
+
+			fd, tmpname = tempfile.mkstemp(dir=directory)
+
+			with os.fdopen(fd, 'wb') as f:
+				marshal.dump(self.__new, f)
+
+			os.rename(tmpname, self.filename)
+
+		except (IOError, OSError), e:
+			logging.warning(_(u'Unable to save check state {0} '
+								u'(was: {1}).').format(
+									stylize(ST_PATH, self.filename), e))
+
+		self.__old = self.__new = None
+	def invalidate(self):
+		""" Forget everything (the next run will check all entries). """
+
+		self.__old = self.__new = None
+
+		try:
+			os.unlink(self.filename)
+
+		except (IOError, OSError), e:
+			if e.errno != errno.ENOENT:
+				raise
+class SizeIndex(object):
+	""" Persistent index of the space used by directory trees, to get their
+		size (like ``du -bs``) without walking them entirely each time.
+
+		For each directory, the index records ``(mtime, size, subdirs,
+		scanned)``: ``size`` is the apparent size of the directory and of
+		its direct non-directory entries, ``subdirs`` the names of its
+		sub-directories, and ``scanned`` the time they were all stat()ed.
+
+		:meth:`size` walks the directories only: one whose mtime did not
+		change since its last scan is not listed again. Rewriting a file
+		does not change the mtime of its directory, though: call
+		:meth:`touch` on it (typically from an inotify handler) to have it
+		scanned again. In any case, directories are scanned again after
+		``max_age`` seconds.
+
+		Trees registered with :meth:`watch` are considered completely
+		covered by :meth:`touch` calls: only their touched and too old
+		directories are looked at, the rest of the index is trusted as-is,
+		which makes :meth:`size` nearly free.
+
+		:param filename: where to store the index between runs.
+		:param max_age: maximum time between two scans of a directory.
+
+		.. versionadded:: 1.6.1
+	"""
+	def __init__(self, filename, max_age=86400):
+		self.filename = filename
+		self.max_age  = max_age
+
+		# path -> (mtime, size, subdirs, scanned); loaded on first use.
+		self.__dirs    = None
+		self.__changed = False
+		self.__lock    = Lock()
+
+		# touch() is called from the inotifier thread: it must not wait
+		# for a walk holding the main lock to finish.
+		self.__touched      = set()
+		self.__touched_lock = Lock()
+
+		self.__watched = set()
+	def touch(self, directory):
+		""" Mark ``directory`` to be scanned again at next :meth:`size`. """
+
+		with self.__touched_lock:
+			self.__touched.add(directory)
+	def watch(self, path, watched=True):
+		""" Tell that ``path`` is (or is not anymore, if ``watched`` is
+			``False``) completely covered by :meth:`touch` calls. """
+
+		if watched:
+			self.__watched.add(path)
+
+		else:
+			self.__watched.discard(path)
+	def size(self, path):
+		""" Return the size of ``path`` in bytes, or ``None`` if it does
+			not exist. """
+
+		with self.__lock:
+			if self.__dirs is None:
+				self.__load()
+
+			try:
+				path_stat = os.lstat(path)
+
+			except (IOError, OSError), e:
+				if e.errno != errno.ENOENT:
+					raise
+
+				self.__drop(path)
+				return None
+
+			if not S_ISDIR(path_stat.st_mode):
+				return path_stat.st_size
+
+			trusted = any(path == watched or path.startswith(watched + '/')
+												for watched in self.__watched)
+
+			total = self.__walk(path, path_stat, trusted)
+
+			if self.__changed:
+				self.__save()
+
+			return total
+	def __walk(self, root, root_stat, trusted):
+		""" Sum the sizes of the ``root`` tree, scanning again only what is
+			needed. In ``trusted`` mode, unchanged directories are not even
+			stat()ed. """
+
+		now   = time.time()
+		total = 0
+		stack = [ (root, root_stat) ]
+
+		while stack:
+			directory, dir_stat = stack.pop()
+
+			record = self.__dirs.get(directory)
+
+			if trusted and record is not None \
+						and directory not in self.__touched \
+						and now - record[3] < self.max_age:
+				total += record[1]
+				stack.extend((os.path.join(directory, name), None)
+														for name in record[2])
+				continue
+
+			if dir_stat is None:
+				try:
+					dir_stat = os.lstat(directory)
+
+				except (IOError, OSError):
+					# vanished; its parent changed and will be scanned again.
+					continue
+
+			if not S_ISDIR(dir_stat.st_mode):
+				continue
+
+			if record is None \
+					or directory in self.__touched \
+					or record[0] != dir_stat.st_mtime \
+					or now - record[3] >= self.max_age:
+				record = self.__scan(directory, dir_stat, now)
+
+				if record is None:
+					continue
+
+			total += record[1]
+
+			for name in record[2]:
+				subdir = os.path.join(directory, name)
+
+				if trusted:
+					stack.append((subdir, None))
+					continue
+
+				try:
+					stack.append((subdir, os.lstat(subdir)))
+
+				except (IOError, OSError):
+					continue
+
+		return total
+	def __scan(self, directory, dir_stat, now):
+		""" (Re-)list ``directory`` and stat() its entries. ``dir_stat`` must
+			be taken before, so that changes made during the scan are seen
+			at next walk. """
+
+		with self.__touched_lock:
+			self.__touched.discard(directory)
+
+		try:
+			names = os.listdir(directory)
+
+		except (IOError, OSError), e:
+			if e.errno == errno.ENOENT:
+				self.__drop(directory)
+				return None
+
+			logging.progress(_(u'SizeIndex: cannot list {0} (was: {1}).').format(
+										stylize(ST_PATH, directory), e))
+			names = []
+
+		size    = dir_stat.st_size
+		subdirs = []
+
+		for name in names:
+			try:
+				entry_stat = os.lstat(os.path.join(directory, name))
+
+			except (IOError, OSError):
+				continue
+
+			if S_ISDIR(entry_stat.st_mode):
+				subdirs.append(name)
+
+			else:
+				size += entry_stat.st_size
+
+		old = self.__dirs.get(directory)
+
+		if old is not None:
+			for name in set(old[2]).difference(subdirs):
+				self.__drop(os.path.join(directory, name))
+
+		record = self.__dirs[directory] = (dir_stat.st_mtime, size,
+											tuple(subdirs), now)
+		self.__changed = True
+
+		return record
+	def __drop(self, directory):
+		""" Forget ``directory`` and everything below. """
+
+		stack = [ directory ]
+
+		while stack:
+			path   = stack.pop()
+			record = self.__dirs.pop(path, None)
+
+			if record is not None:
+				self.__changed = True
+				stack.extend(os.path.join(path, name) for name in record[2])
+	def __load(self):
+		try:
+			with open(self.filename, 'rb') as f:
+				self.__dirs = marshal.load(f)
+
+		except (IOError, OSError, EOFError, ValueError, TypeError), e:
+			if getattr(e, 'errno', None) != errno.ENOENT:
+				logging.warning2(_(u'Size index {0} unusable, starting '
+									u'from scratch (was: {1}).').format(
+										stylize(ST_PATH, self.filename), e))
+			self.__dirs = {}
+	def __save(self):
+		""" Atomically replace the stored index with the current one. """
+
+		directory = os.path.dirname(self.filename)
+
+		try:
+			if not os.path.exists(directory):
+				os.makedirs(directory, 0700)
+
+			fd, tmpname = tempfile.mkstemp(dir=directory)
+
+			with os.fdopen(fd, 'wb') as f:
+				marshal.dump(self.__dirs, f)
+
+			os.rename(tmpname, self.filename)
+
+		except (IOError, OSError), e:
+			logging.warning(_(u'Unable to save size index {0} '
+								u'(was: {1}).').format(
+									stylize(ST_PATH, self.filename), e))
+
+		self.__changed = False
 
 # ============================================================ FS API functions
 
@@ -643,9 +999,165 @@ def setup_users_groups():
 		users  = fake_users()
 		groups = fake_groups()
 
+def compiled_acl(text, execperms=None):
+	""" Return a :class:`posix1e.ACL` built from the check rule ``text``, with
+		``@UX`` and ``@GX`` replaced by the exec bits of ``execperms`` (as
+		returned by :func:`execbits2str`).
+
+		The parsing of the ACL text (and the resolution of the names it
+		contains) is done only once per ``(text, exec bits)``: the
+		returned objects are shared and must not be modified by callers.
+		Call :func:`flush_compiled_acls` when users or groups names could
+		resolve to something different: the users and groups controllers
+		do it each time they store or delete an object (this covers
+		additions, deletions, renames and reloads), and the check rules
+		reload does it too.
+	"""
+
+	if execperms is not None and ('@GX' in text or '@UX' in text):
+		execperms = ''.join(execperms[:2])
+
+	else:
+		execperms = None
+
+	key = (text, execperms)
+
+	try:
+		return _compiled_acls[key]
+
+	except KeyError:
+		pass
+
+	generation = _compiled_acls_generation
+
+	if execperms is None:
+		acl = posix1e.ACL(text=text)
+
+	else:
+		acl = posix1e.ACL(text=text.replace('@GX',
+								execperms[1]).replace('@UX', execperms[0]))
+
+	if compiled_acls_max:
+		with _compiled_acls_lock:
+			if generation == _compiled_acls_generation:
+				if len(_compiled_acls) >= compiled_acls_max:
+					_compiled_acls.clear()
+
+				_compiled_acls[key] = acl
+
+	return acl
+def flush_compiled_acls():
+	""" Forget all ACL objects compiled by :func:`compiled_acl`. """
+
+	global _compiled_acls_generation
+
+	with _compiled_acls_lock:
+		_compiled_acls.clear()
+		_compiled_acls_generation += 1
+def __minifind_error(entry, e):
+	""" Warn about or re-raise an error encountered while walking. """
+
+	if e.errno == errno.ENOENT or (e.errno == errno.EACCES
+			and os.path.basename(entry) in special_invalid_paths):
+		logging.warning2(_(u'fsapi.minifind(): error on {0}: {1}').format(
+											stylize(ST_PATH, entry), e))
+	else:
+		raise e
+def __minifind_scan(directory, relative, exclude, followlinks, need_mode):
+	""" List one directory for `minifind()`. Return a list of
+		``(path, relative_path, type, mode)`` tuples for the non-excluded
+		entries. ``mode`` is ``None`` unless ``need_mode`` is ``True``.
+
+		When the `scandir` module is available, entries types come from the
+		directory itself (``d_type``) and entries are not `stat()`ed unless
+		needed (mode wanted, links followed, or unknown type).
+	"""
+
+	found = []
+
+	try:
+		if scandir is None:
+			names = os.listdir(directory)
+
+		else:
+			names = scandir(directory)
+
+		for dentry in names:
+			name = dentry if scandir is None else dentry.name
+
+			entry_relative = os.path.join(relative, name)
+
+			if entry_relative in exclude:
+				assert ltrace(TRACE_FSAPI, '  minifind(excluded=%s)' % entry_relative)
+				continue
+
+			entry = os.path.join(directory, name)
+
+			try:
+				if scandir is None:
+					entry_mode = (os.stat if followlinks else os.lstat)(entry).st_mode
+
+				elif followlinks or need_mode:
+					entry_mode = dentry.stat(follow_symlinks=followlinks).st_mode
+
+				elif dentry.is_symlink():
+					entry_mode = S_IFLNK
+
+				elif dentry.is_dir(follow_symlinks=False):
+					entry_mode = S_IFDIR
+
+				elif dentry.is_file(follow_symlinks=False):
+					entry_mode = S_IFREG
+
+				else:
+					# sockets, fifos, devices: we need to know which one.
+					entry_mode = dentry.stat(follow_symlinks=False).st_mode
+
+			except (IOError, OSError), e:
+				__minifind_error(entry, e)
+				continue
+
+			found.append((entry, entry_relative, S_IFMT(entry_mode),
+							S_IMODE(entry_mode) if need_mode else None))
+
+	except (IOError, OSError), e:
+		# ENOENT happens on recursive delete() applyed on minifind()
+		# results: the dir vanishes during the listing.
+		if e.errno == errno.ENOENT:
+			logging.warning2(_(u'fsapi.minifind(): error on {0}: {1}').format(
+										stylize(ST_PATH, directory), e))
+		else:
+			raise e
+
+	return found
+def __minifind_worker(jobs, results, exclude, followlinks, need_mode):
+	""" Scan the directories coming from `jobs` until ``None`` comes. """
+
+	while True:
+		job = jobs.get()
+
+		if job is None:
+			break
+
+		directory, relative, depth = job
+
+		try:
+			results.put((job, __minifind_scan(directory, relative, exclude,
+									followlinks, need_mode), None))
+
+		except Exception, e:
+			results.put((job, None, e))
 def minifind(path, itype=None, perms=None, mindepth=0, maxdepth=99, exclude=[],
-	followlinks=False, followmounts=True, yield_type=False):
-	""" Mimic the GNU find behaviour in python. returns an iterator. """
+	followlinks=False, followmounts=True, yield_type=False, workers=1):
+	""" Mimic the GNU find behaviour in python. returns an iterator.
+
+		The walk is breadth-first. With ``workers`` > 1, directories listings
+		are spread over as many threads (this pays off on high latency
+		file-systems like NFS); entries are then yielded as soon as their
+		directory is listed, and the order is no more breadth-first. In this
+		mode, the caller should not remove or rename directories while
+		iterating.
+	"""
 
 	if mindepth > maxdepth:
 		raise  exceptions.BadArgumentError(
@@ -657,86 +1169,126 @@ def minifind(path, itype=None, perms=None, mindepth=0, maxdepth=99, exclude=[],
 
 	assert ltrace_func(TRACE_FSAPI)
 
-	paths_to_walk      = [ path ]
-	next_paths_to_walk = []
-	current_depth      = 0
 	if itype is None:
 		itype = (S_IFDIR, S_IFREG)
 
-	while True:
+	need_mode = perms is not None
 
-		if paths_to_walk != []:
-			entry = paths_to_walk.pop(0)
+	def wanted(entry_relative, entry_type, entry_mode, depth):
+		return (depth >= mindepth
+				and entry_type in itype
+				and (perms is None or entry_mode & perms)
+				and entry_relative not in exclude)
 
-		elif next_paths_to_walk != []:
-			paths_to_walk      = next_paths_to_walk
-			next_paths_to_walk = []
-			entry              = paths_to_walk.pop(0)
-			current_depth     += 1
+	def descend(entry, entry_type, depth):
+		if entry_type == S_IFLNK and not followlinks:
+			logging.progress(_(u'minifind(): skipping link or '
+				u'mountpoint {0}.').format(stylize(ST_PATH, entry)))
+			return False
 
-		else:
-			break
+		if entry_type != S_IFDIR or depth >= maxdepth:
+			return False
 
-		# remove path from entry to get where we are.
-		current_path = entry[len(path+os.sep):]
+		if not followmounts and os.path.ismount(entry):
+			logging.progress(_(u'minifind(): skipping link or '
+				u'mountpoint {0}.').format(stylize(ST_PATH, entry)))
+			return False
 
-		if followlinks:
-			stat_func = os.stat
-		else:
-			stat_func = os.lstat
+		return True
 
-		try:
-			entry_stat = stat_func(entry)
-			entry_type = entry_stat.st_mode & 0170000
-			entry_mode = entry_stat.st_mode & 07777
+	try:
+		entry_stat = (os.stat if followlinks else os.lstat)(path)
 
-		except (IOError, OSError), e:
-			if e.errno == errno.ENOENT or (e.errno == errno.EACCES
-					and os.path.basename(entry) in special_invalid_paths):
-				logging.warning2(_(u'fsapi.minifind(): error on {0}: {1}').format(
-										stylize(ST_PATH, entry), e))
-			else:
-				raise e
-		else:
-			if (current_depth >= mindepth
-					and entry_type in itype
-					and (perms is None or entry_mode & perms)):
-				#ltrace(TRACE_FSAPI, '  minifind(yield=%s)' % entry)
+	except (IOError, OSError), e:
+		__minifind_error(path, e)
+		return
 
-				if current_path not in exclude:
-					if yield_type:
-						yield (entry, entry_type)
+	entry_type = S_IFMT(entry_stat.st_mode)
 
-					else:
-						yield entry
+	if wanted('', entry_type, S_IMODE(entry_stat.st_mode), 0):
+		yield (path, entry_type) if yield_type else path
 
-			if (entry_type == S_IFLNK and not followlinks) \
-				or (os.path.ismount(entry) and not followmounts):
-				logging.progress(_(u'minifind(): skipping link or '
-					u'mountpoint {0}.').format(stylize(ST_PATH, entry)))
-				continue
+	if not descend(path, entry_type, 0):
+		return
 
-			if entry_type == S_IFDIR and current_depth < maxdepth:
-				try:
-					for x in os.listdir(entry):
-						if os.path.join(current_path, x) not in exclude:
-							next_paths_to_walk.append(os.path.join(entry, x))
+	if workers > 1:
+		jobs    = Queue()
+		results = Queue()
+		threads = []
 
-						else:
-							assert ltrace(TRACE_FSAPI, '  minifind(excluded=%s)' % entry)
+		for index in range(workers):
+			thread = Thread(target=__minifind_worker,
+							name='minifind-%s' % index,
+							args=(jobs, results, exclude,
+									followlinks, need_mode))
+			thread.daemon = True
+			thread.start()
+			threads.append(thread)
 
-				except (IOError, OSError), e:
-					if e.errno == errno.ENOENT:
-						# happens on recursive delete() applyed on minifind()
-						# results: the dir vanishes during the os.listdir().
-						logging.warning2(_(u'fsapi.minifind(): error on {0}: {1}').format(stylize(ST_PATH, entry), e))
+		def walk(job):
+			jobs.put(job)
+			pending = 1
+
+			while pending:
+				job, found, error = results.get()
+				pending -= 1
+
+				if error is not None:
+					raise error
+
+				yield job, found
+
+				# `walk_found()` has appended the sub-directories to
+				# `to_walk` while we were yielding.
+				while to_walk:
+					jobs.put(to_walk.popleft())
+					pending += 1
+
+	else:
+		threads = None
+
+		def walk(job):
+			to_walk.append(job)
+
+			while to_walk:
+				job = to_walk.popleft()
+				yield job, __minifind_scan(job[0], job[1], exclude,
+											followlinks, need_mode)
+
+	to_walk = deque()
+
+	try:
+		for (directory, relative, depth), found in walk((path, '', 0)):
+			depth += 1
+
+			for entry, entry_relative, entry_type, entry_mode in found:
+				if wanted(entry_relative, entry_type, entry_mode, depth):
+					yield (entry, entry_type) if yield_type else entry
+
+				if descend(entry, entry_type, depth):
+					to_walk.append((entry, entry_relative, depth))
+
+	finally:
+		if threads:
+			for thread in threads:
+				jobs.put(None)
+
+			for thread in threads:
+				thread.join()
 
-					else:
-						raise e
 	assert ltrace_func(TRACE_FSAPI, True)
 def check_dirs_and_contents_perms_and_acls_new(dirs_infos, batch=False,
-										auto_answer=None, full_display=True):
-	""" General function to check file/directory. """
+							auto_answer=None, full_display=True, state=None):
+	""" General function to check file/directory.
+
+		:param state: an optional :class:`CheckState`. In batch mode, the
+			directories contents which didn't change since the last complete
+			run are skipped. The state is saved only if the check completes.
+	"""
+
+	if not batch:
+		# the user can refuse repairs: conforming or not, we can't know.
+		state = None
 
 	# This will either use LMC, or fake getent encapsulation,
 	# given the context (inside licornd or not).
@@ -859,18 +1411,58 @@ def check_dirs_and_contents_perms_and_acls_new(dirs_infos, batch=False,
 				else:
 					itype = (S_IFREG, )
 
+				if state is not None:
+					rule_hashes = {
+						S_IFREG: state.rule_hash(dir_info, S_IFREG),
+						S_IFDIR: state.rule_hash(dir_info, S_IFDIR),
+					}
+
 				for entry, etype in minifind(path, itype=itype,
-											exclude=exclude_list, mindepth=1,
-											yield_type=True):
+									exclude=exclude_list, mindepth=1,
+									yield_type=True,
+									workers=settings.fsapi.minifind_workers):
+
+						if state is None:
+							entry_stat = None
+
+						else:
+							try:
+								# NO `os.stat()`, see above.
+								entry_stat = os.lstat(entry)
+
+							except (IOError, OSError), e:
+								if e.errno == errno.ENOENT:
+									continue
+								raise
+
+							if state.unchanged(entry, entry_stat,
+													rule_hashes[etype]):
+								continue
 
 						dir_info.path = entry
+						modified      = False
+
 						for event in check_perms(file_type=etype,
 												dir_info=dir_info,
 												batch=batch,
 												auto_answer=auto_answer,
-												full_display=full_display):
+												full_display=full_display,
+												entry_stat=entry_stat):
+							modified = True
 							yield event
 
+						if state is not None:
+							if modified:
+								try:
+									entry_stat = os.lstat(entry)
+
+								except (IOError, OSError), e:
+									if e.errno == errno.ENOENT:
+										continue
+									raise
+
+							state.update(entry, entry_stat, rule_hashes[etype])
+
 		else:
 			logging.warning2(_(u'Not touching %s, it is not a file nor a '
 														u'directory.') % path)
@@ -880,6 +1472,9 @@ def check_dirs_and_contents_perms_and_acls_new(dirs_infos, batch=False,
 
 	if dirs_infos != None:
 
+		if state is not None:
+			state.begin()
+
 		# first, check default rule, if it exists. /home/groups, /home/archives
 		# and such kind of 'base paths' don't have any, and it is perfectly
 		# normal... But home dirs and group shared dirs should have one.
@@ -894,6 +1489,9 @@ def check_dirs_and_contents_perms_and_acls_new(dirs_infos, batch=False,
 		for dir_info in dirs_infos:
 			for event in check_one_dir_and_acl(dir_info.copy()):
 				yield event
+
+		if state is not None:
+			state.commit()
 	else:
 		raise exceptions.BadArgumentError(
 			_(u'You must pass something through dirs_infos to check!'))
@@ -983,9 +1581,12 @@ def __raise_or_return(pretty_path, batch, auto_answer):
 													pretty_path),
 													auto_answer=auto_answer))
 def check_perms(dir_info, file_type=None, is_root_dir=False, check_symlinks=False,
-					batch=False, auto_answer=None, full_display=True):
+			batch=False, auto_answer=None, full_display=True, entry_stat=None):
 	""" Check if permissions and ACLs conforms on a file or directory.
 
+		``entry_stat`` is an optional, fresh ``os.lstat()`` result of the
+		entry, to avoid stat'ing it again.
+
 		Many sub-operations in this function can fail and will produce
 		exceptions. Eg. if an inotify event is catched on a transient file
 		(just created, just deleted), an mkstemp() operation, etc.
@@ -1043,6 +1644,26 @@ def check_perms(dir_info, file_type=None, is_root_dir=False, check_symlinks=Fals
 	logging.progress(_(u'{0}: checking permissions on {1}…').format(
 													pretty_name, pretty_path))
 
+	# One `lstat()` serves the exec bits, the ownership and the posix perms
+	# checks, as long as nothing is changed on the way.
+	if entry_stat is None:
+		try:
+			# WARNING: do not use os.stat(), this could lead to check
+			# files in unwanted places and can be considered as a
+			# security vulnerability.
+			entry_stat = os.lstat(path)
+
+		except (IOError, OSError), e:
+			# this can fail if an inotify event is catched on a transient file
+			# (just created, just deleted), like mkstemp() ones.
+			logging.exception(_(u'Exception while trying to `stat()` {0}'), pretty_path)
+
+			if e.errno == errno.ENOENT:
+				return
+
+			if __raise_or_return(pretty_path, batch, auto_answer):
+				raise
+
 	# get the access_perm and the type of perm (POSIX1E or POSIX) that will be
 	# applyed on path
 	if file_type == S_IFDIR:
@@ -1062,18 +1683,8 @@ def check_perms(dir_info, file_type=None, is_root_dir=False, check_symlinks=Fals
 		# fix #748: RESTRICTED should honner the exec bit on files
 		if not perm_acl and access_perm in (00644, 00640, 00600):
 
-			try:
-				perm = execbits2str(path, check_other=True)
-
-			except (IOError, OSError), e:
-				logging.exception(_(u'fsapi.check_perms(): exception while '
-						u'`execbits2str()` on {0}.').format(pretty_path))
-
-				if e.errno == errno.ENOENT:
-					return
-
-				if __raise_or_return(pretty_path, batch, auto_answer):
-					raise
+			perm = execbits2str(path, check_other=True,
+										mode=entry_stat.st_mode)
 
 			if perm[0] == "x": # user
 				access_perm += S_IXUSR
@@ -1084,32 +1695,6 @@ def check_perms(dir_info, file_type=None, is_root_dir=False, check_symlinks=Fals
 			if perm[2] == "x" and access_perm == 00644: # other
 				access_perm += S_IXOTH
 
-	# if we are going to set POSIX1E acls, check '@GX' or '@UX' vars
-	if perm_acl:
-		# FIXME : allow @X only.
-
-		try:
-			execperms = execbits2str(path)
-
-		except (IOError, OSError), e:
-			# this can fail if an inotify event is catched on a transient file
-			# (just created, just deleted), like mkstemp() ones.
-			logging.exception(_(u'fsapi.check_perms(): exception while '
-						u'`execbits2str()` on {0}.').format(pretty_path))
-
-			if e.errno == errno.ENOENT:
-				return
-
-			if __raise_or_return(pretty_path, batch, auto_answer):
-				raise
-
-		if '@GX' in access_perm or '@UX' in access_perm:
-			access_perm = access_perm.replace(
-							'@GX', execperms[1]).replace(
-							'@UX', execperms[0])
-
-		access_perm = posix1e.ACL(text='%s' % access_perm)
-
 	if is_root_dir:
 		gid = dir_info.root_gid
 
@@ -1121,10 +1706,21 @@ def check_perms(dir_info, file_type=None, is_root_dir=False, check_symlinks=Fals
 
 	uid = dir_info.uid
 
+	# if we are going to set POSIX1E acls, check '@GX' or '@UX' vars
+	if perm_acl:
+		# FIXME : allow @X only.
+		access_perm = compiled_acl('%s' % access_perm,
+									execbits2str(path, mode=entry_stat.st_mode))
+
+	# set to True as soon as we modify the entry: `entry_stat` is then stale.
+	modified = False
+
 	for event in check_uid_and_gid(path=path,
 									uid=uid, gid=gid,
 									batch=batch,
-									full_display=full_display):
+									full_display=full_display,
+									entry_stat=entry_stat):
+		modified = True
 		yield event
 
 	if full_display:
@@ -1231,7 +1827,7 @@ def check_perms(dir_info, file_type=None, is_root_dir=False, check_symlinks=Fals
 			else:
 				default_perm = dir_info.root_dir_perm
 
-			default_perm = posix1e.ACL(text=default_perm)
+			default_perm = compiled_acl(default_perm)
 
 			if current_default_perm != default_perm:
 
@@ -1328,6 +1924,8 @@ def check_perms(dir_info, file_type=None, is_root_dir=False, check_symlinks=Fals
 							auto_answer=auto_answer):
 
 				try:
+					modified = True
+
 					# if it is a directory we need to delete DEFAULT ACLs too
 					if file_type == S_IFDIR:
 
@@ -1364,21 +1962,24 @@ def check_perms(dir_info, file_type=None, is_root_dir=False, check_symlinks=Fals
 			else:
 				all_went_ok = False
 
-		try:
-			# WARNING: do not use os.stat(), this could lead to check
-			# files in unwanted places and can be considered as a
-			# security vulnerability.
-			pathstat     = os.lstat(path)
-			current_perm = pathstat.st_mode & 07777
+		if modified:
+			# a chown() or an ACL removal can alter the mode.
+			try:
+				# WARNING: do not use os.stat(), this could lead to check
+				# files in unwanted places and can be considered as a
+				# security vulnerability.
+				entry_stat = os.lstat(path)
 
-		except (IOError, OSError), e:
-			logging.exception(_(u'Exception while trying to `stat()` {0}'), pretty_path)
+			except (IOError, OSError), e:
+				logging.exception(_(u'Exception while trying to `stat()` {0}'), pretty_path)
 
-			if e.errno == errno.ENOENT:
-				return
+				if e.errno == errno.ENOENT:
+					return
 
-			if __raise_or_return(pretty_path, batch, auto_answer):
-				raise
+				if __raise_or_return(pretty_path, batch, auto_answer):
+					raise
+
+		current_perm = entry_stat.st_mode & 07777
 
 		if current_perm != access_perm:
 
@@ -1425,35 +2026,44 @@ def check_perms(dir_info, file_type=None, is_root_dir=False, check_symlinks=Fals
 
 	assert ltrace_func(TRACE_FSAPI, True)
 def check_uid_and_gid(path, uid=-1, gid=-1, batch=None, auto_answer=None,
-														full_display=True):
-	""" function that check the uid and gid of a file or a dir. """
+										full_display=True, entry_stat=None):
+	""" function that check the uid and gid of a file or a dir.
+
+		:param entry_stat: an optional, fresh ``os.lstat()`` result of
+			``path``, to avoid stat'ing it again.
+	"""
 
 	pretty_path = stylize(ST_PATH, path)
 
 	if full_display:
 		logging.progress(_(u'Checking POSIX uid/gid/perms of %s.') %
 													stylize(ST_PATH, path))
-	try:
-		# WARNING: do not use os.stat(), this could lead to checking
-		# a completely different file/dir and can be considered as
-		# a security vulnerability in some situations.
-		pathstat = os.lstat(path)
 
-	except (IOError, OSError), e:
-			# causes of this error:
-			#     - this is a race condition: the dir/file has been deleted
-			#		between the minifind() and the check_*() call.
-			#		Don't blow out on this.
-			#     - when we explicitely want to check a path which does not
-			#		exist because it has not been created yet (eg: ~/.dmrc
-			#		on a brand new user account).
-		logging.exception(_(u'Exception while trying to `stat()` {0}'), pretty_path)
+	if entry_stat is None:
+		try:
+			# WARNING: do not use os.stat(), this could lead to checking
+			# a completely different file/dir and can be considered as
+			# a security vulnerability in some situations.
+			pathstat = os.lstat(path)
 
-		if e.errno == errno.ENOENT:
-			return
+		except (IOError, OSError), e:
+				# causes of this error:
+				#     - this is a race condition: the dir/file has been deleted
+				#		between the minifind() and the check_*() call.
+				#		Don't blow out on this.
+				#     - when we explicitely want to check a path which does not
+				#		exist because it has not been created yet (eg: ~/.dmrc
+				#		on a brand new user account).
+			logging.exception(_(u'Exception while trying to `stat()` {0}'), pretty_path)
 
-		if __raise_or_return(pretty_path, batch, auto_answer):
-			raise
+			if e.errno == errno.ENOENT:
+				return
+
+			if __raise_or_return(pretty_path, batch, auto_answer):
+				raise
+
+	else:
+		pathstat = entry_stat
 
 	# if one or both of the uid or gid are empty, don't check it, use the
 	# current one present in the file meta-data.
@@ -1863,17 +2473,23 @@ def get_file_encoding(filename):
 		ret_encoding = None
 
 	return ret_encoding
-def execbits2str(filename, check_other=False):
+def execbits2str(filename, check_other=False, mode=None):
 	"""Find if a file has executable bits and return (only) then as
 		a list of strings, used later to build an ACL permission string.
 
+		:param mode: the ``st_mode`` of ``filename``, if the caller already
+			has it; ``filename`` will not be stat'ed again.
+
 		TODO: as these exec perms are used for ACLs only, should not
 		we avoid testing setuid and setgid bits ? what does setguid
 		means in a posix1e ACL ?
 	"""
 
-	# WARNING: no os.stat(); see elsewhere in this file for comment.
-	fileperms = os.lstat(filename).st_mode & 07777
+	if mode is None:
+		# WARNING: no os.stat(); see elsewhere in this file for comment.
+		mode = os.lstat(filename).st_mode
+
+	fileperms = mode & 07777
 	execperms = []
 
 	# exec bit for owner ?
@@ -9,7 +9,7 @@ fsapi test - testsuite for fsapi
 :license: GNU GPL version 2
 """
 
-import os, stat, py.test
+import os, stat, shutil, tempfile, py.test
 
 from licorn.foundations import logging, exceptions, process, fsapi
 
@@ -88,4 +88,74 @@ def test_has_flags_immutable():
 	process.execute(['chattr', '-i', fname])
 
 	assert fsapi.has_flags(fname, [stat.SF_IMMUTABLE]) == False
+def test_size_index():
+	""" The index must always agree with `du`, re-scanning only what changed
+		(touched directories for in-place modifications). """
 
+	directory = tempfile.mkdtemp()
+	index     = fsapi.SizeIndex(directory + '.sizes')
+
+	def du(path):
+		return int(process.execute(['du', '-bs', '--apparent-size',
+										path])[0].split()[0])
+
+	try:
+		for i in range(10):
+			os.makedirs('%s/dir%d/sub' % (directory, i))
+			open('%s/dir%d/sub/file' % (directory, i), 'w').write('x' * i)
+
+		assert index.size(directory) == du(directory)
+
+		shutil.rmtree(directory + '/dir3')
+		open(directory + '/dir4/new', 'w').write('y' * 100)
+
+		assert index.size(directory) == du(directory)
+
+		# an in-place modification doesn't change the directory mtime.
+		open(directory + '/dir5/sub/file', 'a').write('z' * 50)
+		index.touch(directory + '/dir5/sub')
+
+		assert index.size(directory) == du(directory)
+
+		# the index survives a restart.
+		assert fsapi.SizeIndex(directory + '.sizes').size(
+											directory) == du(directory)
+
+		assert index.size(directory + '/dir4/new') == 100
+		assert index.size(directory + '/nothing') is None
+
+	finally:
+		shutil.rmtree(directory)
+		os.unlink(directory + '.sizes')
+def test_compiled_acl_recreated_group():
+	""" The controllers forget the compiled ACLs when a group is deleted or
+		its GID reused, not when a new one is stored (mass imports). """
+
+	from threading import RLock
+	from licorn.core._controllers import IdAllocatingController
+
+	class FakeGroup(object):
+		def __init__(self, name):
+			self.name = name
+
+	class FakeController(IdAllocatingController, dict):
+		lock = RLock()
+
+	groups = FakeController()
+	text   = 'u::rwx,g::r-x,o::---'
+	acl    = fsapi.compiled_acl(text)
+
+	groups[30100] = FakeGroup('licorn-acltest')
+	groups[30100] = groups[30100]
+	groups[30101] = FakeGroup('licorn-acltest2')
+
+	assert fsapi.compiled_acl(text) is acl
+
+	del groups[30100]
+
+	acl2 = fsapi.compiled_acl(text)
+	assert acl2 is not acl
+
+	groups[30101] = FakeGroup('licorn-acltest')
+
+	assert fsapi.compiled_acl(text) is not acl2
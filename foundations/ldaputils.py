@@ -7,7 +7,10 @@ Licensed under the terms of the GNU GPL version 2.
 """
 
 import ldap, string, cStringIO, tempfile
-from ldif import LDIFParser
+from ldif       import LDIFParser
+from ldap       import controls
+from threading  import Condition
+from contextlib import contextmanager
 
 def list_dict(l):
 	"""
@@ -128,6 +131,129 @@ def modifyModlist(old_entry, new_entry, ignore_attr_types=None,
 			attrtype = attrtype_lower_map[a]
 			modlist.append((ldap.MOD_DELETE, attrtype, None))
 	return modlist # modifyModlist()
+def _paged_control(size, cookie=''):
+	""" Build a non-critical paged results control (the server can ignore
+		it and send everything at once), for any python-ldap version. """
+	try:
+		# python-ldap >= 2.4
+		return controls.SimplePagedResultsControl(False, size=size,
+															cookie=cookie)
+	except TypeError:
+		return controls.SimplePagedResultsControl(ldap.LDAP_CONTROL_PAGE_OID,
+															False, (size, cookie))
+def _paged_cookie(server_controls):
+	""" Return the cookie of the next page, or '' if it was the last one. """
+	for control in server_controls:
+		if control.controlType == ldap.LDAP_CONTROL_PAGE_OID:
+			try:
+				return control.cookie
+
+			except AttributeError:
+				# python-ldap < 2.4
+				return control.controlValue[1]
+
+	return ''
+def paged_search(connection, base, scope, filterstr, attrlist=None,
+															page_size=500):
+	""" Like `connection.search_s()`, but a generator which fetches the
+		results by pages of `page_size` entries (RFC 2696) and yields the
+		`(dn, entry)` tuples as they come. Only one page is in memory at a
+		time, whatever the size of the directory. Referrals are skipped.
+	"""
+	cookie = ''
+
+	while True:
+		msgid = connection.search_ext(base, scope, filterstr, attrlist,
+						serverctrls=[ _paged_control(page_size, cookie) ])
+
+		rtype, rdata, rmsgid, server_controls = connection.result3(msgid)
+
+		for dn, entry in rdata:
+			if dn is not None:
+				yield dn, entry
+
+		cookie = _paged_cookie(server_controls)
+
+		if not cookie:
+			break
+class LDAPConnectionPool(object):
+	""" At most `size` connections to `uri`, each one bound once by
+		`bind(connection)` when created, and then reused. Threads use
+		them through :meth:`connection`, and wait when all are busy.
+		A connection which gets :class:`ldap.SERVER_DOWN` is dropped, the
+		next caller will create and bind a fresh one.
+	"""
+	def __init__(self, uri, bind, size=4):
+		self.uri       = uri
+		self.bind      = bind
+		self.size      = size
+		self.idle      = []
+		self.count     = 0
+		self.condition = Condition()
+	@contextmanager
+	def connection(self):
+		conn = self.acquire()
+
+		try:
+			yield conn
+
+		except ldap.SERVER_DOWN:
+			self.discard(conn)
+			raise
+
+		except:
+			self.release(conn)
+			raise
+
+		else:
+			self.release(conn)
+	def acquire(self):
+		with self.condition:
+			while not self.idle and self.count >= self.size:
+				self.condition.wait()
+
+			if self.idle:
+				return self.idle.pop()
+
+			self.count += 1
+
+		try:
+			conn = ldap.initialize(self.uri)
+			self.bind(conn)
+
+		except:
+			with self.condition:
+				self.count -= 1
+				self.condition.notify()
+			raise
+
+		return conn
+	def release(self, conn):
+		with self.condition:
+			self.idle.append(conn)
+			self.condition.notify()
+	def discard(self, conn):
+		try:
+			conn.unbind_s()
+
+		except:
+			pass
+
+		with self.condition:
+			self.count -= 1
+			self.condition.notify()
+	def close(self):
+		""" Unbind the idle connections; busy ones are left alone. """
+		with self.condition:
+			idle, self.idle = self.idle, []
+			self.count -= len(idle)
+
+		for conn in idle:
+			try:
+				conn.unbind_s()
+
+			except:
+				pass
 class LicornSmallLDIFParser(LDIFParser):
 	def __init__(self, input_name, replacement_table=None):
 
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Licorn foundations - http://dev.licorn.org/documentation/foundations
+
+ldaputils test - paged searches and the connection pool, against a
+throw-away `slapd` started in a temporary directory (skipped if OpenLDAP
+is not installed).
+
+:copyright:
+	* 2012 Olivier Cortès <olive@deep-ocean.net>
+:license: GNU GPL version 2
+"""
+
+import os, time, socket, signal, shutil, tempfile, subprocess, py.test
+
+from threading import Thread
+
+slapd  = '/usr/sbin/slapd'
+schema = '/etc/ldap/schema'
+
+if not os.path.exists(slapd):
+	py.test.skip('slapd is not installed')
+
+import ldap
+from licorn.foundations import ldaputils
+
+base   = 'dc=test,dc=local'
+people = 'ou=People,' + base
+paged  = 'ou=Paged,' + base
+rootdn = 'cn=admin,' + base
+secret = 'secret'
+count  = 120
+
+slapd_conf = '''
+include		%(schema)s/core.schema
+include		%(schema)s/cosine.schema
+include		%(schema)s/nis.schema
+include		%(schema)s/inetorgperson.schema
+
+pidfile		%(directory)s/slapd.pid
+
+database	ldif
+directory	%(directory)s/data
+suffix		"%(base)s"
+rootdn		"%(rootdn)s"
+rootpw		%(secret)s
+
+access to * by * read
+
+# a plain search of all the accounts must hit this limit, a paged one not.
+limits anonymous size.soft=50 size.hard=50 size.prtotal=unlimited
+'''
+
+directory = None
+uri       = None
+
+def free_port():
+	sock = socket.socket()
+	sock.bind(('127.0.0.1', 0))
+	port = sock.getsockname()[1]
+	sock.close()
+	return port
+def admin_bind(conn):
+	conn.simple_bind_s(rootdn, secret)
+def setup_module(module):
+	global directory, uri
+
+	directory = tempfile.mkdtemp(prefix='licorn-slapd-')
+	os.mkdir(os.path.join(directory, 'data'))
+
+	with open(os.path.join(directory, 'slapd.conf'), 'w') as f:
+		f.write(slapd_conf % dict(schema=schema, directory=directory,
+								base=base, rootdn=rootdn, secret=secret))
+
+	uri = 'ldap://127.0.0.1:%d/' % free_port()
+
+	subprocess.check_call([ slapd, '-f', os.path.join(directory, 'slapd.conf'),
+							'-h', uri ])
+
+	for i in range(50):
+		try:
+			conn = ldap.initialize(uri)
+			admin_bind(conn)
+			break
+
+		except ldap.SERVER_DOWN:
+			time.sleep(0.1)
+
+	conn.add_s(base, [ ('objectClass', [ 'dcObject', 'organization' ]),
+						('dc', [ 'test' ]), ('o', [ 'test' ]) ])
+	conn.add_s(people, [ ('objectClass', [ 'organizationalUnit' ]),
+						('ou', [ 'People' ]) ])
+
+	# test_paged_search() has its own accounts, the pool tests fill People.
+	conn.add_s(paged, [ ('objectClass', [ 'organizationalUnit' ]),
+						('ou', [ 'Paged' ]) ])
+
+	for uid in range(count):
+		conn.add_s(*account(uid, paged))
+
+	conn.unbind_s()
+def teardown_module(module):
+	try:
+		pid = int(open(os.path.join(directory, 'slapd.pid')).read().strip())
+		os.kill(pid, signal.SIGTERM)
+
+		for i in range(50):
+			os.kill(pid, 0)
+			time.sleep(0.1)
+
+	except (IOError, OSError):
+		pass
+
+	shutil.rmtree(directory, ignore_errors=True)
+def account(uid, container=people):
+	login = 'user%04d' % uid
+	return 'uid=%s,%s' % (login, container), ldaputils.addModlist({
+			'objectClass'   : ('inetOrgPerson', 'posixAccount', 'shadowAccount'),
+			'uid'           : login,
+			'cn'            : login,
+			'sn'            : login,
+			'uidNumber'     : 10000 + uid,
+			'gidNumber'     : 100,
+			'homeDirectory' : '/home/' + login,
+		})
+
+def test_pool_parallel_adds():
+	pool = ldaputils.LDAPConnectionPool(uri, admin_bind, size=4)
+
+	def add(uids):
+		for uid in uids:
+			with pool.connection() as conn:
+				conn.add_s(*account(uid))
+
+	threads = [ Thread(target=add, args=(range(i, count, 8), ))
+														for i in range(8) ]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+
+	# never more connections than asked, and all of them reusable.
+	assert pool.count <= 4
+	assert len(pool.idle) == pool.count
+
+	with pool.connection() as conn:
+		assert len(conn.search_s(people, ldap.SCOPE_ONELEVEL,
+								'(objectClass=posixAccount)')) == count
+
+	pool.close()
+	assert pool.count == 0
+def test_pool_discards_dead_connections():
+	pool = ldaputils.LDAPConnectionPool(uri, admin_bind, size=1)
+
+	try:
+		with pool.connection() as conn:
+			raise ldap.SERVER_DOWN({})
+
+	except ldap.SERVER_DOWN:
+		pass
+
+	assert pool.count == 0 and pool.idle == []
+
+	# the next caller gets a fresh, bound connection.
+	with pool.connection() as conn:
+		conn.add_s(*account(count))
+		conn.delete_s(account(count)[0])
+def test_paged_search():
+	conn = ldap.initialize(uri)
+
+	py.test.raises(ldap.SIZELIMIT_EXCEEDED, conn.search_s, paged,
+						ldap.SCOPE_ONELEVEL, '(objectClass=posixAccount)')
+
+	results = ldaputils.paged_search(conn, paged, ldap.SCOPE_ONELEVEL,
+						'(objectClass=posixAccount)', [ 'uidNumber' ],
+						page_size=20)
+
+	# a generator: nothing is fetched before iterating.
+	assert hasattr(results, 'next')
+
+	uids = sorted(int(entry['uidNumber'][0]) for dn, entry in results)
+
+	assert uids == range(10000, 10000 + count)
+def test_paged_search_no_such_object():
+	conn = ldap.initialize(uri)
+
+	py.test.raises(ldap.NO_SUCH_OBJECT, list, ldaputils.paged_search(conn,
+						'ou=Nothing,' + base, ldap.SCOPE_SUBTREE,
+						'(objectClass=*)'))
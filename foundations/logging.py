@@ -10,8 +10,9 @@ Licensed under the terms of the GNU GPL version 2.
 
 import sys, os, signal, Pyro.errors, traceback
 
-from threading import current_thread
-from types     import *
+from threading    import current_thread, Thread, Event
+from collections  import deque
+from types        import *
 
 # licorn.foundations imports
 import exceptions, styles
@@ -49,6 +50,14 @@ __warningsdb = LicornWarningsDB()
 #: exact same time. Seen on 20101210 with 2 PyroFinders.
 output_lock = RLock()
 
+#: formatted monitor lines, as (facility, level, text) tuples, waiting for
+#: the monitor thread to send them. Bounded: if remote monitors can't keep
+#: up, the oldest lines are dropped, the emitting threads never wait.
+monitor_buffer      = deque(maxlen=4096)
+monitor_wakeup      = Event()
+monitor_thread      = None
+monitor_thread_lock = RLock()
+
 def send_to_listener(message, verbose_level=verbose.QUIET):
 	""" See if current thread has a listener (Remote Pyro object dedicated to
 		inter-process communication), and send the message to it. """
@@ -255,52 +264,101 @@ def exception(*args, **kwargs):
 			#sys.stderr.flush()
 
 	monitor(TRACE_LOGGING, TRACELEVEL_1, '{{E}}{0}', text_message)
+def monitoring(facility, level=TRACELEVEL_1):
+	""" Return ``True`` if at least one monitor listener could want a
+		message of this `facility` and `level`. Lockless; use it to avoid
+		building costly :func:`monitor` arguments for nobody. """
+
+	return bool(facility & options.monitor_mask) \
+				and level <= options.monitor_verbose
 def monitor(facility, level, *args):
 	""" Send a message to all (network-)attached monitoring sessions, if the
-		facility of the message is wanted by the remote monitor. """
+		facility of the message is wanted by the remote monitor.
 
-	with options.monitor_lock:
-		for listener_thread in options.monitor_listeners:
+		When no monitor wants it (the usual case), return immediately,
+		without formatting nor locking anything. Else the message is
+		formatted here and queued; the monitor thread sends it. """
+
+	if not facility & options.monitor_mask or level > options.monitor_verbose:
+		return True
+
+	monitor_buffer.append((facility, level, u'%s %s %s %s\n' % (
+							stylize(ST_YELLOW, '⧎'),
+							stylize(ST_COMMENT,
+								facility.name.ljust(TRACES_MAXWIDTH)),
+							ltrace_time(),
+							args[0].format(*(stylize(*x)
+								if type(x) == TupleType
+								else x
+								for x in args[1:])))))
+	monitor_wakeup.set()
 
-			with listener_thread.monitor_lock:
+	# be compatible with assert calls, if some monitor() calls needs to be
+	# dinamically added/removed from the code.
+	return True
+def start_monitor_thread():
+	""" Start the thread which sends :func:`monitor` messages to their
+		listeners, if not already done. Called when a monitor registers. """
+
+	global monitor_thread
+
+	with monitor_thread_lock:
+		if monitor_thread is None:
+			monitor_thread = Thread(target=__send_monitor_messages,
+											name='MonitorSender')
+			monitor_thread.daemon = True
+			monitor_thread.start()
+def __send_monitor_messages():
+	""" Run forever in the monitor thread: empty the :data:`monitor_buffer`
+		to the listeners which want each message. A listener which fails
+		is disengaged from monitors. """
+
+	while True:
+		monitor_wakeup.wait()
+		monitor_wakeup.clear()
+
+		while True:
+			try:
+				facility, level, text = monitor_buffer.popleft()
+
+			except IndexError:
+				break
+
+			with options.monitor_lock:
+				listeners = options.monitor_listeners[:]
+
+			for listener_thread in listeners:
 				try:
-					if listener_thread.monitor_facilities & facility \
+					with listener_thread.monitor_lock:
+						if listener_thread.monitor_facilities & facility \
 								and listener_thread.listener.verbose >= level:
-						try:
 							listener_thread.listener.process(
-								LicornMessage(
-									u'%s %s %s %s\n' % (
-										stylize(ST_YELLOW, '⧎'),
-										stylize(ST_COMMENT,
-											facility.name.ljust(TRACES_MAXWIDTH)),
-										ltrace_time(),
-										args[0].format(*(stylize(*x)
-											if type(x) == TupleType
-											else x
-											for x in args[1:]))
-										)),
-								options.msgproc.getProxy())
-
-						except AttributeError, e:
-							# we have to remove the thread before issuing the warning,
-							# else it will create a cycle (warning() calls monitor()).
-							options.monitor_listeners.remove(listener_thread)
-							warning(_(u'Thread {0} has no listener '
-								u'anymore, desengaging from monitors '
-								u'(was: {1}).').format(
-									stylize(ST_NAME, listener_thread.name), e))
+								LicornMessage(text), options.msgproc.getProxy())
 
-				except Pyro.errors.ConnectionClosedError, e:
+				except AttributeError, e:
 					# we have to remove the thread before issuing the warning,
 					# else it will create a cycle (warning() calls monitor()).
-					options.monitor_listeners.remove(listener_thread)
+					__disengage_monitor(listener_thread)
+					warning(_(u'Thread {0} has no listener '
+						u'anymore, desengaging from monitors '
+						u'(was: {1}).').format(
+							stylize(ST_NAME, listener_thread.name), e))
+
+				except Pyro.errors.ConnectionClosedError, e:
+					__disengage_monitor(listener_thread)
 					warning(_(u'Thread {0} has lost its remote '
 						u'end, desengaging from monitors (was: {1}).').format(
 							stylize(ST_NAME, listener_thread.name), e))
+def __disengage_monitor(listener_thread):
+	with options.monitor_lock:
+		try:
+			options.monitor_listeners.remove(listener_thread)
 
-	# be compatible with assert calls, if some monitor() calls needs to be
-	# dinamically added/removed from the code.
-	return True
+		except ValueError:
+			# already done, by unregister_monitor() or the cmdlistener.
+			pass
+
+		options.update_monitors()
 def debug(mesg, to_listener=True):
 	"""Display a stylized DEBUG (level1) message on stderr, and publish it to
 		the remote listener if not told otherwise. """
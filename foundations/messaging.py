@@ -160,13 +160,23 @@ class ListenerObject(object):
 			# original verbose_level has been set.
 			for t in enumerate():
 				if hasattr(t, 'listener') and t.listener == listener:
-					found = t
+					# the Pyro handlers hold the session of their client.
+					found = getattr(t, '_licorn_session', t)
 					break
 
+			else:
+				# an idle monitoring client is not served by any thread.
+				for session in options.monitor_listeners:
+					if session.listener == listener:
+						found = session
+						break
+
 		if found:
 			with found.monitor_lock:
 				found.listener.verbose = verbose_level
 
+			options.update_monitors()
+
 	# ========================================= CLI "GET" surrounding functions
 
 	def register_monitor(self, facilities):
@@ -176,7 +186,11 @@ class ListenerObject(object):
 
 		self.setup_listener_gettext()
 
-		t = current_thread()
+		# The Pyro handler serves other clients after this call: the
+		# monitor belongs to the client session, which keeps the listener.
+		t = getattr(current_thread(), '_licorn_session', current_thread())
+
+		t.listener = current_thread().listener
 
 		t.monitor_facilities = ltrace_str_to_int(facilities)
 
@@ -196,6 +210,9 @@ class ListenerObject(object):
 
 		with options.monitor_lock:
 			options.monitor_listeners.append(t)
+			options.update_monitors()
+
+		logging.start_monitor_thread()
 
 		# return the UUID of the thread, so that the remote side
 		# can detach easily when it terminates.
@@ -216,10 +233,12 @@ class ListenerObject(object):
 					options.monitor_listeners.remove(t)
 					break
 
+			options.update_monitors()
+
 		if found:
-			del t.monitor_facilities
-			del t.monitor_uuid
-			del t.monitor_lock
+			# the lock stays: `set_listener_verbose()` still uses it.
+			del found.monitor_facilities
+			del found.monitor_uuid
 
 		else:
 			logging.warning(_(u'Monitor listener with UUID %s not found!') % muuid)
@@ -9,8 +9,9 @@ Licensed under the terms of the GNU GPL version 2
 import sys, os, fcntl, struct, socket, select, platform, re, netifaces
 import icmp, ip, time
 
-from ping      import PingSocket
-from threading import current_thread, Event
+from ping        import PingSocket
+from threading   import current_thread, Event
+from collections import deque
 
 # other foundations imports.
 import logging, process, exceptions, styles, pyutils
@@ -586,6 +587,200 @@ class Pinger:
 		loss = float(sent - recv) / float(sent)
 		return dmin, davg, dmax, sent, recv, loss
 
+class BulkPinger:
+	""" Ping a whole range of addresses concurrently, through one raw socket,
+		instead of one :class:`Pinger` (and one socket) per address.
+
+		Echo requests are sent at most :attr:`rate` per second, while
+		replies are collected in the same loop. Addresses which didn't
+		answer are retried :attr:`retries` times.
+
+		:param addresses: an iterable of IPv4 addresses (strings).
+		:param rate: maximum number of echo requests sent per second.
+		:param time_out: how long to wait for the last replies, after the
+			last request has been sent.
+		:param retries: how many times unanswered addresses are retried.
+
+		.. versionadded:: 1.6.1
+	"""
+	rate     = 500
+	time_out = Pinger.time_out
+	retries  = 1
+
+	def __init__(self, addresses, rate=None, time_out=None, retries=None):
+		with Pinger.ident_lock:
+			# share the identifiers with `Pinger`, to ignore their replies.
+			self.ping_ident = Pinger.ident_counter & 0xffff
+			Pinger.ident_counter += 1
+
+		self.addresses = list(addresses)
+
+		if rate is not None:
+			self.rate = rate
+
+		if time_out is not None:
+			self.time_out = time_out
+
+		if retries is not None:
+			self.retries = retries
+
+		#: address → round-trip time in seconds, or ``None`` if the address
+		#: didn't answer or is unreachable.
+		self.results     = dict.fromkeys(self.addresses)
+		self.unreachable = set()
+	def run(self):
+		""" Ping everything, return :attr:`results`. Needs root privileges
+			(raw socket); raises :class:`socket.error` otherwise. """
+
+		sock = socket.socket(socket.AF_INET, socket.SOCK_RAW,
+									socket.getprotobyname('icmp'))
+		sock.setblocking(0)
+
+		try:
+			for attempt in range(self.retries + 1):
+				to_ping = deque(address for address in self.addresses
+									if self.results[address] is None
+										and address not in self.unreachable)
+
+				if not to_ping:
+					break
+
+				self.__sweep(sock, to_ping, attempt)
+
+		finally:
+			sock.close()
+
+		assert ltrace(TRACE_NETWORK, '| BulkPinger.run(): %d/%d up' % (
+			len([ x for x in self.results.itervalues() if x is not None ]),
+			len(self.results)))
+
+		return self.results
+	def __sweep(self, sock, to_ping, seq):
+		""" Send one echo request to every address of `to_ping`, collecting
+			replies between sends, then wait for the last ones. """
+
+		interval  = 1.0 / self.rate
+		sent      = {}
+		next_send = time.time()
+		last_send = next_send
+
+		while True:
+			now = time.time()
+
+			if to_ping and now >= next_send:
+				address = to_ping.popleft()
+
+				try:
+					sock.sendto(icmp.assemble(icmp.Echo(id=self.ping_ident,
+										seq=seq, data='licorn pinger')),
+								(address, 0))
+
+				except socket.error, e:
+					# EHOSTUNREACH & co: no need to wait for a reply.
+					assert ltrace(TRACE_NETWORK, '  BulkPinger: cannot '
+										'ping %s (was: %s)' % (address, e))
+					self.unreachable.add(address)
+
+				else:
+					sent[address] = now
+
+				last_send = now
+
+				# don't try to catch up if we were late (burst).
+				next_send = max(next_send + interval, now)
+				continue
+
+			if to_ping:
+				deadline = next_send
+
+			else:
+				deadline = last_send + self.time_out
+
+				if now >= deadline:
+					break
+
+			readable, writable, errored = select.select([ sock ], [], [],
+												max(0.0, deadline - now))
+
+			if readable:
+				self.__receive(sock, sent)
+	def __receive(self, sock, sent):
+		""" Read all pending replies. """
+
+		while True:
+			try:
+				pkt, who = sock.recvfrom(4096)
+
+			except socket.error:
+				# EAGAIN: nothing more to read for now.
+				return
+
+			arrival = time.time()
+
+			try:
+				reply = icmp.disassemble(ip.disassemble(pkt).data)
+
+			except ValueError:
+				continue
+
+			try:
+				if reply.get_id() == self.ping_ident and who[0] in sent \
+						and self.results.get(who[0], 0) is None:
+					self.results[who[0]] = arrival - sent[who[0]]
+
+			except AttributeError:
+				# not an echo reply: host (or network) unreachable.
+				try:
+					destination = reply.get_embedded_ip().dst
+
+				except AttributeError:
+					continue
+
+				if destination in self.results:
+					self.unreachable.add(destination)
+#: not defined by the :mod:`socket` module in Python 2.
+SO_PEERCRED = getattr(socket, 'SO_PEERCRED', 17)
+
+def peer_credentials_Linux(sock):
+	""" Return the credentials of the process on the other side of a
+		connected ``AF_UNIX`` socket, as given by the kernel when it
+		connected, as a tuple ``(pid, uid, gid)``. """
+
+	return struct.unpack('3i', sock.getsockopt(socket.SOL_SOCKET,
+									SO_PEERCRED, struct.calcsize('3i')))
+
+peer_credentials = peer_credentials_Linux
+
+def arp_table_Linux():
+	""" Return the complete entries of the kernel ARP cache, as a dict
+		``{ IPv4 address: ether address }``. After a :class:`BulkPinger`
+		sweep on a LAN, it contains every host which answered ARP requests,
+		even those which don't answer pings, but also entries from before
+		the sweep, which can be stale: compare with a table taken before
+		the sweep to tell fresh entries apart. """
+
+	table = {}
+
+	try:
+		with open('/proc/net/arp') as f:
+			# skip the header line.
+			f.readline()
+
+			for line in f:
+				# IP address, HW type, Flags, HW address, Mask, Device
+				fields = line.split()
+
+				# 0x2 is ATF_COM: the entry is complete.
+				if len(fields) > 3 and int(fields[2], 16) & 0x2:
+					table[fields[0]] = fields[3]
+
+	except (IOError, OSError), e:
+		logging.warning2(_(u'Cannot read the ARP cache (was: {0}).').format(e))
+
+	return table
+
+arp_table = arp_table_Linux
+
 # from http://stackoverflow.com/questions/819355/how-can-i-check-if-an-ip-is-in-a-network-in-python
 """
 
@@ -11,7 +11,7 @@ Licorn Foundations - http://dev.licorn.org/documentation/foundations
 	* GNU GPL version 2
 """
 
-import re, math, uuid, functools
+import re, math, uuid, time, ctypes, functools, heapq
 from traceback import print_exc
 
 # WARNING: don't import anything from the core here.
@@ -95,6 +95,65 @@ def next_free(used_list, start, end):
 		return start
 
 	raise exceptions.NoAvaibleIdentifierError()
+class IdAllocator(object):
+	""" Incremental equivalent of :func:`next_free` for the range
+		[`start`, `end`]: :meth:`first_free` returns the same result, but
+		the allocator is told about used and released identifiers as they
+		come and go, instead of sorting and scanning them all every time.
+
+		Identifiers below :attr:`cursor` are all used, except the ones in the
+		:attr:`holes` heap; above it, they are looked up in :attr:`used`
+		only when the cursor moves on. :meth:`use` is O(1), :meth:`release`
+		and :meth:`first_free` are O(log n) (amortized, for the latter).
+
+		:meth:`first_free` does not reserve the identifier: the caller must
+		call :meth:`use` when it is really taken, like :func:`next_free`.
+
+		.. versionadded:: 1.6.1
+	"""
+	def __init__(self, start, end, used=None):
+		self.start  = start
+		self.end    = end
+		self.cursor = start
+		self.holes  = []
+		self.used   = set()
+
+		for ident in used or ():
+			self.use(ident)
+	def __contains__(self, ident):
+		return self.start <= ident <= self.end
+	def use(self, ident):
+		""" Mark `ident` as used; ignored if out of our range. """
+		if self.start <= ident <= self.end:
+			self.used.add(ident)
+	def release(self, ident):
+		""" Mark `ident` as free again; ignored if out of our range. """
+		if self.start <= ident <= self.end and ident in self.used:
+			self.used.remove(ident)
+
+			if ident < self.cursor:
+				heapq.heappush(self.holes, ident)
+	def first_free(self):
+		""" Return the smallest unused identifier of the range, or raise
+			:class:`~licorn.foundations.exceptions.NoAvaibleIdentifierError`. """
+
+		holes = self.holes
+		used  = self.used
+
+		# Holes which have been re-used since their release.
+		while holes and holes[0] in used:
+			heapq.heappop(holes)
+
+		if holes:
+			return holes[0]
+
+		while self.cursor in used:
+			self.cursor += 1
+
+		if self.cursor > self.end:
+			raise exceptions.NoAvaibleIdentifierError()
+
+		return self.cursor
 def list2set(in_list):
 	""" Transform a list to a set (ie remove duplicates). """
 	out_set = []
@@ -194,6 +253,42 @@ def bytes_to_human(bytes, as_string=True, binary=True):
 		return size_str.format(size_val)
 	else:
 		return size_val
+class _timespec(ctypes.Structure):
+	_fields_ = [ ('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long) ]
+
+_clock_gettime = None
+
+# recent glibc have clock_gettime() in the libc, older ones in librt.
+for _library in ('librt.so.1', 'libc.so.6'):
+	try:
+		_clock_gettime = ctypes.CDLL(_library).clock_gettime
+		_clock_gettime.argtypes = [ ctypes.c_int, ctypes.POINTER(_timespec) ]
+		break
+
+	except (OSError, AttributeError):
+		pass
+
+def monotonic():
+	""" Return the current value of the system monotonic clock (in seconds,
+		as a float). Unlike :func:`time.time`, it never goes backwards nor
+		jumps when the system date is changed (NTP, admin…), which makes it
+		the right clock to compute delays and deadlines. Only differences
+		between two values make sense.
+
+		Falls back to :func:`time.time` if ``clock_gettime()`` is not
+		available.
+
+		.. versionadded:: 1.6.1
+	"""
+
+	if _clock_gettime is not None:
+		ts = _timespec()
+
+		# 1 is CLOCK_MONOTONIC on Linux.
+		if _clock_gettime(1, ctypes.byref(ts)) == 0:
+			return ts.tv_sec + ts.tv_nsec * 1e-9
+
+	return time.time()
 def format_time_delta(delta_in_seconds, use_neg=False, long_output=True,
 													big_precision=False):
 	""" build a time-related human readable string from a time given in seconds.
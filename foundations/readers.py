@@ -169,6 +169,18 @@ def ug_conf_load_list(filename):
 		/etc/licorn/group{s}.
 	"""
 	return map(lambda x: x[:-1].split(":"), open(filename , "r"))
+def ug_conf_load_dict(filename):
+	""" Read a configuration file and return a dict of first field -> list
+		of values, built in one pass. This is meant for lookups by login or
+		group name, where scanning the list returned by
+		:func:`ug_conf_load_list` for every entry would be quadratic.
+
+		Typical use case: /etc/shadow, /etc/gshadow, /etc/licorn/group.
+
+		.. versionadded:: 1.6.1
+	"""
+	return dict((entry[0], entry) for entry in
+				(line[:-1].split(":") for line in open(filename , "r")))
 def	dnsmasq_read_conf(filename=None, data=None, convert='semi'):
 	""" Read a dnsmasq.conf file into a dict, using these conversion patterns:
 
@@ -8,8 +8,11 @@ Licorn® foundations - workers
 :license: GNU GPL version 2
 """
 
-from threading import current_thread
-from Queue     import Empty, Queue, PriorityQueue
+import time
+
+from threading   import current_thread, Condition, Lock
+from Queue       import Empty, Queue, PriorityQueue
+from collections import deque
 
 # licorn.foundations imports
 from base      import ObjectSingleton
@@ -20,13 +23,208 @@ from constants import priorities
 # FIXME: this should move elsewhere someday.
 from licorn.daemon.threads import ServiceWorkerThread, \
 									ACLCkeckerThread, \
-									NetworkWorkerThread
+									NetworkWorkerThread, \
+									timer_service
+
+class PriorityJobQueue(object):
+	""" A drop-in replacement for :class:`Queue.PriorityQueue` for the
+		``(priority, func, args, kwargs)`` jobs of the worker threads:
+
+		* jobs are kept in one FIFO per priority; the lowest value is served
+		  first, and jobs of the same priority are served in order (which
+		  the heap-based :class:`~Queue.PriorityQueue` doesn't guarantee);
+		* no more than :attr:`capacity` jobs with a priority lower than
+		  ``HIGH`` can run at the same time, the remaining workers are
+		  reserved for ``HIGH`` jobs (and stop packets). ``None`` means no
+		  reservation;
+		* jobs with a ``job_delay`` keyword argument are put aside until
+		  their delay expires (by the
+		  :func:`~licorn.daemon.threads.timer_service`), instead of sleeping
+		  in a worker;
+		* a :meth:`put` while no worker is waiting for a job notifies
+		  :attr:`pressure`, which the workers scheduler waits on;
+		* the time spent by the jobs in the queue is recorded in per-priority
+		  histograms (see :attr:`latency_buckets` and :meth:`latencies`).
+
+		:meth:`task_done` must be called by the thread which called
+		:meth:`get`, this is how running jobs are accounted.
+	"""
+
+	#: upper bounds (in seconds) of the latency histograms buckets. The
+	#: last bucket counts the jobs which waited more than the last bound.
+	latency_buckets = (0.001, 0.01, 0.1, 1.0, 10.0)
+
+	def __init__(self, capacity=None):
+		self.capacity = capacity
+
+		self.mutex          = Lock()
+		self.not_empty      = Condition(self.mutex)
+		self.all_tasks_done = Condition(self.mutex)
+		self.pressure       = Condition(self.mutex)
+
+		self.unfinished_tasks = 0
+
+		self.__queues     = {}
+		self.__qsize      = 0
+		self.__waiting    = 0
+		self.__running    = {}
+		self.__restricted = 0
+		self.__latencies  = {}
+	def __pick(self):
+		""" Return the priority of the next job we can serve, or ``None``.
+			Must be called with :attr:`mutex` held. """
+
+		for priority in sorted(self.__queues):
+			if not self.__queues[priority]:
+				continue
+
+			if priority > priorities.HIGH and self.capacity is not None \
+							and self.__restricted >= self.capacity:
+				# the next ones are even lower.
+				return None
+
+			return priority
+
+		return None
+	def put(self, item, block=True, timeout=None):
+		""" Queue a job. `block` and `timeout` are ignored (the queue is
+			unbounded), they exist for :class:`Queue.Queue` compatibility. """
+
+		with self.mutex:
+			self.unfinished_tasks += 1
+
+		try:
+			delay = item[3].pop('job_delay', 0.0)
+
+		except (IndexError, AttributeError, TypeError):
+			delay = 0.0
+
+		if delay > 0:
+			timer_service().schedule(delay, self.__put, item)
+
+		else:
+			self.__put(item)
+	put_nowait = put
+	def __put(self, item):
+		with self.mutex:
+			self.__queues.setdefault(item[0], deque()).append(
+														(time.time(), item))
+			self.__qsize += 1
+
+			self.not_empty.notify()
+
+			if not self.__waiting:
+				# no idle worker to take the job.
+				self.pressure.notify_all()
+	def get(self, block=True, timeout=None):
+		with self.mutex:
+			if timeout is not None:
+				end = time.time() + timeout
+
+			while True:
+				priority = self.__pick()
+
+				if priority is not None:
+					break
+
+				if not block:
+					raise Empty
+
+				self.__waiting += 1
+
+				try:
+					if timeout is None:
+						self.not_empty.wait()
+
+					else:
+						remaining = end - time.time()
+
+						if remaining <= 0:
+							raise Empty
+
+						self.not_empty.wait(remaining)
+
+				finally:
+					self.__waiting -= 1
+
+			queued_time, item = self.__queues[priority].popleft()
+			self.__qsize -= 1
+
+			if priority > priorities.HIGH:
+				self.__restricted += 1
+
+			self.__running[current_thread().ident] = priority
+
+			waited = time.time() - queued_time
+
+			try:
+				buckets = self.__latencies[priority]
+
+			except KeyError:
+				buckets = self.__latencies[priority] = [ 0 ] * (
+											len(self.latency_buckets) + 1)
+
+			for index, bound in enumerate(self.latency_buckets):
+				if waited < bound:
+					buckets[index] += 1
+					break
+			else:
+				buckets[-1] += 1
+
+			return item
+	def get_nowait(self):
+		return self.get(False)
+	def task_done(self):
+		with self.mutex:
+			priority = self.__running.pop(current_thread().ident, None)
+
+			if priority is not None and priority > priorities.HIGH:
+				self.__restricted -= 1
+
+				# a job held back by the capacity could now run.
+				self.not_empty.notify()
+
+			unfinished = self.unfinished_tasks - 1
+
+			if unfinished <= 0:
+				if unfinished < 0:
+					raise ValueError('task_done() called too many times')
+
+				self.all_tasks_done.notify_all()
+
+			self.unfinished_tasks = unfinished
+	def join(self):
+		with self.mutex:
+			while self.unfinished_tasks:
+				self.all_tasks_done.wait()
+	def qsize(self, priority=None):
+		""" Number of jobs waiting (for a given priority or all). Delayed
+			jobs don't count until their delay expires. """
+		with self.mutex:
+			if priority is None:
+				return self.__qsize
+
+			return len(self.__queues.get(priority, ()))
+	def empty(self):
+		return self.qsize() == 0
+	def full(self):
+		return False
+	def wait_for_pressure(self, timeout):
+		""" Block until a job is queued, or `timeout` seconds elapsed. """
+		with self.mutex:
+			self.pressure.wait(timeout)
+	def latencies(self):
+		""" Return a copy of the histograms, as a dict
+			``{ priority: [ count, … ] }`` (see :attr:`latency_buckets`). """
+		with self.mutex:
+			return dict((priority, buckets[:])
+							for priority, buckets in self.__latencies.iteritems())
 
 class WorkerService(ObjectSingleton):
 	def __init__(self):
-		self.serviceQ  = PriorityQueue()
-		self.networkQ  = PriorityQueue()
-		self.aclcheckQ = PriorityQueue()
+		self.serviceQ  = PriorityJobQueue()
+		self.networkQ  = PriorityJobQueue()
+		self.aclcheckQ = PriorityJobQueue()
 
 		self.queues = {
 				'service' : self.serviceQ,
@@ -99,4 +297,4 @@ class WorkerService(ObjectSingleton):
 
 workers = WorkerService()
 
-__all__ = ('workers', )
+__all__ = ('workers', 'PriorityJobQueue')
@@ -367,6 +367,12 @@ def common_filter_group(app, parser, tool, mode):
 			action="store_true", dest="extinction", default=False,
 			help=_(u"Only select 'extinction' tasks"))
 
+		filtergroup.add_option('--within', '--next',
+			action="store", type="int", dest="within", default=None,
+			help=_(u"Only select tasks which will run in the given number of "
+				u"seconds (e.g. 3600 for the next hour). Default: %s.") %
+					stylize(ST_DEFAULT, _(u'no time limit')))
+
 	return filtergroup
 def check_opts_and_args(opts_and_args):
 
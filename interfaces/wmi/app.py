@@ -74,6 +74,14 @@ class WmiEventCollectorThread(LicornThread, MessageProcessor):
 		assert ltrace_func(TRACE_WMI)
 
 		self.dispatch_message(event)
+	def process_events(self, events_batch, *a, **kw):
+		""" Same as :meth:`process_event`, for a batch of events sent by
+			the licornd :class:`~licorn.foundations.events.CollectorDispatcher`
+			in only one call. """
+		assert ltrace_func(TRACE_WMI)
+
+		for event in events_batch:
+			self.dispatch_message(event)
 	# ========================================= WmiEventCollectorThread Methods
 	def resync(self, signum=None, frameno=None):
 		""" Put a special item in the queue, forcing the thread to reconnect
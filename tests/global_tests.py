@@ -133,6 +133,20 @@ def test_find_new_indentifier(testsuite):
 
 	assert(pyutils.next_free([1,2], 1, 30) == 3)
 	assert(pyutils.next_free([1,2,4,5], 3, 5) == 3)
+
+	allocator = pyutils.IdAllocator(1, 30, [5,6,48,2,1,4])
+	assert(allocator.first_free() == 3)
+	allocator.use(3)
+	assert(allocator.first_free() == 7)
+	allocator.release(2)
+	assert(allocator.first_free() == 2)
+
+	try:
+		pyutils.IdAllocator(1, 2, [1,2]).first_free()
+	except:
+		assert(True) # good behaviour
+	else:
+		assert(False)
 def test_regexes(testsuite):
 	""" Try funky strings to make regexes fail (they should not)."""
 
@@ -274,6 +288,27 @@ def test_groups(context, testsuite):
 			'''make permissive.''',
 		context=context, clean_num=1))
 
+	gname = 'ACL_regid'
+
+	def chk_numeric_acls_cmds(group):
+		return [ 'getfacl', '-n', '%s/%s' % (groups_base_path, group) ]
+
+	# the ACLs compiled for the first group must not be applied with its
+	# old GID once it is re-created with another one.
+	testsuite.add_scenario(ScenarioTest([
+		ADD + [ 'group', gname, '--gid=30100', '-v' ],
+		chk_numeric_acls_cmds(gname),
+		DEL + [ 'group', gname, '--no-archive' ],
+		ADD + [ 'group', gname, '--gid=30101', '-v' ],
+		chk_numeric_acls_cmds(gname),
+		CHK + [ 'group', gname, '-vb' ],
+		chk_numeric_acls_cmds(gname),
+		DEL + [ 'group', gname, '--no-archive' ],
+		],
+		descr='''delete a group then re-create it with another GID, and '''
+			'''verify the ACLs hold the new one.''',
+		context=context, clean_num=1))
+
 	gname = 'SYSTEM-test1'
 
 	testsuite.add_scenario(ScenarioTest([
@@ -1045,6 +1080,30 @@ def test_users(context, testsuite):
 		],
 		context=context,
 		descr='''verify #383 implementation (fixes #384).''', clean_num=1))
+
+	uname = 'ushadowflush'
+	gname = 'gshadowflush'
+
+	testsuite.add_scenario(ScenarioTest([
+		ADD + [ 'user', '%s1' % uname ],
+		ADD + [ 'group', gname ],
+		# both users and groups rewrites are pending…
+		MOD + [ 'user', '%s1' % uname, '--gecos=Pending Rewrite' ],
+		MOD + [ 'group', gname, '--add-users=%s1' % uname ],
+		# …then the users ones are flushed by a creation: the groups one
+		# must still happen at the end of the window.
+		ADD + [ 'user', '%s2' % uname ],
+		[ 'sleep', '2' ],
+		[ 'grep', '^%s:.*%s1' % (gname, uname), '/etc/group' ],
+		[ 'grep', '^%s1:[^:]*:[^:]*:[^:]*:Pending Rewrite:' % uname,
+			'/etc/passwd' ],
+		DEL + [ 'group', gname, '--no-archive' ],
+		DEL + [ 'users', '%s1,%s2' % (uname, uname), '--no-archive' ],
+		],
+		context=context,
+		descr='''shadow backend: a partial flush must not cancel the '''
+			'''pending rewrite of the other files.''', clean_num=2))
+
 def test_imports(context, testsuite):
 
 	uname = 'uprofile1'
@@ -1087,6 +1146,24 @@ def test_imports(context, testsuite):
 		],
 		context=context,
 		descr='''various test on user import''', clean_num=2))
+
+	gname = 'gimport18'
+
+	testsuite.add_scenario(ScenarioTest([
+		ADD + [ 'group', gname, '-v' ],
+		# should fail: Bob can't be a member and a responsible of the same
+		# group. No account is created, and gimport18new is deleted.
+		ADD + [ 'users', '--filename=data/tests_users_conflict.csv',
+			'--lastname-column=1', '--firstname-column=0',
+			'--group-column=2', '--password-column=3',
+			'--confirm-import', '-v' ],
+		GET + [ 'users' ],
+		GET + [ 'groups' ],
+		DEL + [ 'group', gname, '--no-archive', '-v' ],
+		],
+		context=context,
+		descr='''user import with conflicting memberships creates nothing, '''
+			'''and deletes the groups it created''', clean_num=1))
 def test_profiles(context, testsuite):
 	"""Test the applying feature of profiles."""
 